@@ -0,0 +1,174 @@
+"""
+Times collecting and rendering a synthetic repository on a simulated slow
+filesystem, where every ``scandir``, ``stat``, ``open`` and ``read`` of the
+repository sleeps for ``--latency-ms``, serially, with scan worker threads
+and with the asyncio pipeline. Checks that every mode writes the same bytes.
+
+    PYTHONPATH=src python benchmarks/bench_async_io.py --latency-ms 2
+"""
+
+import argparse
+import asyncio
+import builtins
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from repo2md import (
+    AsyncCollector,
+    Collector,
+    NodeTreeSplitter,
+    render_chunks,
+    render_chunks_async,
+)
+
+
+class SlowFile:
+    def __init__(self, file, latency):
+        self.file = file
+        self.latency = latency
+
+    def read(self, *args):
+        time.sleep(self.latency)
+        return self.file.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+
+class SlowEntry:
+    def __init__(self, entry, latency):
+        self.entry = entry
+        self.latency = latency
+
+    def stat(self, *args, **kwargs):
+        time.sleep(self.latency)
+        return self.entry.stat(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.entry, name)
+
+
+class SlowScandir:
+    def __init__(self, iterator, latency):
+        self.iterator = iterator
+        self.latency = latency
+
+    def __iter__(self):
+        return (SlowEntry(entry, self.latency) for entry in self.iterator)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.iterator.close()
+
+
+@contextmanager
+def slow_filesystem(repo, latency):
+    """Adds latency to the filesystem calls made below repo."""
+    real_open, real_scandir = builtins.open, os.scandir
+
+    def slow_open(path, *args, **kwargs):
+        file = real_open(path, *args, **kwargs)
+        if not str(path).startswith(repo):
+            return file
+        time.sleep(latency)
+        return SlowFile(file, latency)
+
+    def slow_scandir(path="."):
+        time.sleep(latency)
+        return SlowScandir(real_scandir(path), latency)
+
+    builtins.open, os.scandir = slow_open, slow_scandir
+    try:
+        yield
+    finally:
+        builtins.open, os.scandir = real_open, real_scandir
+
+
+def write_repo(repo, dirs, files_per_dir, file_kb):
+    block = b"x = 1\n" * (file_kb * 1024 // 6)
+    for index in range(dirs):
+        directory = os.path.join(repo, f"pkg{index // 10}", f"mod{index}")
+        os.makedirs(directory)
+        for file_index in range(files_per_dir):
+            path = os.path.join(directory, f"f{file_index}.py")
+            with open(path, "wb") as file:
+                file.write(block)
+
+
+def digest(paths):
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            sha.update(file.read())
+    return sha.hexdigest()
+
+
+def run(label, collector, render, repo, output_dir):
+    start = time.perf_counter()
+    node = collector.build_node_tree()
+    scanned = time.perf_counter()
+    nodes = NodeTreeSplitter(node, 4 * 1024 * 1024, 1000).split()
+    os.makedirs(output_dir)
+    paths = render(enumerate(nodes), output_dir, repo)
+    rendered = time.perf_counter()
+    print(
+        f"{label:<16} scan {scanned - start:7.2f}s  "
+        f"render {rendered - scanned:7.2f}s"
+    )
+    return digest(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dirs", type=int, default=100)
+    parser.add_argument("--files-per-dir", type=int, default=10)
+    parser.add_argument("--file-kb", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo = os.path.join(tmp_dir, "repo")
+        write_repo(repo, args.dirs, args.files_per_dir, args.file_kb)
+        files = args.dirs * args.files_per_dir
+        print(f"{files} files, {args.latency_ms:g} ms per call")
+
+        concurrency = args.concurrency
+        modes = [
+            ("serial", Collector(repo), render_chunks),
+            (
+                f"scan_workers {concurrency}",
+                Collector(repo, scan_workers=concurrency),
+                render_chunks,
+            ),
+            (
+                f"async-io {concurrency}",
+                AsyncCollector(repo, concurrency),
+                lambda chunks, output_dir, source: asyncio.run(
+                    render_chunks_async(
+                        chunks, output_dir, source, concurrency=concurrency
+                    )
+                ),
+            ),
+        ]
+        digests = set()
+        with slow_filesystem(repo, args.latency_ms / 1000):
+            for index, (label, collector, render) in enumerate(modes):
+                output_dir = os.path.join(tmp_dir, f"out-{index}")
+                digests.add(run(label, collector, render, repo, output_dir))
+        print("identical output" if len(digests) == 1 else "OUTPUT DIFFERS")
+
+
+if __name__ == "__main__":
+    main()
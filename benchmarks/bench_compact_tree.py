@@ -0,0 +1,129 @@
+"""
+Compares the memory used by a synthetic tree of ``Node`` objects with the
+same tree stored in a ``CompactTree``.
+
+    PYTHONPATH=src python benchmarks/bench_compact_tree.py --files 1000000
+"""
+
+import argparse
+import os
+import random
+import time
+import tracemalloc
+
+from repo2md import CompactTree, Node, NodeType
+
+EXTENSIONS = [".py", ".js", ".rs", ".md", ".json", ".ts", ".txt"]
+
+
+def synthetic_layout(num_files, files_per_dir, fanout, seed):
+    """
+    Yields ``(name, is_file, size)`` events of a depth-first walk of a
+    deterministic, balanced tree, with ``None`` closing each directory.
+    Directory ``k`` has children ``k * fanout + 1 ... k * fanout + fanout``.
+    """
+    rng = random.Random(seed)
+    num_dirs = -(-num_files // files_per_dir)
+
+    def walk(dir_index):
+        first = dir_index * files_per_dir
+        for index in range(first, min(first + files_per_dir, num_files)):
+            name = f"file_{index}{rng.choice(EXTENSIONS)}"
+            yield name, True, rng.randint(100, 20_000)
+        first_child = dir_index * fanout + 1
+        for child in range(first_child, first_child + fanout):
+            if child >= num_dirs:
+                break
+            yield f"dir_{child}", False, 0
+            yield from walk(child)
+            yield None
+
+    yield ".", False, 0
+    yield from walk(0)
+    yield None
+
+
+def build_nodes(events):
+    stack = []
+    root = None
+    for event in events:
+        if event is None:
+            node = stack.pop()
+            if stack:
+                stack[-1].size += node.size
+                stack[-1].dir_count += 1
+            continue
+        name, is_file, size = event
+        if not stack:
+            root = Node(path=name, type=NodeType.DIR)
+            stack.append(root)
+        elif is_file:
+            parent = stack[-1]
+            path = os.path.join(parent.path, name)
+            parent.add_child(Node(path=path, type=NodeType.FILE, size=size))
+            parent.size += size
+            parent.file_count += 1
+        else:
+            parent = stack[-1]
+            path = os.path.join(parent.path, name)
+            stack.append(parent.add_child(Node(path=path)))
+    return root
+
+
+def build_compact(events):
+    tree = CompactTree()
+    stack = []
+    for event in events:
+        if event is None:
+            tree.finish_dir(stack.pop())
+            continue
+        name, is_file, size = event
+        if is_file:
+            tree.add_file(name, stack[-1], size)
+        else:
+            stack.append(tree.add_dir(name, stack[-1] if stack else -1))
+    tree.compact()
+    return tree.root()
+
+
+def measure(build, args):
+    events = synthetic_layout(
+        args.files, args.files_per_dir, args.fanout, args.seed
+    )
+    tracemalloc.start()
+    start = time.perf_counter()
+    root = build(events)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = sum(1 for _ in root.iter_files())
+    return root, current, elapsed, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=1_000_000)
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {}
+    for label, build in [
+        ("Node", build_nodes),
+        ("CompactTree", build_compact),
+    ]:
+        root, memory, elapsed, total = measure(build, args)
+        results[label] = memory
+        print(
+            f"{label:<12} {total:>9} files  {elapsed:6.2f}s  "
+            f"{memory / 1024 / 1024:9.1f} MB  "
+            f"{memory / total:7.1f} B/file  size={root.size}"
+        )
+        del root
+
+    print(f"reduction:   {results['Node'] / results['CompactTree']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
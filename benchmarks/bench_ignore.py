@@ -0,0 +1,105 @@
+"""
+Compares ignore matching through ``pathspec`` on absolute paths (the
+previous ``Collector.matches_ignore_pattern``) with ``IgnoreMatcher`` on
+root-relative paths with subtree pruning.
+
+    PYTHONPATH=src python benchmarks/bench_ignore.py --files 200000
+"""
+
+import argparse
+import os
+import random
+import time
+
+import pathspec
+
+from repo2md.ignore import DEFAULT_PATTERNS, IgnoreMatcher
+
+PATTERNS = DEFAULT_PATTERNS + [
+    "__pycache__/",
+    "*.py[cod]",
+    "*.log",
+    "*.so",
+    "node_modules/",
+    "target/",
+    "build/",
+    "dist/",
+    ".venv/",
+    "Cargo.lock",
+    "/docs/_build/",
+    "*.egg-info/",
+    "coverage.xml",
+    ".coverage.*",
+]
+EXTENSIONS = [".py", ".js", ".rs", ".md", ".log", ".pyc", ".json", ".ts"]
+DIR_NAMES = ["src", "lib", "pkg", "app", "core", "util", "api", "web"]
+HEAVY_DIRS = ["node_modules", "target"]
+
+
+def build_tree(num_files, rng):
+    """
+    Builds an in-memory tree of ``(dirs, files)`` tuples where about half
+    of the files live below ``node_modules``/``target`` directories.
+    """
+    root = ({}, [])
+    for index in range(num_files):
+        node = root
+        depth = rng.randint(0, 5)
+        parts = [rng.choice(DIR_NAMES) for _ in range(depth)]
+        if index % 2:
+            parts.insert(rng.randint(0, len(parts)), rng.choice(HEAVY_DIRS))
+        for part in parts:
+            node = node[0].setdefault(part, ({}, []))
+        node[1].append(f"file{index}{rng.choice(EXTENSIONS)}")
+    return root
+
+
+def walk_pathspec(spec, node, abs_dir):
+    kept = 0
+    for name, child in node[0].items():
+        kept += walk_pathspec(spec, child, f"{abs_dir}/{name}")
+    for name in node[1]:
+        if not spec.match_file(f"{abs_dir}/{name}"):
+            kept += 1
+    return kept
+
+
+def walk_matcher(matcher, node, prefix):
+    kept = 0
+    for name, child in node[0].items():
+        if not matcher.match_entry(prefix + name, True):
+            kept += walk_matcher(matcher, child, f"{prefix}{name}/")
+    for name in node[1]:
+        if not matcher.match_entry(prefix + name):
+            kept += 1
+    return kept
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tree = build_tree(args.files, random.Random(args.seed))
+    spec = pathspec.GitIgnoreSpec.from_lines(PATTERNS)
+    matcher = IgnoreMatcher()
+    matcher.add_patterns("", PATTERNS)
+
+    kept_spec, spec_time = timed(walk_pathspec, spec, tree, os.getcwd())
+    kept_matcher, matcher_time = timed(walk_matcher, matcher, tree, "")
+
+    print(f"files:            {args.files}")
+    print(f"pathspec:         {spec_time:.3f}s ({kept_spec} kept)")
+    print(f"IgnoreMatcher:    {matcher_time:.3f}s ({kept_matcher} kept)")
+    print(f"speedup:          {spec_time / matcher_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
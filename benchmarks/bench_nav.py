@@ -0,0 +1,77 @@
+"""
+Times computing the PREV/NEXT links of a flat directory, comparing the
+previous ``file_children.index`` lookup with ``iter_navigation`` in both
+navigation modes. The lookup is quadratic, so it only runs up to
+``--legacy-max`` files.
+
+    PYTHONPATH=src python benchmarks/bench_nav.py --files 10000 100000
+"""
+
+import argparse
+import io
+import os
+import time
+
+from repo2md import Node, NodeType, emit
+from repo2md.render import iter_navigation
+
+
+def flat_directory(num_files):
+    root = Node(path=".")
+    for index in range(num_files):
+        path = os.path.join("generated", f"module_{index}.py")
+        root.add_child(Node(path=path, type=NodeType.FILE, size=100))
+    return root
+
+
+def indexed_links(node, output):
+    """The navigation of ``descend`` as it was before."""
+    total_files = len(node.file_children)
+    for file_node in node.file_children:
+        index = node.file_children.index(file_node)
+        output.write(
+            emit.navigation_links(
+                emit.directory_anchor(index - 1) if index > 0 else None,
+                emit.directory_anchor(index + 1)
+                if index < total_files - 1
+                else None,
+            )
+        )
+
+
+def traversal_links(nav):
+    def write(node, output):
+        for _, prev_anchor, next_anchor in iter_navigation(node, nav):
+            output.write(emit.navigation_links(prev_anchor, next_anchor))
+
+    return write
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--files", type=int, nargs="+", default=[10_000, 100_000]
+    )
+    parser.add_argument("--legacy-max", type=int, default=20_000)
+    args = parser.parse_args()
+
+    for num_files in args.files:
+        root = flat_directory(num_files)
+        results = []
+        for name, write in [
+            ("index", indexed_links),
+            ("directory", traversal_links(emit.Navigation.DIRECTORY)),
+            ("global", traversal_links(emit.Navigation.GLOBAL)),
+        ]:
+            if name == "index" and num_files > args.legacy_max:
+                results.append(f"{name} skipped")
+                continue
+            start = time.perf_counter()
+            write(root, io.BytesIO())
+            elapsed = time.perf_counter() - start
+            results.append(f"{name} {elapsed:7.3f}s")
+        print(f"{num_files:>8} files  " + "  ".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Compares the greedy NodeTreeSplitter with PackingNodeTreeSplitter on a
+synthetic tree: number of chunks, mean fill ratio and splitting time.
+
+    PYTHONPATH=src python benchmarks/bench_pack.py --files 300000
+"""
+
+import argparse
+import random
+import time
+
+from bench_compact_tree import build_compact, synthetic_layout
+
+from repo2md import NodeTreeSplitter, PackingNodeTreeSplitter
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=300_000)
+    parser.add_argument("--files-per-dir", type=int, default=40)
+    parser.add_argument("--fanout", type=int, default=6)
+    parser.add_argument("--max-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument(
+        "--large-every",
+        type=int,
+        default=500,
+        help="Make every Nth file between 1/4 and 2/3 of --max-size.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    low, high = args.max_size // 4, args.max_size * 2 // 3
+
+    def with_large_files(events):
+        for index, event in enumerate(events):
+            if event and event[1] and index % args.large_every == 0:
+                event = (event[0], True, rng.randint(low, high))
+            yield event
+
+    root = build_compact(
+        with_large_files(
+            synthetic_layout(
+                args.files, args.files_per_dir, args.fanout, args.seed
+            )
+        )
+    )
+    print(f"files: {args.files}  total size: {root.size / 2**20:.0f} MB")
+
+    for splitter_class in [NodeTreeSplitter, PackingNodeTreeSplitter]:
+        splitter = splitter_class(root, args.max_size, 1_000_000)
+        start = time.perf_counter()
+        output_nodes = splitter.split()
+        elapsed = time.perf_counter() - start
+        ratios = splitter.fill_ratios()
+        print(
+            f"{splitter_class.__name__:<24} {len(output_nodes):>5} chunks  "
+            f"mean fill {sum(ratios) / len(ratios):6.1%}  "
+            f"min fill {min(ratios):6.1%}  {elapsed:6.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures peak memory of ``render_markdown`` for a single large input file
+at several sizes. Each size runs in a fresh interpreter so the reported
+peak RSS is not inherited from a previous run; with streaming rendering
+the peak stays flat as the input grows.
+
+    PYTHONPATH=src python benchmarks/bench_render_memory.py --sizes 16 64 256
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from repo2md import Collector, render_markdown
+
+LINE = b"x = 'the quick brown fox jumps over the lazy dog'  # padding\n"
+
+
+def write_file(path, size_mb):
+    block = LINE * (1024 * 1024 // len(LINE))
+    with open(path, "wb") as file:
+        for _ in range(size_mb):
+            file.write(block)
+
+
+def child(size_mb):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo = os.path.join(tmp_dir, "repo")
+        os.makedirs(repo)
+        write_file(os.path.join(repo, "generated.py"), size_mb)
+        node = Collector(repo).build_node_tree()
+
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        start = time.perf_counter()
+        render_markdown(node, tmp_dir, 0, repo)
+        elapsed = time.perf_counter() - start
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(
+        f"{size_mb:>6} MB input  {elapsed:6.2f}s  "
+        f"python peak {traced_peak / 1024 / 1024:7.2f} MB  "
+        f"rss growth {(peak - baseline) / 1024:7.2f} MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    for size_mb in args.sizes:
+        subprocess.run(
+            [sys.executable, __file__, "--child", str(size_mb)], check=True
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Times rendering the chunks of a synthetic repository serially and with a
+pool of worker processes, and checks that every job count produces the same
+bytes.
+
+    PYTHONPATH=src python benchmarks/bench_render_parallel.py --chunks 20
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from repo2md import Collector, NodeTreeSplitter, render_chunks
+
+LINE = b"x = 'the quick brown fox jumps over the lazy dog'  # padding\n"
+
+
+def write_repo(repo, chunks, chunk_mb, files_per_chunk):
+    block = LINE * (chunk_mb * 1024 * 1024 // files_per_chunk // len(LINE))
+    for chunk in range(chunks):
+        directory = os.path.join(repo, f"pkg{chunk:03}")
+        os.makedirs(directory)
+        for index in range(files_per_chunk):
+            with open(os.path.join(directory, f"m{index}.py"), "wb") as file:
+                file.write(block)
+
+
+def digest(paths):
+    sha = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--chunk-mb", type=int, default=32)
+    parser.add_argument("--files-per-chunk", type=int, default=16)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo = os.path.join(tmp_dir, "repo")
+        write_repo(repo, args.chunks, args.chunk_mb, args.files_per_chunk)
+        node = Collector(repo).build_node_tree()
+        max_size = (args.chunk_mb + 1) * 1024 * 1024
+        nodes = NodeTreeSplitter(node, max_size, args.chunks * 2).split()
+        print(f"{len(nodes)} chunks, {node.size / 1024 / 1024:.0f} MB")
+
+        digests = set()
+        for jobs in args.jobs:
+            output_dir = os.path.join(tmp_dir, f"out-{jobs}")
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            paths = render_chunks(enumerate(nodes), output_dir, repo, jobs)
+            elapsed = time.perf_counter() - start
+            digests.add(digest(paths))
+            print(f"jobs {jobs:>3}  {elapsed:7.2f}s")
+        print("identical output" if len(digests) == 1 else "OUTPUT DIFFERS")
+
+
+if __name__ == "__main__":
+    main()
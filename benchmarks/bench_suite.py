@@ -0,0 +1,212 @@
+"""
+Times each stage of repo2md on a deterministic synthetic repository:
+collecting the tree, splitting it and rendering the Markdown files. Reports
+wall time, throughput and peak traced memory per stage, and writes them as
+JSON so that runs of different versions can be compared.
+
+    PYTHONPATH=src python benchmarks/bench_suite.py --files 20000 \\
+        --output results.json
+    PYTHONPATH=src python benchmarks/bench_suite.py --files 20000 \\
+        --compare results.json
+
+Timings are the median of ``--repeat`` runs without tracing; memory comes
+from one further run under tracemalloc, which is slower.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from synthetic_repo import add_arguments, generate_repo
+
+import repo2md
+from repo2md import (
+    Collector,
+    ContentClass,
+    ContentPolicy,
+    NodeTreeSplitter,
+    render_markdown,
+)
+
+CONTENT_POLICIES = {
+    ContentClass.BINARY: ContentPolicy.SUMMARIZE,
+    ContentClass.HUGE: ContentPolicy.TRUNCATE,
+}
+
+
+def collect(repo, args):
+    collector = Collector(repo, args.scan_workers, CONTENT_POLICIES)
+    return collector.build_node_tree()
+
+
+def split(root, args):
+    nodes = NodeTreeSplitter(root, args.max_size, args.max_files).split()
+    if nodes is None:
+        sys.exit("The repository exceeds --max-size and --max-files.")
+    return nodes
+
+
+def render(nodes, repo, output_dir):
+    return [
+        render_markdown(node, output_dir, index, repo)
+        for index, node in enumerate(nodes)
+    ]
+
+
+def run_stages(repo, output_dir, args, trace):
+    """Runs every stage once, returning its seconds and peak memory."""
+    results = {}
+
+    def stage(name, func, *func_args):
+        if trace:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        value = func(*func_args)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+        results[name] = (seconds, peak)
+        return value
+
+    root = stage("collect", collect, repo, args)
+    nodes = stage("split", split, root, args)
+    paths = stage("render", render, nodes, repo, output_dir)
+    output_bytes = sum(os.path.getsize(path) for path in paths)
+    return results, root, len(nodes), output_bytes
+
+
+def measure(repo, output_dir, args):
+    timings = {name: [] for name in ["collect", "split", "render"]}
+    for _ in range(args.repeat):
+        results, root, chunks, output_bytes = run_stages(
+            repo, output_dir, args, trace=False
+        )
+        for name, (seconds, _) in results.items():
+            timings[name].append(seconds)
+
+    tracemalloc.start()
+    traced, _, _, _ = run_stages(repo, output_dir, args, trace=True)
+    tracemalloc.stop()
+
+    files = sum(1 for _ in root.iter_files())
+    stage_bytes = {
+        "collect": root.size,
+        "split": root.size,
+        "render": output_bytes,
+    }
+    stages = {}
+    for name, samples in timings.items():
+        seconds = statistics.median(samples)
+        stages[name] = {
+            "seconds": seconds,
+            "samples": samples,
+            "files_per_s": files / seconds if seconds else None,
+            "mb_per_s": stage_bytes[name] / 2**20 / seconds
+            if seconds
+            else None,
+            "peak_traced_mb": traced[name][1] / 2**20,
+        }
+    return {
+        "files": files,
+        "input_bytes": root.size,
+        "chunks": chunks,
+        "output_bytes": output_bytes,
+        "max_rss_mb": max_rss_mb(),
+        "stages": stages,
+    }
+
+
+def source_commit():
+    """Returns the git commit of the benchmarked checkout, if any."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rss / 2**20 if sys.platform == "darwin" else rss / 1024
+
+
+def print_results(results, baseline=None):
+    print(
+        f"{results['files']} files, "
+        f"{results['input_bytes'] / 2**20:.1f} MB in, "
+        f"{results['chunks']} chunks, "
+        f"{results['output_bytes'] / 2**20:.1f} MB out, "
+        f"max RSS {results['max_rss_mb']:.0f} MB"
+    )
+    for name, stage in results["stages"].items():
+        line = (
+            f"{name:<8} {stage['seconds']:8.3f}s "
+            f"{stage['files_per_s']:11.0f} files/s "
+            f"{stage['mb_per_s']:8.1f} MB/s "
+            f"{stage['peak_traced_mb']:8.1f} MB peak"
+        )
+        if baseline and name in baseline["stages"]:
+            ratio = stage["seconds"] / baseline["stages"][name]["seconds"]
+            line += f"  {ratio:5.2f}x baseline time"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    add_arguments(parser)
+    parser.add_argument("--max-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--max-files", type=int, default=1000)
+    parser.add_argument("--scan-workers", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results to this file.")
+    parser.add_argument("--compare", help="Results of a previous run.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repo = os.path.join(tmp_dir, "repo")
+        output_dir = os.path.join(tmp_dir, "output")
+        os.makedirs(output_dir)
+        summary = generate_repo(repo, args)
+        results = measure(repo, output_dir, args)
+
+    results = {
+        "repo2md_version": repo2md.__version__,
+        "commit": source_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parameters": {
+            name: value
+            for name, value in vars(args).items()
+            if name not in ("output", "compare")
+        },
+        "generated": summary,
+        **results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Times rendering the Table of Contents of synthetic trees of growing size,
+comparing the previous recursive concatenation with ``iter_toc``. The time
+per entry of ``iter_toc`` stays flat as the tree grows.
+
+    PYTHONPATH=src python benchmarks/bench_toc.py --files 10000 40000 160000
+"""
+
+import argparse
+import io
+import time
+
+from bench_compact_tree import build_nodes, synthetic_layout
+
+from repo2md import NodeType, emit
+from repo2md.render import iter_toc
+
+
+def concatenated_toc(node, indent=0):
+    """The TOC renderer as it was before, built with ``toc += ...``."""
+    toc = b""
+    if node.type == NodeType.DIR:
+        toc += emit.toc_dir_entry(node, indent)
+        for child in sorted(
+            node.file_children + node.dir_children, key=lambda x: x.path
+        ):
+            toc += concatenated_toc(child, indent + 1)
+    else:
+        toc += emit.toc_file_entry(node, indent)
+    return toc
+
+
+def streamed_toc(node):
+    output = io.BytesIO()
+    output.writelines(iter_toc(node))
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--files", type=int, nargs="+", default=[10_000, 40_000, 160_000]
+    )
+    parser.add_argument("--files-per-dir", type=int, default=50)
+    parser.add_argument("--fanout", type=int, default=4)
+    args = parser.parse_args()
+
+    for num_files in args.files:
+        events = synthetic_layout(
+            num_files, args.files_per_dir, args.fanout, 0
+        )
+        root = build_nodes(events)
+        timings = {}
+        outputs = set()
+        for name, render in [
+            ("concatenated", concatenated_toc),
+            ("streamed", streamed_toc),
+        ]:
+            start = time.perf_counter()
+            outputs.add(render(root))
+            timings[name] = time.perf_counter() - start
+        assert len(outputs) == 1, "TOC output differs"
+        print(
+            f"{num_files:>9} files  "
+            + "  ".join(
+                f"{name} {elapsed:6.2f}s "
+                f"({elapsed / num_files * 1e6:5.2f} us/file)"
+                for name, elapsed in timings.items()
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Generates a deterministic synthetic repository: a directory tree of a given
+depth and fan-out, text files with log-normally distributed sizes, a share
+of binary files, and a share of files that the repository's .gitignore
+excludes. The same arguments and seed always produce the same bytes.
+
+    python benchmarks/synthetic_repo.py /tmp/repo --files 10000 --depth 4
+"""
+
+import argparse
+import math
+import os
+import random
+
+TEXT_EXTENSIONS = [".py", ".js", ".ts", ".rs", ".md", ".json", ".txt"]
+IGNORE_PATTERNS = ["node_modules/", "build/", "*.log"]
+IGNORED_PATHS = ["node_modules/pkg", "build", "logs"]
+LINES = [
+    b"def handler(event, context):\n",
+    b"    return {'status': 200, 'body': event}\n",
+    b"const total = items.reduce((sum, item) => sum + item.price, 0);\n",
+    b"# TODO: handle the empty case before the loop starts\n",
+    b"    for index, value in enumerate(values):\n",
+    b'fn main() { println!("{}", compute(42)); }\n',
+    b"\n",
+]
+
+
+def add_arguments(parser):
+    """Adds the generator's options to an argument parser."""
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument(
+        "--median-size", type=int, default=4096, help="Median file size."
+    )
+    parser.add_argument(
+        "--size-sigma",
+        type=float,
+        default=1.2,
+        help="Sigma of the log-normal file size distribution.",
+    )
+    parser.add_argument("--max-file-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--binary-ratio", type=float, default=0.05)
+    parser.add_argument(
+        "--ignored-ratio",
+        type=float,
+        default=0.1,
+        help="Share of files written where .gitignore excludes them.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def directories(depth, fanout):
+    """Returns every directory of a balanced tree, root first."""
+    paths = [""]
+    level = [""]
+    for _ in range(depth):
+        level = [
+            os.path.join(parent, f"dir_{index}")
+            for parent in level
+            for index in range(fanout)
+        ]
+        paths.extend(level)
+    return paths
+
+
+def text_content(rng, size):
+    lines = []
+    total = 0
+    while total < size:
+        line = rng.choice(LINES)
+        lines.append(line)
+        total += len(line)
+    return b"".join(lines)[:size]
+
+
+def file_size(rng, args):
+    size = rng.lognormvariate(math.log(args.median_size), args.size_sigma)
+    return max(1, min(int(size), args.max_file_size))
+
+
+def generate_repo(path, args):
+    """
+    Writes a synthetic repository to path and returns a summary of what was
+    written: the number and total size of files that are collected, and of
+    those that are ignored.
+    """
+    rng = random.Random(args.seed)
+    dirs = directories(args.depth, args.fanout)
+    for directory in dirs + IGNORED_PATHS:
+        os.makedirs(os.path.join(path, directory), exist_ok=True)
+    gitignore = "".join(f"{pattern}\n" for pattern in IGNORE_PATTERNS)
+    with open(os.path.join(path, ".gitignore"), "w") as file:
+        file.write(gitignore)
+
+    summary = {
+        "files": 1,
+        "bytes": len(gitignore),
+        "binary_files": 0,
+        "ignored_files": 0,
+        "ignored_bytes": 0,
+    }
+    for index in range(args.files):
+        size = file_size(rng, args)
+        ignored = rng.random() < args.ignored_ratio
+        binary = not ignored and rng.random() < args.binary_ratio
+        if ignored:
+            directory = rng.choice(IGNORED_PATHS)
+            extension = ".log" if directory == "logs" else ".js"
+            name = f"file_{index}{extension}"
+            content = text_content(rng, size)
+            summary["ignored_files"] += 1
+            summary["ignored_bytes"] += size
+        elif binary:
+            directory, name = rng.choice(dirs), f"blob_{index}.bin"
+            content = b"\0" + rng.randbytes(size - 1)
+            summary["binary_files"] += 1
+        else:
+            extension = rng.choice(TEXT_EXTENSIONS)
+            directory, name = rng.choice(dirs), f"file_{index}{extension}"
+            content = text_content(rng, size)
+        if not ignored:
+            summary["files"] += 1
+            summary["bytes"] += size
+        with open(os.path.join(path, directory, name), "wb") as file:
+            file.write(content)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    add_arguments(parser)
+    args = parser.parse_args()
+    summary = generate_repo(args.path, args)
+    print(
+        f"{summary['files']} files, {summary['bytes'] / 1024 / 1024:.1f} MB "
+        f"({summary['binary_files']} binary, "
+        f"{summary['ignored_files']} ignored)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,71 @@
 from .config import Config, logger, slugify, SYNTAX_MAP, config
-from .node import Node, NodeType
-from .collect import Collector
-from .splitter import calculate_file_byte_size, NodeTreeSplitter
-from .render import render_markdown
+from .node import ContentClass, ContentPolicy, FilePart, Node, NodeType
+from .profiling import Profiler
+from .ignore import IgnoreMatcher
+from .compact import CompactNode, CompactTree
+from .sources import GitSource, TarSource, ZipSource
+from .collect import ArchiveCollector, Collector, GitCollector
+from .dedup import deduplicate
+from .splitter import (
+    calculate_file_byte_size,
+    NodeTreeSplitter,
+    PackingNodeTreeSplitter,
+)
+from .render import RenderException, render_markdown
+from .concurrency import render_chunks
+from .aio import AsyncCollector, render_chunks_async
+from .tokens import ByteEstimator, TokenCounter, TokenEstimator
+from .chunks import Chunk, iter_chunks
+from .cache import BuildCache
+from .stats import RepoStats, gather_stats
+from .plan import Plan, read_plan, write_plan
+from .watch import TreeWatcher
 from .cli import cli
 
 __version__ = "0.0.1"
 
 __all__ = (
+    "ArchiveCollector",
+    "AsyncCollector",
+    "BuildCache",
+    "ByteEstimator",
     "Collector",
+    "Chunk",
+    "CompactNode",
+    "CompactTree",
+    "ContentClass",
+    "ContentPolicy",
     "Config",
+    "FilePart",
+    "IgnoreMatcher",
+    "GitCollector",
+    "GitSource",
     "Node",
     "NodeTreeSplitter",
     "NodeType",
+    "PackingNodeTreeSplitter",
+    "Plan",
+    "Profiler",
+    "RenderException",
+    "RepoStats",
     "SYNTAX_MAP",
+    "TarSource",
+    "TokenCounter",
+    "TokenEstimator",
+    "TreeWatcher",
+    "ZipSource",
     "__version__",
     "calculate_file_byte_size",
     "cli",
     "config",
+    "deduplicate",
+    "gather_stats",
+    "iter_chunks",
     "logger",
+    "read_plan",
+    "render_chunks",
+    "render_chunks_async",
     "render_markdown",
     "slugify",
+    "write_plan",
 )
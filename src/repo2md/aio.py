@@ -0,0 +1,246 @@
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from repo2md import Collector, Node, emit, logger, profiling
+from repo2md.collect import DirListing
+from repo2md.compress import open_output
+from repo2md.render import (
+    CHUNK_SIZE,
+    RenderException,
+    iter_file_content,
+    iter_navigation,
+    iter_toc,
+    output_file_name,
+    read_limit,
+    skip_to,
+)
+from repo2md.sources import Source, open_source
+
+# Default number of filesystem calls kept in flight at once.
+DEFAULT_CONCURRENCY = 64
+
+
+class AsyncCollector(Collector):
+    """
+    A Collector that overlaps the ``os.scandir``, ``stat`` and classification
+    reads of many directories with asyncio, for filesystems where each call
+    is slow but many can be in flight, such as NFS or FUSE mounts.
+
+    Directories are scanned in an executor with at most ``concurrency``
+    scans in flight, then assembled in the same order as a serial walk, so
+    the tree is identical to the one ``Collector`` builds.
+
+    Attributes:
+        concurrency (int): Maximum number of directories scanned at once.
+    """
+
+    def __init__(
+        self,
+        root_path: str,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        **kwargs,
+    ):
+        super().__init__(root_path, **kwargs)
+        self.concurrency = concurrency
+
+    async def scan_tree_async(
+        self, executor: Optional[Executor] = None
+    ) -> Dict[str, DirListing]:
+        """
+        Scans every non-ignored directory below the root path, starting the
+        scan of each subdirectory as soon as its parent was listed.
+
+        Returns:
+            Dict[str, DirListing]: The listing of every scanned directory,
+                keyed by directory path.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        listings: Dict[str, DirListing] = {}
+
+        async def scan(dirpath: str):
+            async with semaphore:
+                listing = await loop.run_in_executor(
+                    executor, self.scan_directory, dirpath
+                )
+            listings[dirpath] = listing
+            await asyncio.gather(*(scan(path) for path in listing.subdirs))
+
+        if executor is None:
+            with ThreadPoolExecutor(self.concurrency) as executor:
+                await scan(self.root_path)
+        else:
+            await scan(self.root_path)
+        return listings
+
+    async def build_node_tree_async(self) -> Optional[Node]:
+        listings = await self.scan_tree_async()
+        return self.process_directory(self.root_path, listings)
+
+    def prefetch_listings(self) -> Dict[str, DirListing]:
+        return asyncio.run(self.scan_tree_async())
+
+
+def open_body(
+    source: Source, path: str, limit: Optional[int], offset: int = 0
+) -> Tuple[object, bytes, bool]:
+    """
+    Opens a file at offset and reads its first block, runs in the executor.
+    A short first block is followed by a read that confirms the end of the
+    file, so small files need no further calls once they are written. As
+    streams such as ``NewlineFile`` return short reads before their end,
+    the byte that read returns is kept as part of the block.
+    """
+    file = open_source(source, path)
+    try:
+        skip_to(file, offset)
+        size = CHUNK_SIZE if limit is None else min(limit, CHUNK_SIZE)
+        block = file.read(size)
+        done = False
+        if len(block) < size:
+            probe = file.read(1)
+            done = not probe
+            block += probe
+        return file, block, done
+    except BaseException:
+        file.close()
+        raise
+
+
+def reads_source(node: Node) -> bool:
+    return not node.duplicate_of and not emit.is_summarized(node)
+
+
+def close_opened(future: asyncio.Future):
+    """Closes the file of a prefetch that is no longer needed."""
+    if future.cancelled() or future.exception() is not None:
+        return
+    future.result()[0].close()
+
+
+async def write_body(
+    markdown_file, node: Node, opened: asyncio.Future, executor: Executor
+):
+    loop = asyncio.get_running_loop()
+    try:
+        file, block, done = await opened
+    except OSError as e:
+        raise RenderException(node.path, e.strerror or str(e)) from e
+
+    with file:
+        markdown_file.write(emit.fence_open(node))
+        remaining = read_limit(node)
+        while block:
+            markdown_file.write(block)
+            if done:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+                if remaining <= 0:
+                    break
+            size = (
+                CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE)
+            )
+            try:
+                block = await loop.run_in_executor(executor, file.read, size)
+            except OSError as e:
+                raise RenderException(node.path, e.strerror or str(e)) from e
+        if emit.is_truncated(node):
+            markdown_file.write(emit.truncation_note(node))
+        markdown_file.write(emit.fence_close(node))
+
+
+async def write_sections_async(
+    markdown_file,
+    node: Node,
+    source: Source,
+    nav: emit.Navigation,
+    executor: Executor,
+    window: int,
+):
+    """
+    Writes the file sections of a chunk in order, while the next ``window``
+    files are already being opened and their first block read.
+    """
+    loop = asyncio.get_running_loop()
+    sections = iter_navigation(node, nav)
+    pending = deque()
+
+    def prefetch(section):
+        file_node = section[0]
+        opened = None
+        if reads_source(file_node):
+            opened = loop.run_in_executor(
+                executor,
+                open_body,
+                source,
+                file_node.path,
+                read_limit(file_node),
+                file_node.part.offset if file_node.part else 0,
+            )
+        pending.append((section, opened))
+
+    for section in islice(sections, window):
+        prefetch(section)
+    try:
+        while pending:
+            (file_node, prev_anchor, next_anchor), opened = pending.popleft()
+            for section in islice(sections, 1):
+                prefetch(section)
+
+            with profiling.file_timer(
+                "render", file_node.path, file_node.size
+            ):
+                markdown_file.write(emit.file_header(file_node))
+                markdown_file.write(
+                    emit.navigation_links(prev_anchor, next_anchor)
+                )
+                markdown_file.write(emit.part_links(file_node))
+                if opened is None:
+                    markdown_file.writelines(
+                        iter_file_content(file_node, source)
+                    )
+                else:
+                    await write_body(
+                        markdown_file, file_node, opened, executor
+                    )
+    finally:
+        for _, opened in pending:
+            if opened is not None:
+                opened.add_done_callback(close_opened)
+
+
+async def render_chunks_async(
+    chunks: Iterable[Tuple[int, Node]],
+    output_directory: str,
+    source: Source = ".",
+    nav: emit.Navigation = emit.Navigation.DIRECTORY,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    compress: Optional[str] = None,
+) -> List[str]:
+    """
+    Renders chunks like ``render_chunks``, overlapping the opening and first
+    read of the next ``concurrency`` files with writing the current one.
+    The output is identical to the synchronous renderer.
+
+    Returns:
+        List[str]: The paths of the Markdown files, in the order of chunks.
+    """
+    paths = []
+    with ThreadPoolExecutor(concurrency) as executor:
+        for index, node in chunks:
+            logger.debug("Rendering chunk %d asynchronously", index)
+            path = os.path.join(
+                output_directory, output_file_name(index, compress)
+            )
+            with open_output(path, compress) as markdown_file:
+                markdown_file.writelines(iter_toc(node))
+                await write_sections_async(
+                    markdown_file, node, source, nav, executor, concurrency
+                )
+            paths.append(path)
+    return paths
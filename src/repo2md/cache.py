@@ -0,0 +1,224 @@
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from repo2md import Node, calculate_file_byte_size, logger
+from repo2md.render import output_file_name, remove_stale_outputs
+
+CACHE_DIR_NAME = ".cache"
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 6
+
+
+def file_signature(node: Node) -> List[Any]:
+    """
+    Returns the signature used to detect changed files: their stat values
+    and everything else that changes how they are rendered.
+    """
+    return [
+        node.size,
+        node.mtime_ns,
+        node.inode,
+        node.duplicate_of,
+        node.content_class.value,
+        node.body_limit,
+    ]
+
+
+def chunk_references(node: Node) -> List[Optional[int]]:
+    """
+    Returns the chunk every duplicate in a chunk links to, which changes its
+    output when the original moves to another chunk.
+    """
+    return [
+        file_node.duplicate_chunk
+        for file_node in node.iter_files()
+        if file_node.duplicate_of
+    ]
+
+
+class BuildCache:
+    """
+    A persistent manifest of the previous run, stored in the output
+    directory, used to skip work for files and chunks that did not change.
+
+    The manifest records, for every file, its stat signature, its computed
+    size and the chunk it landed in, and for every chunk, its ordered
+    member files, the chunks its duplicates link to and the size of the
+    rendered output. A chunk whose members are the same files, in the same
+    order, with unchanged signatures and links, is kept byte-for-byte
+    instead of being rendered again.
+
+    Attributes:
+        output_directory (str): Directory holding the ``output_N.md`` files.
+        settings (Dict[str, Any]): Options that affect rendered output or
+            sizes; any difference from the previous run discards the whole
+            manifest.
+        size_func (Callable[[Node], int]): Computes the size of a file that
+            changed, in bytes or in another unit such as tokens.
+        compress (Optional[str]): Compression of the output files, which
+            sets their names.
+        file_hits (int): Files whose size was reused.
+        file_misses (int): Files whose size was computed.
+        chunk_hits (int): Chunks whose output file was reused.
+        chunk_misses (int): Chunks that had to be rendered.
+    """
+
+    def __init__(
+        self,
+        output_directory: str,
+        settings: Optional[Dict[str, Any]] = None,
+        size_func: Callable[[Node], int] = calculate_file_byte_size,
+        compress: Optional[str] = None,
+    ):
+        self.output_directory = output_directory
+        self.compress = compress
+        self.settings = {"version": MANIFEST_VERSION, **(settings or {})}
+        self.size_func = size_func
+        self.manifest_path = os.path.join(
+            output_directory, CACHE_DIR_NAME, MANIFEST_FILE_NAME
+        )
+
+        previous = self.load()
+        self.previous_files: Dict[str, Dict[str, Any]] = previous.get(
+            "files", {}
+        )
+        self.previous_chunks: List[Dict[str, Any]] = previous.get("chunks", [])
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.chunks: List[Dict[str, Any]] = []
+
+        self.file_hits = 0
+        self.file_misses = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, "r") as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache manifest: {e}")
+            return {}
+
+        if manifest.get("settings") != self.settings:
+            logger.debug("Cache settings changed, starting from scratch.")
+            return {}
+        return manifest
+
+    def is_unchanged(self, node: Node) -> bool:
+        entry = self.previous_files.get(node.path)
+        if entry is None:
+            return False
+        return entry["signature"] == file_signature(node)
+
+    def byte_size(self, node: Node) -> int:
+        """
+        Returns the size of a file node, reusing the previous value when the
+        file did not change. Meant as the splitter's size_func.
+        """
+        if self.is_unchanged(node):
+            size = self.previous_files[node.path]["size"]
+            self.file_hits += 1
+        else:
+            size = self.size_func(node)
+            self.file_misses += 1
+
+        self.files[node.path] = {
+            "signature": file_signature(node),
+            "size": size,
+        }
+        return size
+
+    def output_path(self, index: int) -> str:
+        return os.path.join(
+            self.output_directory, output_file_name(index, self.compress)
+        )
+
+    def chunk_is_fresh(self, index: int, node: Node) -> bool:
+        """
+        Checks whether the existing output of a chunk can be reused.
+
+        Args:
+            index (int): The index of the chunk.
+            node (Node): The output root node of the chunk.
+
+        Returns:
+            bool: True if the chunk has the same members as in the previous
+                run, none of them changed and its output file is intact.
+        """
+        if index >= len(self.previous_chunks):
+            return False
+
+        previous = self.previous_chunks[index]
+        members = [file_node.path for file_node in node.iter_files()]
+        if previous["files"] != members:
+            return False
+        if not all(
+            self.is_unchanged(file_node) for file_node in node.iter_files()
+        ):
+            return False
+        if previous.get("references") != chunk_references(node):
+            return False
+
+        try:
+            output_size = os.path.getsize(self.output_path(index))
+        except OSError:
+            return False
+        return output_size == previous["bytes"]
+
+    def record_chunk(self, index: int, node: Node, reused: bool):
+        """
+        Records the members and output size of a chunk once it is written
+        (or reused).
+        """
+        members = []
+        for file_node in node.iter_files():
+            entry = self.files.setdefault(
+                file_node.path,
+                {
+                    "signature": file_signature(file_node),
+                    "size": self.size_func(file_node),
+                },
+            )
+            entry["chunk"] = index
+            members.append(file_node.path)
+
+        self.chunks.append(
+            {
+                "output": output_file_name(index, self.compress),
+                "files": members,
+                "references": chunk_references(node),
+                "bytes": os.path.getsize(self.output_path(index)),
+            }
+        )
+        if reused:
+            self.chunk_hits += 1
+        else:
+            self.chunk_misses += 1
+
+    def remove_stale_outputs(self, num_chunks: int):
+        """
+        Removes outputs of chunks that no longer exist or that have another
+        compression.
+        """
+        remove_stale_outputs(self.output_directory, num_chunks, self.compress)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        manifest = {
+            "settings": self.settings,
+            "files": self.files,
+            "chunks": self.chunks,
+        }
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(manifest, file, separators=(",", ":"))
+        os.replace(temp_path, self.manifest_path)
+
+    def report(self) -> str:
+        return (
+            f"Files: {self.file_hits} cached, {self.file_misses} changed\n"
+            f"Chunks: {self.chunk_hits} reused, {self.chunk_misses} rendered"
+        )
@@ -0,0 +1,177 @@
+import codecs
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+from repo2md import (
+    ArchiveCollector,
+    Collector,
+    ContentClass,
+    ContentPolicy,
+    GitCollector,
+    Node,
+    NodeTreeSplitter,
+    PackingNodeTreeSplitter,
+    TokenCounter,
+    calculate_file_byte_size,
+    deduplicate,
+    emit,
+)
+from repo2md.render import iter_markdown, output_file_name
+from repo2md.sources import NewlineSource, Source, close_source
+from repo2md.splitter import SplitterException
+from repo2md.tokens import get_estimator
+
+
+@dataclass
+class Chunk:
+    """
+    One output Markdown file, rendered lazily.
+
+    Attributes:
+        index (int): Position of the chunk in the output.
+        node (Node): Root of the chunk's output tree.
+        size (int): Size of the rendered chunk, in bytes, or in tokens when
+            splitting by tokens.
+        source (Source): What the node paths are relative to.
+        nav (emit.Navigation): What the PREV/NEXT links point to.
+    """
+
+    index: int
+    node: Node
+    size: int
+    source: Source = "."
+    nav: emit.Navigation = emit.Navigation.DIRECTORY
+
+    @property
+    def name(self) -> str:
+        """The file name the CLI writes the chunk to."""
+        return output_file_name(self.index)
+
+    @property
+    def files(self) -> List[str]:
+        """Paths of the files in the chunk, in rendering order."""
+        return [file_node.path for file_node in self.node.iter_files()]
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """
+        Yields the chunk's Markdown piece by piece, reading file bodies in
+        CHUNK_SIZE blocks as the stream is consumed.
+        """
+        for block in iter_markdown(self.node, self.source, self.nav):
+            # Blocks of memory-mapped files are views, which would keep the
+            # mapping open for as long as the caller holds them.
+            yield bytes(block)
+
+    def iter_text(self, errors: str = "replace") -> Iterator[str]:
+        """Yields the chunk's Markdown decoded as UTF-8."""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors)
+        for block in self.iter_bytes():
+            text = decoder.decode(block)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+def iter_chunks(
+    repo_path: str,
+    max_size: int = 512 * 1024 * 1024,
+    max_files: int = 10,
+    *,
+    max_tokens: int = 0,
+    tokenizer: str = "bytes",
+    pack: bool = False,
+    nav: emit.Navigation = emit.Navigation.DIRECTORY,
+    dedup: bool = False,
+    content_policies: Optional[Dict[ContentClass, ContentPolicy]] = None,
+    huge_file_size: int = 0,
+    scan_workers: int = 0,
+    from_git: Optional[str] = None,
+    normalize_newlines: bool = False,
+) -> Iterator[Chunk]:
+    """
+    Collects and splits a repository, and yields its chunks without writing
+    anything to disk.
+
+    The repository is collected and split when iteration starts; every
+    chunk is only rendered as its stream is consumed, so memory is bounded
+    by the node tree plus one block of one file body.
+
+    Args:
+        repo_path (str): The repository to render, or a zip or tar archive
+            of it.
+        max_size (int): Max size of each chunk in bytes.
+        max_files (int): Max number of chunks.
+        max_tokens (int): Max tokens of each chunk, used instead of
+            max_size when set.
+        tokenizer (str): How tokens are counted for max_tokens.
+        pack (bool): Pack files into as few chunks as possible.
+        nav (emit.Navigation): What the PREV/NEXT links point to.
+        dedup (bool): Render identical files once.
+        content_policies (Optional[Dict[ContentClass, ContentPolicy]]): How
+            binary and huge files are handled; None does not classify.
+        huge_file_size (int): Size above which files are huge.
+        scan_workers (int): Number of threads used to scan directories.
+        from_git (Optional[str]): Read the files tracked by git instead of
+            the working tree: those of this revision, or of the index when
+            empty.
+        normalize_newlines (bool): Render files with LF line endings only;
+            chunk sizes are then upper bounds.
+
+    The source is closed once the generator is exhausted or closed, so
+    chunks are best rendered while iterating.
+
+    Raises:
+        SplitterException: If the repository does not fit the limits.
+
+    Yields:
+        Chunk: Each chunk, in output order.
+    """
+    if from_git is not None:
+        collector = GitCollector(
+            repo_path, from_git, content_policies, huge_file_size
+        )
+    elif os.path.isfile(repo_path):
+        collector = ArchiveCollector(
+            repo_path, content_policies, huge_file_size
+        )
+    else:
+        collector = Collector(
+            repo_path, scan_workers, content_policies, huge_file_size
+        )
+    source = collector.source
+    if normalize_newlines:
+        source = NewlineSource(source)
+    try:
+        root_node = collector.build_node_tree()
+        if root_node is None:
+            return
+        if dedup:
+            deduplicate(root_node, source)
+
+        size_func, measure, limit = calculate_file_byte_size, len, max_size
+        if max_tokens:
+            estimator = get_estimator(tokenizer)
+            counter = TokenCounter(estimator, source)
+            size_func, measure, limit = (
+                counter.section_tokens,
+                estimator.count,
+                max_tokens,
+            )
+
+        splitter_class = PackingNodeTreeSplitter if pack else NodeTreeSplitter
+        splitter = splitter_class(
+            root_node, limit, max_files, size_func, nav, measure
+        )
+        nodes = splitter.split()
+        if nodes is None:
+            raise SplitterException(
+                "Repository content exceeds the set limits."
+            )
+
+        for index, node in enumerate(nodes):
+            yield Chunk(index, node, splitter.chunk_sizes[index], source, nav)
+    finally:
+        close_source(source)
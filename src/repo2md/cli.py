@@ -1,4 +1,4 @@
-import heapq
+import asyncio
 import os
 import sys
 
@@ -6,18 +6,285 @@ import click
 import humanize
 
 from repo2md import (
+    ArchiveCollector,
+    AsyncCollector,
+    BuildCache,
     Collector,
     Config,
+    ContentClass,
+    ContentPolicy,
+    GitCollector,
     NodeTreeSplitter,
+    PackingNodeTreeSplitter,
+    Profiler,
+    RenderException,
+    calculate_file_byte_size,
+    deduplicate,
+    emit,
     logger,
-    render_markdown,
+    profiling,
+    render_chunks,
+    render_chunks_async,
 )
+from repo2md.compress import SUFFIXES, check_method
+from repo2md.plan import PlanException, read_plan, write_plan
+from repo2md.render import remove_stale_outputs
+from repo2md.sources import (
+    GitException,
+    NewlineSource,
+    TarSource,
+    close_source,
+)
+from repo2md.stats import SIZE_BUCKETS, RepoStats, gather_stats
+from repo2md.tokens import ESTIMATORS, TokenCounter, get_estimator
+from repo2md.watch import DEFAULT_INTERVAL, TreeWatcher
+
+# Rows of each table of the --dry-run summary.
+SUMMARY_ROWS = 10
+
+
+def output_directory(repo_path):
+    """
+    Returns where the Markdown files go: inside the repository, or next to
+    it when it is an archive.
+    """
+    if os.path.isfile(repo_path):
+        repo_path = os.path.dirname(repo_path)
+    return os.path.join(repo_path, "repo2md_output")
+
+
+def make_collector(config):
+    content_policies = {
+        ContentClass.BINARY: ContentPolicy(config.binary_files),
+        ContentClass.HUGE: ContentPolicy(config.huge_files),
+    }
+    if config.from_git is not None:
+        return GitCollector(
+            config.repo_path,
+            config.from_git,
+            content_policies,
+            config.huge_size,
+        )
+    if os.path.isfile(config.repo_path):
+        return ArchiveCollector(
+            config.repo_path, content_policies, config.huge_size
+        )
+    if config.async_io:
+        return AsyncCollector(
+            config.repo_path,
+            config.async_io,
+            content_policies=content_policies,
+            huge_file_size=config.huge_size,
+        )
+    return Collector(
+        config.repo_path,
+        config.scan_workers,
+        content_policies,
+        config.huge_size,
+    )
+
+
+def count_files(node):
+    return sum(1 for _ in node.iter_files())
+
+
+def build_tree(collector):
+    try:
+        with profiling.stage("scan") as stage:
+            root_node = collector.build_node_tree()
+            if root_node is not None:
+                stage.files = count_files(root_node)
+                stage.size = root_node.size
+            return root_node
+    except GitException as e:
+        print(f"Failed to read from git: {e}")
+        sys.exit(1)
+
+
+def render_stale_chunks(config, stale, output_dir, source, nav):
+    """Renders the chunks that are not reused, returning their paths."""
+    if config.async_io:
+        return asyncio.run(
+            render_chunks_async(
+                stale,
+                output_dir,
+                source,
+                nav,
+                config.async_io,
+                config.compress,
+            )
+        )
+    return render_chunks(
+        stale, output_dir, source, config.jobs, nav, config.compress
+    )
+
+
+def make_splitter(config, root_node, output_dir, source, nav):
+    """
+    Creates the splitter and the build cache, measuring chunks in tokens
+    with --max-tokens and in bytes otherwise.
+    """
+    counter = None
+    size_func, measure, max_size = (
+        calculate_file_byte_size,
+        len,
+        config.max_size,
+    )
+    if config.max_tokens:
+        estimator = get_estimator(config.tokenizer)
+        counter = TokenCounter(estimator, source)
+        size_func, measure = counter.section_tokens, estimator.count
+        max_size = config.max_tokens
+
+    cache = None
+    if config.cache:
+        unit = counter.estimator.name if counter else "bytes"
+        settings = {
+            "nav": nav.value,
+            "unit": unit,
+            "newlines": config.normalize_newlines,
+        }
+        cache = BuildCache(output_dir, settings, size_func, config.compress)
+        size_func = cache.byte_size
+
+    if counter:
+        with profiling.stage("tokens"):
+            counter.count_files(
+                (
+                    file_node
+                    for file_node in root_node.iter_files()
+                    if cache is None or not cache.is_unchanged(file_node)
+                ),
+                config.jobs,
+            )
+
+    splitter_class = (
+        PackingNodeTreeSplitter if config.pack else NodeTreeSplitter
+    )
+    # Parts are cut to a size in bytes, and packing moves files around
+    # instead of keeping the parts of a file in consecutive chunks.
+    part_source = None
+    if config.split_large_files and not config.max_tokens and not config.pack:
+        part_source = source
+    splitter = splitter_class(
+        root_node,
+        max_size,
+        config.max_files,
+        size_func,
+        nav,
+        measure,
+        part_source,
+    )
+    return splitter, cache
+
+
+def render_output(config, nodes, cache, output_dir, source, nav):
+    """
+    Renders the chunks that the cache cannot reuse and records the run in
+    the cache, returning the number of chunks rendered.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    reused = [
+        cache is not None and cache.chunk_is_fresh(index, node)
+        for index, node in enumerate(nodes)
+    ]
+    stale = [
+        (index, node) for index, node in enumerate(nodes) if not reused[index]
+    ]
+    with profiling.stage("render") as stage:
+        paths = render_stale_chunks(config, stale, output_dir, source, nav)
+        stage.files = sum(count_files(node) for _, node in stale)
+        stage.size = sum(os.path.getsize(path) for path in paths)
+
+    remove_stale_outputs(output_dir, len(nodes), config.compress)
+    if cache:
+        for index, node in enumerate(nodes):
+            cache.record_chunk(index, node, reused[index])
+        cache.save()
+    return len(stale)
+
+
+def projection_size(config):
+    """Returns the chunk size to project chunks for; 0 with --max-tokens."""
+    return 0 if config.max_tokens else config.max_size
+
+
+def print_report(config, stats, class_counts, duplicates=()):
+    """Prints the summary of --dry-run, then the files of --list-largest."""
+    if config.dry_run:
+        print_summary(stats, class_counts, duplicates)
+    for size, path in stats.largest_files():
+        print(f"{path}: {humanize.naturalsize(size)}")
+
+
+def print_summary(stats, class_counts, duplicates=()):
+    print(f"Total size: {humanize.naturalsize(stats.size)}")
+    print(f"Files: {stats.files}")
+    print(f"Directories: {stats.directories}")
+    for content_class in ContentClass:
+        name = content_class.value.capitalize()
+        print(f"{name} files: {class_counts[content_class]}")
+    if duplicates:
+        saved = sum(node.size - emit.body_size(node) for node in duplicates)
+        print(
+            f"Duplicates: {len(duplicates)} "
+            f"({humanize.naturalsize(saved)} saved)"
+        )
+    if stats.max_size:
+        line = f"Projected chunks: {stats.chunks}"
+        if stats.oversized:
+            line += f" ({stats.oversized} files larger than --max-size)"
+        print(line)
 
+    for title, totals in [
+        ("Extensions", stats.extensions),
+        ("Top-level directories", stats.top_directories),
+    ]:
+        print(f"{title}:")
+        largest = sorted(totals.items(), key=lambda item: -item[1][1])
+        for name, (files, size) in largest[:SUMMARY_ROWS]:
+            print(
+                f"  {name or '(none)'}: {files} files, "
+                f"{humanize.naturalsize(size)}"
+            )
+    print("File sizes:")
+    for index, count in enumerate(stats.histogram):
+        if index < len(SIZE_BUCKETS):
+            label = f"< {humanize.naturalsize(SIZE_BUCKETS[index], True)}"
+        else:
+            label = f">= {humanize.naturalsize(SIZE_BUCKETS[-1], True)}"
+        print(f"  {label}: {count}")
 
-# Helper function to find largest files
-def find_largest_files(root_node, n):
-    files = [(node.size, node.path) for node in root_node.file_children]
-    return heapq.nlargest(n, files)
+
+def print_stats(splitter, cache):
+    for index, ratio in enumerate(splitter.fill_ratios()):
+        print(f"Chunk {index}: {ratio:.1%} full")
+    if cache:
+        print(cache.report())
+
+
+def check_compress(ctx, param, value):
+    """Rejects a compression whose package is not installed."""
+    try:
+        check_method(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from None
+    return value
+
+
+def parse_shard(ctx, param, value):
+    """Parses ``I/N`` into the 1-based shard I of N."""
+    if value is None:
+        return None
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise click.BadParameter("expected I/N, like 2/4") from None
+    if not 1 <= index <= count:
+        raise click.BadParameter("I must be between 1 and N")
+    return index, count
 
 
 @click.command()
@@ -25,16 +292,95 @@ def find_largest_files(root_node, n):
     "repo_path",
     type=click.Path(exists=True),
 )
+@click.option(
+    "--from-git",
+    is_flag=False,
+    flag_value="",
+    default=None,
+    metavar="[REV]",
+    help="Read the files tracked by git instead of the working tree: those "
+    "of the commit REV, or of the index when no REV is given.",
+)
 @click.option(
     "--max-size",
     default=512 * 1024 * 1024,
     help="Max size of each Markdown file in bytes.",
 )
+@click.option(
+    "--compress",
+    type=click.Choice(sorted(SUFFIXES)),
+    callback=check_compress,
+    help="Compress each Markdown file. --max-size and --max-tokens limit "
+    "the content before compression.",
+)
 @click.option(
     "--max-files",
     default=10,
     help="Max number of Markdown files to generate.",
 )
+@click.option(
+    "--max-tokens",
+    default=0,
+    help="Max tokens of each Markdown file, instead of --max-size.",
+)
+@click.option(
+    "--tokenizer",
+    type=click.Choice(sorted(ESTIMATORS)),
+    default="bytes",
+    help="How tokens are counted for --max-tokens.",
+)
+@click.option(
+    "--pack",
+    is_flag=True,
+    help="Pack files into as few Markdown files as possible.",
+)
+@click.option(
+    "--split-large-files",
+    is_flag=True,
+    help="Split files larger than a Markdown file across consecutive ones, "
+    "at top-level definitions or line ends, instead of failing. Not with "
+    "--max-tokens or --pack.",
+)
+@click.option(
+    "--normalize-newlines",
+    is_flag=True,
+    help="Convert CRLF and CR line endings to LF in file contents. Sizes "
+    "are then upper bounds, as files can only get shorter.",
+)
+@click.option(
+    "--dedup",
+    is_flag=True,
+    help="Render identical files once and reference them elsewhere.",
+)
+@click.option(
+    "--binary-files",
+    type=click.Choice(
+        [
+            policy.value
+            for policy in ContentPolicy
+            if policy != ContentPolicy.TRUNCATE
+        ]
+    ),
+    default=ContentPolicy.SUMMARIZE.value,
+    help="How to handle binary and non-UTF-8 files.",
+)
+@click.option(
+    "--huge-files",
+    type=click.Choice([policy.value for policy in ContentPolicy]),
+    default=ContentPolicy.TRUNCATE.value,
+    help="How to handle files larger than --huge-size.",
+)
+@click.option(
+    "--huge-size",
+    default=0,
+    help="Size in bytes above which files are huge (0 disables).",
+)
+@click.option(
+    "--nav",
+    type=click.Choice([nav.value for nav in emit.Navigation]),
+    default=emit.Navigation.DIRECTORY.value,
+    help="Link each file to its neighbours in its directory or output file.",
+)
 @click.option(
     "--dry-run",
     is_flag=True,
@@ -45,6 +391,74 @@ def find_largest_files(root_node, n):
     default=0,
     help="List the largest N files in the repository.",
 )
+@click.option(
+    "--scan-workers",
+    default=0,
+    help="Number of threads used to scan directories (0 scans serially).",
+)
+@click.option(
+    "--async-io",
+    default=0,
+    help="Overlap up to N filesystem calls with asyncio when scanning and "
+    "rendering, for high-latency filesystems (0 disables).",
+)
+@click.option(
+    "--jobs",
+    default=1,
+    help="Number of processes used to render Markdown files, and of "
+    "threads used to count tokens.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Reuse unchanged output files from the previous run.",
+)
+@click.option(
+    "--stats",
+    is_flag=True,
+    help="Report chunk fill ratios and cache hits and misses.",
+)
+@click.option(
+    "--write-plan",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Collect and split the repository, and write which files go in "
+    "which chunk to this file instead of rendering them.",
+)
+@click.option(
+    "--plan",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Render the chunks of a file written by --write-plan, with the "
+    "settings it was written with, instead of collecting and splitting.",
+)
+@click.option(
+    "--shard",
+    callback=parse_shard,
+    default="1/1",
+    metavar="I/N",
+    help="With --plan, render only shard I of N. The shards of a plan "
+    "together write the files of a single run.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Keep running, and update the Markdown files every time the "
+    "repository changes. Only chunks with changed files are rendered again, "
+    "unless --no-cache is given.",
+)
+@click.option(
+    "--watch-interval",
+    default=DEFAULT_INTERVAL,
+    help="Seconds between polls for --watch, and how long edits must pause "
+    "before the files are updated.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Report the time, files, bytes and memory of each stage and the "
+    "slowest files, and write a Chrome trace of the run to this file. "
+    "Files rendered by --jobs worker processes are not timed one by one; "
+    "set PYTHONTRACEMALLOC=1 to also trace Python allocations.",
+)
 @click.option(
     "-v",
     "--verbose",
@@ -60,33 +474,209 @@ def find_largest_files(root_node, n):
 def cli(**kwargs):
     config = Config()
     config.update_config(**kwargs)
+    if not config.profile:
+        generate(config)
+        return
 
-    collector = Collector(config.repo_path)
-    root_node = collector.build_node_tree()
+    profiler = Profiler()
+    try:
+        with profiling.activate(profiler):
+            generate(config)
+    finally:
+        profiler.write_trace(config.profile)
+        print(profiler.report())
 
-    if config.dry_run:
-        print(f"Total size: {humanize.naturalsize(root_node.size)}")
-        print(f"Files: {root_node.file_count}")
-        print(f"Directories: {root_node.dir_count}")
+
+def generate(config):
+    if config.plan:
+        render_shard(config)
+        return
+
+    collector = make_collector(config)
+    try:
+        generate_from(config, collector)
+    finally:
+        close_source(collector.source)
+
+
+def generate_from(config, collector):
+    """Writes the output of the repository a collector scans."""
+    source = collector.source
+    if config.normalize_newlines:
+        source = NewlineSource(source)
+    if config.watch:
+        watch(config, collector, source)
+        return
+    if config.list_largest > 0 or (config.dry_run and not config.dedup):
+        # Duplicates need the whole tree; anything else is streamed.
+        with profiling.stage("stats") as stage:
+            stats = gather_stats(
+                collector,
+                config.list_largest,
+                projection_size(config),
+                emit.Navigation(config.nav),
+            )
+            stage.files, stage.size = stats.files, stats.size
+        print_report(config, stats, collector.class_counts)
         sys.exit(0)
 
-    if config.list_largest > 0:
-        largest_files = find_largest_files(root_node, config.list_largest)
-        for size, path in largest_files:
-            print(f"{path}: {humanize.naturalsize(size)}")
+    root_node = build_tree(collector)
+    try:
+        rendered = write_output(
+            config, root_node, source, collector.class_counts
+        )
+    except RenderException as e:
+        print(f"Failed to render {e.path}: {e.message}")
+        sys.exit(1)
+    if rendered is None:
+        sys.exit(1)
+
+
+def write_output(config, root_node, source, class_counts):
+    """
+    Writes the Markdown files of a tree, returning the number of chunks
+    rendered, or None when the tree exceeds the limits.
+    """
+    duplicates = []
+    if config.dedup:
+        with profiling.stage("dedup", count_files(root_node), root_node.size):
+            duplicates = deduplicate(root_node, source)
+
+    if config.dry_run:
+        stats = RepoStats(
+            config.list_largest,
+            projection_size(config),
+            emit.Navigation(config.nav),
+        )
+        stats.add_tree(root_node)
+        print_report(config, stats, class_counts, duplicates)
         sys.exit(0)
 
-    splitter = NodeTreeSplitter(root_node, config.max_size, config.max_files)
-    nodes = splitter.split()
+    output_dir = output_directory(config.repo_path)
+    nav = emit.Navigation(config.nav)
+    with profiling.stage("split", count_files(root_node), root_node.size):
+        splitter, cache = make_splitter(
+            config, root_node, output_dir, source, nav
+        )
+        nodes = splitter.split()
 
     if nodes is None:
         print("Repository content exceeds the set limits.")
+        return None
+
+    if config.write_plan:
+        write_plan(
+            config.write_plan,
+            nodes,
+            splitter.chunk_sizes,
+            plan_settings(config),
+        )
+        print(f"Planned {len(nodes)} chunks in {config.write_plan}")
+        return 0
+
+    rendered = render_output(config, nodes, cache, output_dir, source, nav)
+
+    if config.stats:
+        print_stats(splitter, cache)
+
+    logger.info("Markdown files generated successfully.")
+    return rendered
+
+
+def plan_settings(config):
+    """Returns the config values a plan renders its chunks with."""
+    return {
+        "from_git": config.from_git,
+        "compress": config.compress,
+        "normalize_newlines": config.normalize_newlines,
+        "nav": config.nav,
+    }
+
+
+def render_shard(config):
+    """
+    Renders the chunks of a plan that belong to the shard of --shard, with
+    the settings the plan was made with.
+    """
+    try:
+        plan = read_plan(config.plan)
+    except PlanException as e:
+        print(e)
+        sys.exit(1)
+    for key, value in plan.settings.items():
+        setattr(config, key, value)
+    try:
+        check_method(config.compress)
+    except ValueError as e:
+        print(e)
         sys.exit(1)
 
-    output_dir = os.path.join(config.repo_path, "repo2md_output")
+    index, count = config.shard
+    chunks = [
+        (chunk, plan.chunks[chunk]) for chunk in plan.shard(index - 1, count)
+    ]
+    source = make_collector(config).source
+    if isinstance(source, TarSource):
+        source.order = {
+            file_node.path: position
+            for position, file_node in enumerate(
+                file_node
+                for _, node in chunks
+                for file_node in node.iter_files()
+            )
+        }
+    if config.normalize_newlines:
+        source = NewlineSource(source)
+
+    output_dir = output_directory(config.repo_path)
     os.makedirs(output_dir, exist_ok=True)
+    nav = emit.Navigation(config.nav)
+    try:
+        with profiling.stage("render") as stage:
+            render_stale_chunks(config, chunks, output_dir, source, nav)
+            stage.files = sum(count_files(node) for _, node in chunks)
+    except RenderException as e:
+        print(f"Failed to render {e.path}: {e.message}")
+        sys.exit(1)
+    finally:
+        close_source(source)
+    print(f"Rendered {len(chunks)} of {len(plan.chunks)} chunks")
 
-    for index, node in enumerate(nodes):
-        render_markdown(node, output_dir, index)
 
-    logger.info("Markdown files generated successfully.")
+def watch(config, collector, source):
+    """
+    Writes the Markdown files, then updates them every time the repository
+    changes, until interrupted. The cache re-renders only the chunks whose
+    files changed.
+    """
+    if config.from_git is not None or not os.path.isdir(config.repo_path):
+        print("--watch needs a directory.")
+        sys.exit(1)
+
+    watcher = TreeWatcher(collector, config.watch_interval)
+    try:
+        update_output(config, watcher.root, source, collector, 0)
+        for updated in watcher.updates():
+            update_output(config, watcher.root, source, collector, updated)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def update_output(config, root_node, source, collector, updated):
+    """Writes the Markdown files of a watched tree, reporting failures."""
+    if root_node is None:
+        return
+    if config.dedup:
+        for file_node in root_node.iter_files():
+            file_node.duplicate_of = None
+    try:
+        rendered = write_output(
+            config, root_node, source, collector.class_counts
+        )
+    except RenderException as e:
+        print(f"Failed to render {e.path}: {e.message}")
+        return
+    if rendered is not None:
+        print(f"{updated} files changed, {rendered} chunks rendered")
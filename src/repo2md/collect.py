@@ -1,11 +1,47 @@
+import codecs
 import os
-import pathspec
+import queue
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-from typing import Optional
+from repo2md import (
+    ContentClass,
+    ContentPolicy,
+    Node,
+    NodeType,
+    logger,
+    profiling,
+)
+from repo2md.compact import CompactNode, CompactTree
+from repo2md.ignore import DEFAULT_PATTERNS, IGNORE_FILE_NAMES, IgnoreMatcher
+from repo2md.sources import (
+    GitSource,
+    Source,
+    TarSource,
+    archive_source,
+    open_source,
+)
 
-from repo2md import Node, NodeType, logger
+# Number of bytes read from the start of a file to classify its content.
+SNIFF_SIZE = 8 * 1024
 
-IGNORE_FILE_NAMES = [".repo2md_ignore", ".gitignore"]
+# Number of directories per scan worker that a streaming walk scans ahead
+# of the directory it is at.
+SCAN_AHEAD = 4
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+    content_class: ContentClass = ContentClass.TEXT
+
+
+class DirListing(NamedTuple):
+    files: List[FileEntry]
+    subdirs: List[str]
 
 
 class Collector:
@@ -15,61 +51,97 @@ class Collector:
 
     Attributes:
         root_path (str): The root directory from which the node tree is built.
-        ignore_spec (pathspec.PathSpec): File & directory patterns to ignored.
+        ignore_matcher (IgnoreMatcher): The default patterns and those of
+            the ignore files, matched against root-relative paths.
+        scan_workers (int): Number of threads used to scan directories. Zero
+            or one scans serially on the calling thread.
+        content_policies (Optional[Dict[ContentClass, ContentPolicy]]): How
+            files of each content class are handled. When None, files are
+            not classified and all are rendered in full.
+        huge_file_size (int): Files larger than this are classified as huge;
+            zero disables the check. Also the size huge files are truncated
+            to.
+        class_counts (Counter): Number of files collected per content class,
+            including skipped files.
+        source (Source): Where file contents are read from when rendering;
+            the root path for a working tree.
 
     Methods:
-        read_ignore_file(): Reads ignore patterns from specified ignore files.
         matches_ignore_pattern(path, ignore_patterns): Checks if a given path
             matches any of the ignore patterns.
+        scan_directory(dirpath): Lists the files and subdirectories of a
+            single directory that are not ignored.
         process_directory(dirpath): Processes a directory and its contents,
             creating a Node structure.
+        classify_file(path, size): Sniffs the start of a file to tell text
+            from binary or huge content.
+        classify_head(head, size): Classifies a file from its sniffed start.
+        content_policy(file_entry): Counts a file and returns its policy.
+        body_limit(policy, file_entry): Returns how much of a file's body
+            is rendered.
+        character_boundary(path, limit): Moves a body limit back to the
+            start of a UTF-8 character.
+        scan_tree(): Scans every directory using a bounded thread pool.
+        prefetch_listings(): Scans ahead of building a tree, if at all.
+        add_listing_file(listings, relpath): Adds the directories of a
+            file to listings built from a list of file paths.
         build_node_tree(): Builds the entire node tree from the root path.
+        build_compact_tree(): Builds the same tree in a columnar store.
     """
 
-    def __init__(self, root_path: str):
+    def __init__(
+        self,
+        root_path: str,
+        scan_workers: int = 0,
+        content_policies: Optional[Dict[ContentClass, ContentPolicy]] = None,
+        huge_file_size: int = 0,
+    ):
         """
         Initializes the Collector with a given root path.
 
         Args:
             root_path (str): The root directory path from which the node tree
                 will be built.
+            scan_workers (int): Number of threads used to scan directories.
+            content_policies (Optional[Dict[ContentClass, ContentPolicy]]):
+                How files of each content class are handled; classes that
+                are missing are rendered.
+            huge_file_size (int): Size above which files are huge.
         """
         self.root_path = root_path
-        self.ignore_spec = self.read_ignore_file()
-        logger.debug(f"Ignore patterns: {self.ignore_spec.patterns}")
-
-    def read_ignore_file(self) -> pathspec.PathSpec:
-        """
-        Reads ignore patterns from .repo2md_ignore or .gitignore files located
-        in the root path.
-
-        Returns:
-            pathspec.PathSpec: A PathSpec object with compiled ignore patterns.
-        """
-        patterns = [".git/"]
-
-        for ignore_file_name in IGNORE_FILE_NAMES:
-            ignore_file_path = os.path.join(self.root_path, ignore_file_name)
-            if os.path.exists(ignore_file_path):
-                with open(ignore_file_path, "r") as file:
-                    patterns += file.readlines()
-                break
+        self.scan_workers = scan_workers
+        self.content_policies = content_policies
+        self.huge_file_size = huge_file_size
+        self.class_counts: Counter = Counter()
+        self.source: Source = root_path
+        self.ignore_matcher = IgnoreMatcher()
+        self.ignore_matcher.add_patterns("", DEFAULT_PATTERNS)
+        self.ignore_matcher.load_directory("", self.root_path)
 
-        logger.debug(f"Compiled patterns: {patterns}")
-        return pathspec.PathSpec.from_lines("gitwildmatch", patterns)
-
-    def matches_ignore_pattern(self, path: str) -> bool:
+    def matches_ignore_pattern(self, path: str, is_dir: bool = False) -> bool:
         """
-        Determines if a given path matches any of the ignore patterns.
+        Determines if a given path, or any of its parent directories, matches
+        the ignore patterns.
 
         Args:
-            path (str): The path to check against ignore patterns.
+            path (str): The path to check against ignore patterns. Absolute
+                paths are made relative to the root path; relative paths are
+                taken as already relative to it.
+            is_dir (bool): Whether the path is a directory. A trailing slash
+                on the path has the same effect.
 
         Returns:
             bool: True if the path matches any of the ignore patterns,
                   False otherwise.
         """
-        return self.ignore_spec.match_file(path)
+        if path.endswith("/"):
+            is_dir = True
+        if os.path.isabs(path):
+            path = self.relpath(path)
+        path = path.replace(os.sep, "/").strip("/")
+        if path in ("", "."):
+            return False
+        return self.ignore_matcher.match(path, is_dir)
 
     def relpath(self, path: str) -> str:
         """
@@ -83,59 +155,562 @@ class Collector:
         """
         return os.path.relpath(path, self.root_path)
 
-    def process_directory(self, dirpath: str) -> Optional[Node]:
+    def classify_file(self, path: str, size: int) -> ContentClass:
         """
-        Processes a directory and its contents, creating a Node for the
-        directory.
+        Classifies a file by reading at most SNIFF_SIZE bytes from its start.
 
-        Recursively processes each subdirectory and file within the directory,
-        ignoring those that match the ignore patterns.
+        Files containing NUL bytes or bytes that are not valid UTF-8 are
+        binary; other files larger than ``huge_file_size`` are huge.
 
         Args:
-            dirpath (str): The path of the directory to process.
+            path (str): The path of the file.
+            size (int): The size of the file.
 
         Returns:
-            Optional[Node]: A Node representing the directory and its contents,
-                or None if the directory is ignored.
+            ContentClass: The class of the file's content.
+        """
+        relpath = self.relpath(path)
+        try:
+            with profiling.file_timer("classify", relpath, size):
+                with open_source(self.source, relpath) as file:
+                    head = file.read(SNIFF_SIZE)
+        except OSError as e:
+            logger.warning(f"Error classifying {path}: {e}")
+            return ContentClass.TEXT
+        return self.classify_head(head, size)
+
+    def classify_head(self, head: bytes, size: int) -> ContentClass:
+        """Classifies a file from its first SNIFF_SIZE bytes and its size."""
+        if b"\0" in head:
+            return ContentClass.BINARY
+        try:
+            # Not final: the sniffed block may end inside a character.
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        except UnicodeDecodeError:
+            return ContentClass.BINARY
+
+        if 0 < self.huge_file_size < size:
+            return ContentClass.HUGE
+        return ContentClass.TEXT
+
+    def content_policy(self, file_entry: FileEntry) -> ContentPolicy:
+        """Counts a collected file by class and returns how to handle it."""
+        self.class_counts[file_entry.content_class] += 1
+        if self.content_policies is None:
+            return ContentPolicy.RENDER
+        return self.content_policies.get(
+            file_entry.content_class, ContentPolicy.RENDER
+        )
+
+    def body_limit(
+        self, policy: ContentPolicy, file_entry: FileEntry
+    ) -> Optional[int]:
         """
-        if self.matches_ignore_pattern(dirpath):
+        Returns the body limit of a file: 0 omits the body entirely.
+
+        Binary files are summarized instead of truncated, as their raw bytes
+        would corrupt the output. The limit of a truncated text file is moved
+        back to the start of a UTF-8 character, so the body it keeps stays
+        valid UTF-8.
+        """
+        if policy == ContentPolicy.SUMMARIZE:
+            return 0
+        if policy != ContentPolicy.TRUNCATE:
             return None
+        if file_entry.content_class == ContentClass.BINARY:
+            return 0
+        limit = self.huge_file_size or SNIFF_SIZE
+        if limit < file_entry.size:
+            limit = self.character_boundary(file_entry.path, limit)
+        return limit
 
-        current_node = Node(path=self.relpath(dirpath), type=NodeType.DIR)
+    def character_boundary(self, path: str, limit: int) -> int:
+        """
+        Moves a body limit back to the start of a UTF-8 character, reading
+        the few bytes before it.
+        """
+        start = max(limit - 3, 0)
+        try:
+            with open_source(self.source, self.relpath(path)) as file:
+                if file.seekable():
+                    file.seek(start)
+                else:
+                    skipped = 0
+                    while skipped < start:
+                        block = file.read(min(start - skipped, SNIFF_SIZE))
+                        if not block:
+                            break
+                        skipped += len(block)
+                tail = file.read(limit + 1 - start)
+        except OSError as e:
+            logger.warning(f"Error reading {path}: {e}")
+            return limit
+        while (
+            limit > start
+            and limit - start < len(tail)
+            and tail[limit - start] & 0xC0 == 0x80
+        ):
+            limit -= 1
+        return limit
+
+    def scan_directory(self, dirpath: str) -> DirListing:
+        """
+        Lists the files and subdirectories of a single directory, skipping
+        those that match the ignore patterns.
+
+        File sizes come from the stat data cached on each ``os.DirEntry``,
+        so no additional ``os.path.getsize`` call is made per file. Entries
+        are matched by root-relative path against the ignore rules, after
+        loading any ignore file that lives in the directory itself; ignored
+        subdirectories are never descended into.
+
+        Args:
+            dirpath (str): The path of the directory to scan.
+
+        Returns:
+            DirListing: The non-ignored files (with their stat signature) and
+                subdirectory paths, in ``os.scandir`` order.
+        """
+        listing = DirListing(files=[], subdirs=[])
+        base = self.relpath(dirpath).replace(os.sep, "/")
+        prefix = "" if base == "." else base + "/"
+        match_entry = profiling.timed(
+            "ignore", self.ignore_matcher.match_entry
+        )
         try:
-            for entry in os.scandir(dirpath):
+            with os.scandir(dirpath) as iterator:
+                entries = list(iterator)
+            self.ignore_matcher.load_directory(
+                prefix.rstrip("/"), dirpath, {entry.name for entry in entries}
+            )
+            for entry in entries:
                 if entry.is_dir():
-                    subdir_node = self.process_directory(entry.path)
-                    if subdir_node:
-                        subdir_node.parent = current_node
-                        current_node.dir_children.append(subdir_node)
-                        current_node.dir_count += 1
-                        current_node.size += subdir_node.size
+                    if not match_entry(prefix + entry.name, True):
+                        listing.subdirs.append(entry.path)
                 elif entry.is_file():
-                    if not self.matches_ignore_pattern(entry.path):
-                        file_size = os.path.getsize(entry.path)
-                        file_node = Node(
-                            path=self.relpath(entry.path),
-                            type=NodeType.FILE,
-                            size=file_size,
-                            parent=current_node,
+                    if not match_entry(prefix + entry.name):
+                        stat = entry.stat()
+                        content_class = (
+                            ContentClass.TEXT
+                            if self.content_policies is None
+                            else self.classify_file(entry.path, stat.st_size)
+                        )
+                        listing.files.append(
+                            FileEntry(
+                                entry.path,
+                                stat.st_size,
+                                stat.st_mtime_ns,
+                                stat.st_ino,
+                                content_class,
+                            )
                         )
-                        current_node.file_children.append(file_node)
-                        current_node.size += file_size
-                        current_node.file_count += 1
         except (FileNotFoundError, PermissionError) as e:
             logger.warning(f"Error accessing {dirpath}: {e}")
+        return listing
+
+    def file_node(self, file_entry: FileEntry, parent: Node) -> Optional[Node]:
+        """
+        Creates the node of a collected file, or returns None when its
+        content policy skips it.
+        """
+        policy = self.content_policy(file_entry)
+        if policy == ContentPolicy.SKIP:
+            return None
+        return Node(
+            path=self.relpath(file_entry.path),
+            type=NodeType.FILE,
+            size=file_entry.size,
+            parent=parent,
+            mtime_ns=file_entry.mtime_ns,
+            inode=file_entry.inode,
+            content_class=file_entry.content_class,
+            body_limit=self.body_limit(policy, file_entry),
+        )
+
+    def process_directory(
+        self,
+        dirpath: str,
+        listings: Optional[Dict[str, DirListing]] = None,
+    ) -> Optional[Node]:
+        """
+        Processes a directory and its contents, creating a Node for the
+        directory.
+
+        Recursively processes each subdirectory and file within the directory,
+        ignoring those that match the ignore patterns.
+
+        Args:
+            dirpath (str): The path of the directory to process.
+            listings (Optional[Dict[str, DirListing]]): Directory listings
+                gathered ahead of time by ``scan_tree``. When omitted, each
+                directory is scanned as it is visited.
+
+        Returns:
+            Optional[Node]: A Node representing the directory and its contents,
+                or None if no files remain in it after ignoring.
+        """
+        if listings is None:
+            listing = self.scan_directory(dirpath)
+        else:
+            listing = listings[dirpath]
+
+        current_node = Node(path=self.relpath(dirpath), type=NodeType.DIR)
+        for file_entry in listing.files:
+            file_node = self.file_node(file_entry, current_node)
+            if file_node is None:
+                continue
+            current_node.file_children.append(file_node)
+            current_node.size += file_entry.size
+            current_node.file_count += 1
+
+        for subdir_path in listing.subdirs:
+            subdir_node = self.process_directory(subdir_path, listings)
+            if subdir_node:
+                subdir_node.parent = current_node
+                current_node.dir_children.append(subdir_node)
+                current_node.dir_count += 1
+                current_node.size += subdir_node.size
 
         if current_node.file_count == 0 and current_node.dir_count == 0:
             return None
 
         return current_node
 
+    def scan_tree(self) -> Dict[str, DirListing]:
+        """
+        Scans every non-ignored directory below the root path, fanning the
+        ``os.scandir`` calls out to a pool of ``scan_workers`` threads.
+
+        Scans are handed back through a queue as they complete, so each one
+        is picked up in constant time however many are still running.
+
+        Returns:
+            Dict[str, DirListing]: The listing of every scanned directory,
+                keyed by directory path.
+        """
+        listings: Dict[str, DirListing] = {}
+        completed: queue.SimpleQueue = queue.SimpleQueue()
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+
+            def submit(dirpath: str):
+                future = executor.submit(self.scan_directory, dirpath)
+                future.add_done_callback(
+                    lambda future: completed.put((dirpath, future))
+                )
+
+            submit(self.root_path)
+            pending = 1
+            while pending:
+                dirpath, future = completed.get()
+                pending -= 1
+                listing = future.result()
+                listings[dirpath] = listing
+                for subdir_path in listing.subdirs:
+                    submit(subdir_path)
+                pending += len(listing.subdirs)
+        return listings
+
     def build_node_tree(self) -> Node:
         """
         Builds the entire node tree starting from the root path.
 
+        When ``scan_workers`` is greater than one, directories are scanned
+        concurrently first and then assembled in the same order as a serial
+        walk, so the resulting tree and its rollups are identical.
+
         Returns:
             Node: The root node of the generated node tree.
         """
-        return self.process_directory(self.root_path)
+        return self.process_directory(self.root_path, self.prefetch_listings())
+
+    def add_listing_file(
+        self, listings: Dict[str, DirListing], relpath: str
+    ) -> Tuple[str, str]:
+        """
+        Adds the directories leading to a file to listings built from a list
+        of file paths rather than by scanning, in order of first appearance.
+
+        Args:
+            listings (Dict[str, DirListing]): Listings keyed by directory
+                path, which must contain the root path.
+            relpath (str): The file's root-relative path, with ``/``
+                separators.
+
+        Returns:
+            Tuple[str, str]: The path of the file's directory, whose listing
+                the file should be added to, and the path of the file.
+        """
+        *names, name = relpath.split("/")
+        dirpath = self.root_path
+        for subdir_name in names:
+            subdir_path = os.path.join(dirpath, subdir_name)
+            if subdir_path not in listings:
+                listings[dirpath].subdirs.append(subdir_path)
+                listings[subdir_path] = DirListing(files=[], subdirs=[])
+            dirpath = subdir_path
+        return dirpath, os.path.join(dirpath, name)
+
+    def iter_listings(self) -> Iterator[DirListing]:
+        """
+        Yields the listing of every non-ignored directory in rendering
+        order, scanning each directory when it is reached, so only the paths
+        of directories still to visit are held. With more than one scan
+        worker, the next directories of the walk are scanned ahead of it,
+        see ``scan_ahead``. Collectors that prefetch listings hold them all.
+        """
+        if self.scan_workers > 1:
+            yield from self.scan_ahead()
+            return
+        listings = self.prefetch_listings()
+        stack = [self.root_path]
+        while stack:
+            dirpath = stack.pop()
+            if listings is None:
+                listing = self.scan_directory(dirpath)
+            else:
+                listing = listings.pop(dirpath)
+            yield listing
+            stack.extend(reversed(listing.subdirs))
+
+    def scan_ahead(self) -> Iterator[DirListing]:
+        """
+        Yields the listing of every non-ignored directory in rendering
+        order, while ``scan_workers`` threads scan the top ``SCAN_AHEAD``
+        directories per worker of the stack still to visit. Only listings
+        scanned ahead of the walk are held, instead of the whole tree.
+        """
+        window = SCAN_AHEAD * self.scan_workers
+        scans: Dict[str, Future] = {}
+        stack = [self.root_path]
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            try:
+                while stack:
+                    for dirpath in stack[-window:]:
+                        if dirpath not in scans:
+                            scans[dirpath] = executor.submit(
+                                self.scan_directory, dirpath
+                            )
+                    listing = scans.pop(stack.pop()).result()
+                    yield listing
+                    stack.extend(reversed(listing.subdirs))
+            finally:
+                for future in scans.values():
+                    future.cancel()
+
+    def prefetch_listings(self) -> Optional[Dict[str, DirListing]]:
+        """
+        Returns the listings of all directories scanned ahead of building a
+        tree, or None to scan each directory as it is visited.
+        """
+        return self.scan_tree() if self.scan_workers > 1 else None
+
+    def process_directory_compact(
+        self,
+        dirpath: str,
+        tree: CompactTree,
+        parent: int,
+        listings: Optional[Dict[str, DirListing]] = None,
+    ):
+        """
+        Appends a directory and its contents to a CompactTree, in the same
+        order and with the same rollups as ``process_directory``.
+
+        Args:
+            dirpath (str): The path of the directory to process.
+            tree (CompactTree): The tree to append to.
+            parent (int): Index of the parent directory, -1 for the root.
+            listings (Optional[Dict[str, DirListing]]): Directory listings
+                gathered ahead of time by ``scan_tree``.
+        """
+        if listings is None:
+            listing = self.scan_directory(dirpath)
+        else:
+            listing = listings[dirpath]
+
+        name = "." if parent < 0 else os.path.basename(dirpath)
+        index = tree.add_dir(name, parent)
+        for file_entry in listing.files:
+            policy = self.content_policy(file_entry)
+            if policy == ContentPolicy.SKIP:
+                continue
+            tree.add_file(
+                os.path.basename(file_entry.path),
+                index,
+                file_entry.size,
+                file_entry.mtime_ns,
+                file_entry.inode,
+                file_entry.content_class,
+                self.body_limit(policy, file_entry),
+            )
+
+        for subdir_path in listing.subdirs:
+            self.process_directory_compact(subdir_path, tree, index, listings)
+
+        tree.finish_dir(index)
+
+    def build_compact_tree(self) -> Optional[CompactNode]:
+        """
+        Builds the node tree into a CompactTree, which uses a fraction of the
+        memory of ``Node`` objects on very large repositories.
+
+        Returns:
+            Optional[CompactNode]: A Node-compatible view of the root, or
+                None if no files were found.
+        """
+        tree = CompactTree()
+        listings = self.prefetch_listings()
+        self.process_directory_compact(self.root_path, tree, -1, listings)
+        tree.compact()
+        return tree.root()
+
+
+class GitCollector(Collector):
+    """
+    A Collector that lists the files tracked by git, in the index or in a
+    commit, instead of walking the working tree.
+
+    Files come from ``git ls-tree`` or ``git ls-files`` with their sizes,
+    and are read through a GitSource, so nothing is checked out and no
+    ignore rules are matched: the tracked files are exactly those exported.
+    Files have no modification time, and the start of their blob id stands
+    in for the inode, so the build cache still notices changed content.
+
+    Attributes:
+        source (GitSource): The repository and revision files are read from.
+    """
+
+    def __init__(
+        self,
+        root_path: str,
+        rev: Optional[str] = None,
+        content_policies: Optional[Dict[ContentClass, ContentPolicy]] = None,
+        huge_file_size: int = 0,
+    ):
+        super().__init__(
+            root_path,
+            content_policies=content_policies,
+            huge_file_size=huge_file_size,
+        )
+        self.source = GitSource(root_path, rev)
+
+    def scan_tree(self) -> Dict[str, DirListing]:
+        """
+        Builds the listing of every directory from the files git tracks
+        below the root path, in git's path order.
+        """
+        listings = {self.root_path: DirListing(files=[], subdirs=[])}
+        for git_file in self.source.list_files():
+            dirpath, path = self.add_listing_file(listings, git_file.path)
+            content_class = (
+                ContentClass.TEXT
+                if self.content_policies is None
+                else self.classify_file(path, git_file.size)
+            )
+            listings[dirpath].files.append(
+                FileEntry(
+                    path,
+                    git_file.size,
+                    0,
+                    int(git_file.object_id[:16], 16),
+                    content_class,
+                )
+            )
+        return listings
+
+    def prefetch_listings(self) -> Dict[str, DirListing]:
+        return self.scan_tree()
+
+
+class ArchiveCollector(Collector):
+    """
+    A Collector that reads a zip or tar archive, optionally compressed,
+    without extracting it.
+
+    The tree is built from the archive's member headers in one pass, which
+    also reads the ignore files and the start of each member to classify
+    it. Ignore files apply to their directory in the archive as they would
+    on disk. Directories list their files and subdirectories in archive
+    order, so rendering a tar archive mostly follows the archive.
+
+    Attributes:
+        source (Union[ZipSource, TarSource]): The archive.
+    """
+
+    def __init__(
+        self,
+        root_path: str,
+        content_policies: Optional[Dict[ContentClass, ContentPolicy]] = None,
+        huge_file_size: int = 0,
+    ):
+        super().__init__(
+            root_path,
+            content_policies=content_policies,
+            huge_file_size=huge_file_size,
+        )
+        self.source = archive_source(root_path)
+        if self.source is None:
+            raise ValueError(f"Not a zip or tar archive: {root_path}")
+
+    def scan_tree(self) -> Dict[str, DirListing]:
+        """
+        Builds the listing of every directory from the archive's members
+        that are not ignored.
+        """
+        members = []
+        ignore_files: Dict[Tuple[str, str], List[str]] = {}
+        for member, file in self.source.iter_members():
+            base, _, name = member.path.rpartition("/")
+            if name in IGNORE_FILE_NAMES:
+                content = file.read()
+                lines = content.decode("utf-8", "replace").splitlines(True)
+                ignore_files[base, name] = lines
+                head = content[:SNIFF_SIZE]
+            elif self.content_policies is not None:
+                head = file.read(SNIFF_SIZE)
+            content_class = (
+                ContentClass.TEXT
+                if self.content_policies is None
+                else self.classify_head(head, member.size)
+            )
+            members.append((member, content_class))
+
+        for base in sorted({base for base, _ in ignore_files}):
+            for ignore_file_name in IGNORE_FILE_NAMES:
+                lines = ignore_files.get((base, ignore_file_name))
+                if lines is not None:
+                    self.ignore_matcher.add_patterns(base, lines)
+                    break
+
+        listings = {self.root_path: DirListing(files=[], subdirs=[])}
+        for member, content_class in members:
+            if self.ignore_matcher.match(member.path):
+                continue
+            dirpath, path = self.add_listing_file(listings, member.path)
+            listings[dirpath].files.append(
+                FileEntry(
+                    path,
+                    member.size,
+                    member.mtime_ns,
+                    member.inode,
+                    content_class,
+                )
+            )
+
+        if isinstance(self.source, TarSource):
+            self.source.order = self.rendering_order(listings)
+        return listings
+
+    def rendering_order(self, listings: Dict[str, DirListing]):
+        """Numbers the files of listings in the order they are rendered."""
+        order: Dict[str, int] = {}
+        stack = [self.root_path]
+        while stack:
+            listing = listings[stack.pop()]
+            for file_entry in listing.files:
+                path = self.relpath(file_entry.path).replace(os.sep, "/")
+                order[path] = len(order)
+            stack.extend(reversed(listing.subdirs))
+        return order
+
+    def prefetch_listings(self) -> Dict[str, DirListing]:
+        return self.scan_tree()
@@ -0,0 +1,339 @@
+import os
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+from repo2md import ContentClass, FilePart, Node, NodeType
+
+
+class CompactTree:
+    """
+    A columnar store for a node tree, using a few bytes per entry instead of
+    a ``Node`` dataclass per file.
+
+    Entries are stored in depth-first order with each directory followed by
+    its files and then by the subtrees of its subdirectories, so the files
+    of a directory are contiguous and a subtree spans ``[index, end)``. Path
+    components are interned into a single UTF-8 buffer and full paths are
+    rebuilt from parent indices on demand.
+
+    Attributes:
+        name_data (bytearray): Interned path components, back to back.
+        name_offsets (array): Start of each component in ``name_data``,
+            followed by the end of the last one.
+        name_ids (Optional[Dict[str, int]]): Lookup table used while
+            building; released by ``compact``.
+        name (array): Component index of each entry.
+        parent (array): Parent entry index, -1 for the root.
+        kind (bytearray): 1 for files, 0 for directories.
+        size (array): File size, or rolled-up size for directories.
+        end (array): One past the last entry of the subtree.
+        file_count (array): Number of direct file children.
+        dir_count (array): Number of direct directory children.
+        mtime_ns (array): Modification time of files.
+        inode (array): Inode number of files.
+        duplicate_of (Dict[int, str]): Path of the original of each file
+            that is a duplicate, by entry index.
+        content_class (Dict[int, ContentClass]): Class of each file that is
+            not plain text, by entry index.
+        body_limit (Dict[int, int]): Body limit of each file that is not
+            rendered in full, by entry index.
+    """
+
+    def __init__(self):
+        self.name_data = bytearray()
+        self.name_offsets = array("Q", [0])
+        self.name_ids: Optional[Dict[str, int]] = {}
+        self.name = array("i")
+        self.parent = array("i")
+        self.kind = bytearray()
+        self.size = array("q")
+        self.end = array("i")
+        self.file_count = array("i")
+        self.dir_count = array("i")
+        self.mtime_ns = array("q")
+        self.inode = array("Q")
+        self.duplicate_of: Dict[int, str] = {}
+        self.content_class: Dict[int, ContentClass] = {}
+        self.body_limit: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self.kind)
+
+    def intern(self, name: str) -> int:
+        if self.name_ids is None:
+            self.name_ids = {
+                self.component(name_id): name_id
+                for name_id in range(len(self.name_offsets) - 1)
+            }
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.name_offsets) - 1
+            self.name_data += name.encode("utf-8", "surrogateescape")
+            self.name_offsets.append(len(self.name_data))
+        return name_id
+
+    def component(self, name_id: int) -> str:
+        offsets = self.name_offsets
+        start, end = offsets[name_id], offsets[name_id + 1]
+        return self.name_data[start:end].decode("utf-8", "surrogateescape")
+
+    def compact(self):
+        """Releases the lookup table that is only needed while building."""
+        self.name_ids = None
+
+    def append(self, name: str, parent: int, is_file: bool) -> int:
+        index = len(self.kind)
+        self.name.append(self.intern(name))
+        self.parent.append(parent)
+        self.kind.append(1 if is_file else 0)
+        self.size.append(0)
+        self.end.append(index + 1)
+        self.file_count.append(0)
+        self.dir_count.append(0)
+        self.mtime_ns.append(0)
+        self.inode.append(0)
+        return index
+
+    def add_dir(self, name: str, parent: int = -1) -> int:
+        """
+        Appends a directory. Its files must be added next, followed by its
+        subdirectories, and then ``finish_dir`` must be called.
+        """
+        return self.append(name, parent, False)
+
+    def add_file(
+        self,
+        name: str,
+        parent: int,
+        size: int,
+        mtime_ns=0,
+        inode=0,
+        content_class=ContentClass.TEXT,
+        body_limit: Optional[int] = None,
+    ) -> int:
+        index = self.append(name, parent, True)
+        self.size[index] = size
+        self.mtime_ns[index] = mtime_ns
+        self.inode[index] = inode
+        if content_class != ContentClass.TEXT:
+            self.content_class[index] = content_class
+        if body_limit is not None:
+            self.body_limit[index] = body_limit
+        self.size[parent] += size
+        self.file_count[parent] += 1
+        return index
+
+    def finish_dir(self, index: int) -> bool:
+        """
+        Closes a directory once its whole subtree was appended, rolling it up
+        into its parent. Empty directories are removed again.
+
+        Returns:
+            bool: False if the directory was empty and removed.
+        """
+        if self.file_count[index] == 0 and self.dir_count[index] == 0:
+            self.truncate(index)
+            return False
+
+        self.end[index] = len(self.kind)
+        parent = self.parent[index]
+        if parent >= 0:
+            self.size[parent] += self.size[index]
+            self.dir_count[parent] += 1
+        return True
+
+    def truncate(self, length: int):
+        for column in (
+            self.name,
+            self.parent,
+            self.kind,
+            self.size,
+            self.end,
+            self.file_count,
+            self.dir_count,
+            self.mtime_ns,
+            self.inode,
+        ):
+            del column[length:]
+
+    def path(self, index: int) -> str:
+        parts = []
+        while index >= 0:
+            parts.append(self.component(self.name[index]))
+            index = self.parent[index]
+        if len(parts) > 1:
+            parts.pop()
+        return os.sep.join(reversed(parts))
+
+    def root(self) -> Optional["CompactNode"]:
+        return CompactNode(self, 0) if len(self) else None
+
+
+class CompactNode:
+    """
+    A ``Node``-compatible view of one entry of a ``CompactTree``, so the
+    splitter and renderer can run on compact trees unchanged. Views are
+    created on access and hold no data besides an optional parent override,
+    which is set when a view is attached to a regular ``Node`` tree.
+    """
+
+    __slots__ = ("tree", "index", "_parent")
+
+    def __init__(self, tree: CompactTree, index: int):
+        self.tree = tree
+        self.index = index
+        self._parent = None
+
+    def __repr__(self):
+        return f"{self.path} [{self.type.value}]"
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, CompactNode)
+            and other.tree is self.tree
+            and other.index == self.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __reduce_ex__(self, protocol):
+        # Pickle files as plain nodes, so sending a chunk to a worker process
+        # does not copy the whole tree along with it.
+        if self.is_file:
+            node = self.to_node()
+            return Node, (node.path,), vars(node)
+        return CompactNode, (self.tree, self.index)
+
+    def __iter__(self):
+        yield from self.file_children
+        yield from self.dir_children
+
+    @property
+    def path(self) -> str:
+        return self.tree.path(self.index)
+
+    @property
+    def type(self) -> NodeType:
+        return NodeType.FILE if self.tree.kind[self.index] else NodeType.DIR
+
+    @property
+    def size(self) -> int:
+        return self.tree.size[self.index]
+
+    @property
+    def file_count(self) -> int:
+        return self.tree.file_count[self.index]
+
+    @property
+    def dir_count(self) -> int:
+        return self.tree.dir_count[self.index]
+
+    @property
+    def mtime_ns(self) -> int:
+        return self.tree.mtime_ns[self.index]
+
+    @property
+    def inode(self) -> int:
+        return self.tree.inode[self.index]
+
+    @property
+    def duplicate_of(self) -> Optional[str]:
+        return self.tree.duplicate_of.get(self.index)
+
+    @duplicate_of.setter
+    def duplicate_of(self, value: Optional[str]):
+        if value is None:
+            self.tree.duplicate_of.pop(self.index, None)
+        else:
+            self.tree.duplicate_of[self.index] = value
+
+    @property
+    def duplicate_chunk(self) -> Optional[int]:
+        return None
+
+    @property
+    def content_class(self) -> ContentClass:
+        return self.tree.content_class.get(self.index, ContentClass.TEXT)
+
+    @property
+    def body_limit(self) -> Optional[int]:
+        return self.tree.body_limit.get(self.index)
+
+    @property
+    def part(self) -> Optional[FilePart]:
+        return None
+
+    @property
+    def file_children(self) -> List["CompactNode"]:
+        start = self.index + 1
+        return [
+            CompactNode(self.tree, index)
+            for index in range(start, start + self.file_count)
+        ]
+
+    @property
+    def dir_children(self) -> List["CompactNode"]:
+        return [CompactNode(self.tree, index) for index in self.dir_indices()]
+
+    def dir_indices(self) -> Iterator[int]:
+        end = self.tree.end
+        index = self.index + 1 + self.file_count
+        while index < end[self.index]:
+            yield index
+            index = end[index]
+
+    @property
+    def parent(self):
+        if self._parent is not None:
+            return self._parent
+        parent = self.tree.parent[self.index]
+        return CompactNode(self.tree, parent) if parent >= 0 else None
+
+    @parent.setter
+    def parent(self, value):
+        self._parent = value
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.basename)[-1]
+
+    @property
+    def basename(self):
+        return self.tree.component(self.tree.name[self.index])
+
+    @property
+    def is_dir(self):
+        return self.tree.kind[self.index] == 0
+
+    @property
+    def is_file(self):
+        return self.tree.kind[self.index] == 1
+
+    def iter_files(self):
+        if self.is_file:
+            return
+        yield from self.file_children
+        for index in self.dir_indices():
+            yield from CompactNode(self.tree, index).iter_files()
+
+    def detach(self) -> "CompactNode":
+        return CompactNode(self.tree, self.index)
+
+    def to_node(self) -> Node:
+        """Materialises the subtree as regular ``Node`` objects."""
+        node = Node(
+            path=self.path,
+            type=self.type,
+            size=self.size,
+            file_count=self.file_count,
+            dir_count=self.dir_count,
+            mtime_ns=self.mtime_ns,
+            inode=self.inode,
+            duplicate_of=self.duplicate_of,
+            content_class=self.content_class,
+            body_limit=self.body_limit,
+        )
+        for child in self:
+            node.add_child(child.to_node())
+        return node
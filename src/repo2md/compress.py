@@ -0,0 +1,127 @@
+import gzip
+import io
+import lzma
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Size of the blocks compressed as independent gzip members.
+BLOCK_SIZE = 1024 * 1024
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+XZ_PRESET = 6
+
+SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+    "xz": ".xz",
+}
+
+
+def check_method(method: Optional[str]):
+    """
+    Raises ValueError if output cannot be compressed with method, so runs
+    fail before anything is rendered.
+    """
+    if method is not None and method not in SUFFIXES:
+        raise ValueError(f"Unknown compression: {method}")
+    if method == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package.")
+
+
+def compressed_name(name: str, method: Optional[str]) -> str:
+    """Appends the suffix of a compression method to a file name."""
+    return name + SUFFIXES[method] if method else name
+
+
+def default_threads() -> int:
+    return os.cpu_count() or 1
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Writes a gzip file as a series of independent members, one for every
+    BLOCK_SIZE bytes written, compressed by a pool of threads like pigz
+    does. Any gzip reader decompresses the members back to back.
+
+    Members are written in order, and blocks only depend on the bytes
+    written, so the file is identical for any number of threads. At most
+    two blocks per thread are held in memory.
+    """
+
+    def __init__(self, file: BinaryIO, threads: int = 0):
+        super().__init__()
+        self.file = file
+        self.threads = threads or default_threads()
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self.submit(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+        return len(data)
+
+    def submit(self, block: bytes):
+        self.pending.append(
+            self.executor.submit(gzip.compress, block, GZIP_LEVEL, mtime=0)
+        )
+        while len(self.pending) > 2 * self.threads:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self.buffer or not self.pending:
+                self.submit(bytes(self.buffer))
+                self.buffer.clear()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.file.close()
+            super().close()
+
+
+def open_output(
+    path: str, method: Optional[str] = None, threads: int = 0
+) -> BinaryIO:
+    """
+    Opens an output file for binary writing, compressed with method unless
+    it is None.
+
+    Args:
+        path (str): The path of the file, including any suffix.
+        method (Optional[str]): ``gzip``, ``zstd``, ``xz`` or None.
+        threads (int): Threads used by gzip and zstd; zero uses one per
+            CPU. xz always compresses on the calling thread.
+
+    Raises:
+        ValueError: If the method is unknown or zstd is not installed.
+    """
+    if method is None:
+        return open(path, "wb")
+    if method == "gzip":
+        return ParallelGzipWriter(open(path, "wb"), threads)
+    if method == "xz":
+        return lzma.open(path, "wb", preset=XZ_PRESET)
+    check_method(method)
+    if method == "zstd":
+        compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL, threads=threads or default_threads()
+        )
+        return compressor.stream_writer(open(path, "wb"))
+    raise ValueError(f"Unknown compression: {method}")
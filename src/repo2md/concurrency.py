@@ -0,0 +1,72 @@
+from concurrent.futures import (
+    FIRST_EXCEPTION,
+    ProcessPoolExecutor,
+    wait,
+)
+from typing import Iterable, List, Optional, Tuple
+
+from repo2md import Node, emit, logger, render_markdown
+from repo2md.sources import Source
+
+
+def render_chunks(
+    chunks: Iterable[Tuple[int, Node]],
+    output_directory: str,
+    source: Source = ".",
+    jobs: int = 1,
+    nav: emit.Navigation = emit.Navigation.DIRECTORY,
+    compress: Optional[str] = None,
+) -> List[str]:
+    """
+    Renders chunks into their Markdown files, using a pool of jobs worker
+    processes when jobs is greater than one.
+
+    Every chunk is written to its own file by exactly one worker, so the
+    output does not depend on the number of jobs or on the order in which
+    workers finish. The first failure cancels the chunks that have not
+    started and is re-raised; a ``RenderException`` names the file that
+    could not be rendered.
+
+    Args:
+        chunks (Iterable[Tuple[int, Node]]): ``(index, node)`` pairs of the
+            output root nodes to render.
+        output_directory (str): Directory the Markdown files are written to.
+        source (Source): What the node paths are relative to.
+        jobs (int): Number of worker processes.
+        nav (emit.Navigation): What the PREV/NEXT links point to.
+        compress (Optional[str]): Compression of the Markdown files.
+
+    Returns:
+        List[str]: The paths of the Markdown files, in the order of chunks.
+    """
+    chunks = list(chunks)
+    if jobs <= 1 or len(chunks) <= 1:
+        return [
+            render_markdown(
+                node, output_directory, index, source, nav, compress
+            )
+            for index, node in chunks
+        ]
+
+    workers = min(jobs, len(chunks))
+    logger.debug("Rendering %d chunks with %d processes", len(chunks), workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                render_markdown,
+                node,
+                output_directory,
+                index,
+                source,
+                nav,
+                compress,
+            )
+            for index, node in chunks
+        ]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
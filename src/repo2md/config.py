@@ -1,6 +1,6 @@
 import logging
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Tuple
 
 SYNTAX_MAP = {
     "": "text",
@@ -20,10 +20,33 @@ class Config:
     _instance: Optional["Config"] = None
 
     repo_path: str = "."
+    from_git: Optional[str] = None
     max_size: int = 512 * 1024 * 1024
     max_files: int = 10
+    compress: Optional[str] = None
+    max_tokens: int = 0
+    tokenizer: str = "bytes"
     dry_run: bool = False
     list_largest: int = 0
+    scan_workers: int = 0
+    async_io: int = 0
+    jobs: int = 1
+    pack: bool = False
+    split_large_files: bool = False
+    dedup: bool = False
+    normalize_newlines: bool = False
+    binary_files: str = "summarize"
+    huge_files: str = "truncate"
+    huge_size: int = 0
+    nav: str = "directory"
+    cache: bool = True
+    stats: bool = False
+    write_plan: Optional[str] = None
+    plan: Optional[str] = None
+    shard: Tuple[int, int] = (1, 1)
+    watch: bool = False
+    watch_interval: float = 0.5
+    profile: Optional[str] = None
     verbose: bool = False
     quiet: bool = False
     logger: logging.Logger = None
@@ -0,0 +1,69 @@
+import hashlib
+from collections import defaultdict
+from typing import Dict, List
+
+from repo2md import Node, emit, logger
+from repo2md.sources import Source, open_source
+
+HASH_NAME = "blake2b"
+
+
+def file_digest(path: str, source: Source = ".") -> bytes:
+    """Hashes the content of a file without reading it into memory."""
+    with open_source(source, path) as file:
+        return hashlib.file_digest(file, HASH_NAME).digest()
+
+
+def saves_bytes(node: Node, original: Node) -> bool:
+    """Whether a reference to original is shorter than the file's body."""
+    fenced_size = (
+        len(emit.fence_open(node))
+        + emit.body_size(node)
+        + len(emit.fence_close(node))
+    )
+    return len(emit.duplicate_reference(original.path)) < fenced_size
+
+
+def deduplicate(root_node: Node, source: Source = ".") -> List[Node]:
+    """
+    Marks files whose content is identical to an earlier file, so they are
+    rendered as a reference to it instead of in full.
+
+    Files are grouped by size first and only files sharing their size with
+    another file are hashed, so files of a unique size are never read. The
+    first file of a set of identical files, in rendering order, is kept;
+    later copies get its path as ``duplicate_of``. Copies are left alone
+    when the reference would not be shorter than the file itself.
+
+    Args:
+        root_node (Node): The root of the tree to deduplicate.
+        source (Source): What the node paths are relative to.
+
+    Returns:
+        List[Node]: The file nodes that were marked as duplicates.
+    """
+    by_size: Dict[int, List[Node]] = defaultdict(list)
+    for file_node in root_node.iter_files():
+        if file_node.size > 0:
+            by_size[file_node.size].append(file_node)
+
+    duplicates = []
+    for file_nodes in by_size.values():
+        if len(file_nodes) < 2:
+            continue
+
+        originals: Dict[bytes, Node] = {}
+        for file_node in file_nodes:
+            try:
+                digest = file_digest(file_node.path, source)
+            except OSError as e:
+                logger.warning(f"Not deduplicating {file_node.path}: {e}")
+                continue
+
+            original = originals.setdefault(digest, file_node)
+            if original is not file_node and saves_bytes(file_node, original):
+                file_node.duplicate_of = original.path
+                duplicates.append(file_node)
+
+    logger.debug("Found %d duplicate files", len(duplicates))
+    return duplicates
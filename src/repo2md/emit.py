@@ -0,0 +1,238 @@
+from enum import Enum
+from typing import Callable, Optional
+
+from repo2md import SYNTAX_MAP, slugify
+
+# The exact bytes of every piece of markup in a rendered Markdown file. The
+# renderer writes them and the splitter measures them, so the size predicted
+# for a chunk is the size of the file that gets written.
+
+TOC_INDENT = b"    "
+PAGE_BREAK = b"\n\\newpage\n\n"
+NAV_TOC = b"[TOC](#table-of-contents) | "
+FENCE_CLOSE = b"\n```"
+
+
+class Navigation(str, Enum):
+    """What the PREV/NEXT links of a file section point to."""
+
+    # Neighbours within the file's directory, numbered per directory.
+    DIRECTORY = "directory"
+    # Neighbours in the whole output file, by their header anchors.
+    GLOBAL = "global"
+
+
+def syntax_type(node) -> str:
+    return SYNTAX_MAP.get(node.extension, node.extension)
+
+
+def toc_dir_entry(node, indent: int) -> bytes:
+    """TOC line of a directory; the root directory "." has none."""
+    if node.basename == ".":
+        return b""
+    return TOC_INDENT * indent + f"* {node.basename}\n".encode()
+
+
+def chunk_file_name(index: int) -> str:
+    """Name of the Markdown file of the chunk at index, uncompressed."""
+    return f"output_{index}.md"
+
+
+def part_anchor(path: str, index: int) -> str:
+    """
+    Anchor of the header of part index of a split file. The first part
+    keeps the file's own anchor, so links to the file lead to its start.
+    """
+    anchor = slugify(path)
+    return anchor if index == 1 else f"{anchor}-part-{index}"
+
+
+def file_anchor(node) -> str:
+    """Anchor of the header of a file section."""
+    if node.part is None:
+        return slugify(node.path)
+    return part_anchor(node.path, node.part.index)
+
+
+def file_title(node) -> str:
+    """Name of a file in its TOC entry and header."""
+    if node.part is None:
+        return node.basename
+    return f"{node.basename} (part {node.part.index} of {node.part.count})"
+
+
+def toc_file_entry(node, indent: int) -> bytes:
+    link = file_anchor(node)
+    return TOC_INDENT * indent + f"* [{file_title(node)}](#{link})\n".encode()
+
+
+def file_header(node) -> bytes:
+    link = file_anchor(node)
+    return PAGE_BREAK + f"## {file_title(node)} {{#{link}}}\n".encode()
+
+
+def directory_anchor(index: int) -> str:
+    """Anchor used by per-directory PREV/NEXT links."""
+    return f"file-{index}"
+
+
+def navigation_links(
+    prev_anchor: Optional[str], next_anchor: Optional[str]
+) -> bytes:
+    nav_links = NAV_TOC
+    if prev_anchor:
+        nav_links += f"[PREV](#{prev_anchor}) | ".encode()
+    else:
+        nav_links += b"PREV | "
+    if next_anchor:
+        nav_links += f"[NEXT](#{next_anchor})\n\n".encode()
+    else:
+        nav_links += b"NEXT\n\n"
+    return nav_links
+
+
+def part_link(path: str, part, index: int) -> str:
+    """Link to part index of the file a part belongs to, in its chunk."""
+    chunk = chunk_file_name(part.first_chunk + index - 1)
+    return f"{chunk}#{part_anchor(path, index)}"
+
+
+def part_links(node) -> bytes:
+    """
+    Links from a part of a split file to the previous and next parts, which
+    are in the neighbouring chunks; nothing for a whole file.
+    """
+    part = node.part
+    if part is None:
+        return b""
+    links = f"Part {part.index} of {part.count}"
+    if part.index > 1:
+        previous = part_link(node.path, part, part.index - 1)
+        links += f" | [previous part]({previous})"
+    if part.index < part.count:
+        links += (
+            f" | [next part]({part_link(node.path, part, part.index + 1)})"
+        )
+    return f"{links}\n\n".encode()
+
+
+def is_summarized(node) -> bool:
+    return node.body_limit == 0
+
+
+def is_truncated(node) -> bool:
+    return node.body_limit is not None and 0 < node.body_limit < node.size
+
+
+def is_fenced(node) -> bool:
+    return (
+        not node.duplicate_of
+        and not is_summarized(node)
+        and syntax_type(node) != "markdown"
+    )
+
+
+def fence_open(node) -> bytes:
+    return f"```{syntax_type(node)}\n".encode() if is_fenced(node) else b""
+
+
+def fence_close(node) -> bytes:
+    return FENCE_CLOSE if is_fenced(node) else b""
+
+
+def duplicate_reference(
+    original_path: str, chunk: Optional[int] = None
+) -> bytes:
+    """
+    Body written in place of a file identical to an earlier one. The link
+    names the file of the original's chunk when that is another chunk.
+    """
+    link = f"#{slugify(original_path)}"
+    if chunk is not None:
+        link = chunk_file_name(chunk) + link
+    return f"Identical to [{original_path}]({link})".encode()
+
+
+def reference_growth(
+    original_path: str, chunk: int, measure: Callable[[bytes], int] = len
+) -> int:
+    """
+    Bytes a duplicate reference grows by when the original is in the chunk
+    at index rather than in the duplicate's own chunk.
+    """
+    return measure(duplicate_reference(original_path, chunk)) - measure(
+        duplicate_reference(original_path)
+    )
+
+
+def summary(node) -> bytes:
+    """Body written in place of a file whose content is left out."""
+    content_class = node.content_class.value.lower()
+    return (
+        f"_{content_class} file of {node.size} bytes, not rendered_".encode()
+    )
+
+
+def truncation_note(node) -> bytes:
+    """Written after the part of the body a truncated file keeps."""
+    omitted = node.size - node.body_limit
+    return f"\n[... {omitted} more bytes not rendered]".encode()
+
+
+def body_size(node) -> int:
+    """Number of bytes the body of a file contributes."""
+    if node.duplicate_of:
+        return len(
+            duplicate_reference(node.duplicate_of, node.duplicate_chunk)
+        )
+    if is_summarized(node):
+        return len(summary(node))
+    if is_truncated(node):
+        return node.body_limit + len(truncation_note(node))
+    return node.size
+
+
+def file_section_size(node, indent: int = 0) -> int:
+    """
+    Size of a file's TOC entry and section when it has no PREV/NEXT
+    neighbours; links to neighbours are accounted for by the caller.
+    """
+    return (
+        len(toc_file_entry(node, indent))
+        + len(file_header(node))
+        + len(navigation_links(None, None))
+        + len(part_links(node))
+        + len(fence_open(node))
+        + body_size(node)
+        + len(fence_close(node))
+    )
+
+
+def link_growth(
+    prev_anchor: str, next_anchor: str, measure: Callable[[bytes], int] = len
+) -> int:
+    """
+    Bytes added to the PREV/NEXT links when a file is appended after
+    another: the new file's PREV link to prev_anchor, and the NEXT link to
+    next_anchor the previous file gains. The two halves of the links are
+    independent, so this does not depend on the previous file's own PREV.
+    Another measure than len counts something else, such as tokens.
+    """
+    growth = measure(navigation_links(prev_anchor, next_anchor)) - measure(
+        navigation_links(None, None)
+    )
+    return max(growth, 0)
+
+
+def directory_link_size(
+    index: int, measure: Callable[[bytes], int] = len
+) -> int:
+    """
+    Bytes added by PREV/NEXT links when a file is appended as the file at
+    index of its directory, in Navigation.DIRECTORY mode.
+    """
+    if index == 0:
+        return 0
+    return link_growth(
+        directory_anchor(index - 1), directory_anchor(index), measure
+    )
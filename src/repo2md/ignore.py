@@ -0,0 +1,193 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from pathspec.patterns.gitignore.spec import GitIgnoreSpecPattern
+except ImportError:  # pragma: no cover - pathspec < 1.0
+    from pathspec.patterns import GitWildMatchPattern as GitIgnoreSpecPattern
+
+from repo2md import logger
+
+IGNORE_FILE_NAMES = [".repo2md_ignore", ".gitignore"]
+DEFAULT_PATTERNS = [".git/", "/repo2md_output/"]
+
+GLOB_CHARS = frozenset("*?[\\")
+EXTENSION_PATTERN = re.compile(r"^\*(\.[^*?\[\]\\/]+)$")
+
+
+class IgnoreRules:
+    """
+    The patterns of a single ignore file, bucketed so that most checks are
+    dictionary lookups instead of regular expression matches.
+
+    Git semantics are preserved: the last matching pattern wins, so each
+    bucket maps to the highest pattern index that matches, and the general
+    regular expressions are only tried when they could beat the best index
+    found by the lookups.
+
+    Attributes:
+        names (Dict[str, int]): Literal basenames, e.g. ``Cargo.lock``.
+        dir_names (Dict[str, int]): Literal directory-only basenames, e.g.
+            ``node_modules/``.
+        extensions (Dict[str, int]): Basename suffixes, e.g. ``*.log``.
+        dir_extensions (Dict[str, int]): Directory-only basename suffixes.
+        regexes (List[Tuple[int, re.Pattern]]): Everything else, compiled
+            once, in descending pattern order.
+        negated (List[bool]): Whether the pattern at each index is a ``!``
+            negation.
+    """
+
+    def __init__(self, lines: Iterable[str]):
+        self.names: Dict[str, int] = {}
+        self.dir_names: Dict[str, int] = {}
+        self.extensions: Dict[str, int] = {}
+        self.dir_extensions: Dict[str, int] = {}
+        self.regexes: List[Tuple[int, re.Pattern]] = []
+        self.negated: List[bool] = []
+
+        for line in lines:
+            self.add_pattern(line)
+
+    def __len__(self):
+        return len(self.negated)
+
+    def add_pattern(self, line: str):
+        line = line.rstrip("\n").rstrip(" ")
+        if not line or line.startswith("#"):
+            return
+
+        negated = line.startswith("!")
+        pattern = line[1:] if negated else line
+        dir_only = pattern.endswith("/")
+        stem = pattern.rstrip("/")
+        if not stem:
+            return
+
+        index = len(self.negated)
+        if "/" not in stem and not GLOB_CHARS.intersection(stem):
+            bucket = self.dir_names if dir_only else self.names
+            bucket[stem] = index
+        elif "/" not in stem and EXTENSION_PATTERN.match(stem):
+            bucket = self.dir_extensions if dir_only else self.extensions
+            bucket[stem[1:]] = index
+        else:
+            regex, include = GitIgnoreSpecPattern.pattern_to_regex(pattern)
+            if include is None:
+                return
+            self.regexes.insert(0, (index, re.compile(regex)))
+        self.negated.append(negated)
+
+    def match(self, relpath: str, is_dir: bool) -> Optional[bool]:
+        """
+        Checks a path relative to the directory holding the ignore file.
+
+        Returns:
+            Optional[bool]: True if ignored, False if re-included by a
+                negation, or None if no pattern matches.
+        """
+        basename = relpath.rpartition("/")[2]
+        best = self.names.get(basename, -1)
+        if is_dir:
+            best = max(best, self.dir_names.get(basename, -1))
+
+        if self.extensions or self.dir_extensions:
+            dot = basename.find(".")
+            while dot != -1:
+                suffix = basename[dot:]
+                best = max(best, self.extensions.get(suffix, -1))
+                if is_dir:
+                    best = max(best, self.dir_extensions.get(suffix, -1))
+                dot = basename.find(".", dot + 1)
+
+        if self.regexes:
+            candidate = relpath + "/" if is_dir else relpath
+            for index, regex in self.regexes:
+                if index < best:
+                    break
+                if regex.match(candidate):
+                    best = index
+                    break
+
+        if best < 0:
+            return None
+        return not self.negated[best]
+
+
+class IgnoreMatcher:
+    """
+    Matches root-relative, ``/``-separated paths against the ignore files
+    of the repository, including nested ignore files at any depth.
+
+    As in git, rules from an ignore file apply to paths below its directory
+    and rules from deeper files take precedence over shallower ones.
+
+    Attributes:
+        rules (Dict[str, IgnoreRules]): Rules keyed by the root-relative
+            directory of their ignore file (``""`` for the root).
+    """
+
+    def __init__(self):
+        self.rules: Dict[str, IgnoreRules] = {}
+        self.loaded: Set[str] = set()
+
+    def add_patterns(self, base: str, lines: Iterable[str]):
+        rules = self.rules.get(base) or IgnoreRules([])
+        for line in lines:
+            rules.add_pattern(line)
+        if len(rules):
+            self.rules[base] = rules
+
+    def load_directory(self, base: str, dirpath: str, names=None):
+        """
+        Loads the first ignore file found in a directory, once.
+
+        Args:
+            base (str): Root-relative directory (``""`` for the root).
+            dirpath (str): Path of the directory on disk.
+            names (Optional[Set[str]]): Entry names of the directory when
+                already listed, which avoids probing the filesystem.
+        """
+        if base in self.loaded:
+            return
+        self.loaded.add(base)
+
+        for ignore_file_name in IGNORE_FILE_NAMES:
+            if names is not None and ignore_file_name not in names:
+                continue
+            ignore_file_path = os.path.join(dirpath, ignore_file_name)
+            try:
+                with open(ignore_file_path, "r") as file:
+                    lines = file.readlines()
+            except OSError:
+                continue
+            logger.debug("Ignore file %s: %s", ignore_file_path, lines)
+            self.add_patterns(base, lines)
+            break
+
+    def match_entry(self, relpath: str, is_dir: bool = False) -> bool:
+        """
+        Checks a single path, assuming none of its parent directories are
+        ignored (which holds during a walk that prunes ignored directories).
+        """
+        base = relpath
+        while base:
+            base = base.rpartition("/")[0]
+            rules = self.rules.get(base)
+            if rules is not None:
+                result = rules.match(
+                    relpath[len(base) + 1 :] if base else relpath, is_dir
+                )
+                if result is not None:
+                    return result
+        return False
+
+    def match(self, relpath: str, is_dir: bool = False) -> bool:
+        """
+        Checks a path and each of its parent directories.
+        """
+        parts = relpath.split("/")
+        for end in range(1, len(parts)):
+            if self.match_entry("/".join(parts[:end]), True):
+                return True
+        return self.match_entry(relpath, is_dir)
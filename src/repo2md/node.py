@@ -1,6 +1,6 @@
 import os
 from enum import Enum
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from typing import List, Optional
 
 
@@ -9,6 +9,39 @@ class NodeType(str, Enum):
     DIR = "DIR"
 
 
+class ContentClass(str, Enum):
+    TEXT = "TEXT"
+    BINARY = "BINARY"
+    HUGE = "HUGE"
+
+
+class ContentPolicy(str, Enum):
+    RENDER = "render"
+    SKIP = "skip"
+    SUMMARIZE = "summarize"
+    TRUNCATE = "truncate"
+
+
+@dataclass(frozen=True)
+class FilePart:
+    """
+    A part of a file too large for a chunk, which is split across
+    consecutive chunks with one part in each.
+
+    Attributes:
+        index (int): The number of the part, from 1.
+        count (int): The number of parts of the file.
+        offset (int): Where the part starts in the file, in bytes.
+        first_chunk (int): The chunk of the first part; part ``index`` is in
+            chunk ``first_chunk + index - 1``.
+    """
+
+    index: int
+    count: int
+    offset: int
+    first_chunk: int
+
+
 @dataclass
 class Node:
     path: str
@@ -19,6 +52,13 @@ class Node:
     file_children: List["Node"] = field(default_factory=list)
     dir_children: List["Node"] = field(default_factory=list)
     parent: Optional["Node"] = None
+    mtime_ns: int = 0
+    inode: int = 0
+    duplicate_of: Optional[str] = None
+    duplicate_chunk: Optional[int] = None
+    content_class: ContentClass = ContentClass.TEXT
+    body_limit: Optional[int] = None
+    part: Optional[FilePart] = None
 
     def __repr__(self):
         return f"{self.path} [{self.type.value}]"
@@ -27,6 +67,12 @@ class Node:
         yield from self.file_children
         yield from self.dir_children
 
+    def iter_files(self):
+        """Yields the file nodes below this node in rendering order."""
+        yield from self.file_children
+        for dir_node in self.dir_children:
+            yield from dir_node.iter_files()
+
     @property
     def extension(self):
         return os.path.splitext(self.path)[-1]
@@ -43,6 +89,10 @@ class Node:
     def is_file(self):
         return self.type == NodeType.FILE
 
+    def detach(self) -> "Node":
+        """Returns a copy of this node without its parent."""
+        return replace(self, parent=None)
+
     def add_child(self, child: "Node"):
         if child is not None:
             if child.is_dir:
@@ -0,0 +1,170 @@
+import re
+from typing import Callable, Dict, List, Optional, Pattern
+
+from repo2md.render import CHUNK_SIZE
+
+# Where the parts of a split file are best cut, by extension: before a
+# top-level definition that follows a blank line, so decorators and
+# comments stay with what they belong to. Files of other types are cut
+# after blank lines, or else at the end of any line.
+SYNTAX_BOUNDARIES: Dict[str, Pattern[bytes]] = {
+    ".py": re.compile(rb"\n\n(?=(?:async def|def|class)[ \t]|@)"),
+    ".js": re.compile(rb"\n\n(?=(?:export|function|class|async function) )"),
+    ".ts": re.compile(
+        rb"\n\n(?=(?:export|function|class|interface|async function) )"
+    ),
+    ".go": re.compile(rb"\n\n(?=(?:func|type) )"),
+    ".rs": re.compile(rb"\n\n(?=(?:pub|fn|impl|struct|enum|trait|mod) )"),
+}
+
+# Bytes of a block carried over to the next one, so boundaries that
+# straddle two blocks are found.
+OVERLAP = 32
+
+SYNTAX, BLANK_LINE, LINE = range(3)
+
+
+class PartCutter:
+    """
+    Chooses where a file is cut into parts while it is read block by block,
+    keeping only the latest boundary of each kind between blocks, so memory
+    does not grow with the size of the file or its number of lines.
+
+    A part ends at the latest boundary that keeps it within its budget,
+    preferring a syntax boundary, then the end of a blank line, as long as
+    the part stays at least half full, and else the end of any line. A line
+    longer than a part is cut at the budget, moved back to the start of a
+    UTF-8 character.
+
+    Attributes:
+        budget (Callable[[int], int]): Returns the max size in bytes of the
+            part with the given number, from 1.
+        syntax (Optional[Pattern[bytes]]): Matches syntax boundaries, which
+            are at the end of each match.
+        ends (List[int]): The end offset of every part cut so far.
+        start (int): The offset the current part starts at.
+        latest (List[int]): The latest boundary of each kind after start,
+            or 0.
+    """
+
+    def __init__(
+        self,
+        budget: Callable[[int], int],
+        syntax: Optional[Pattern[bytes]] = None,
+    ):
+        self.budget = budget
+        self.syntax = syntax
+        self.ends: List[int] = []
+        self.start = 0
+        self.latest = [0, 0, 0]
+
+    def find(self, kind: int, data: bytes, low: int, high: int) -> int:
+        """
+        Returns the latest boundary of a kind within ``data[low:high]``,
+        relative to data, or -1.
+        """
+        if kind == LINE:
+            found = data.rfind(b"\n", max(low - 1, 0), high)
+            return found + 1 if found >= 0 else -1
+        if kind == BLANK_LINE:
+            found = data.rfind(b"\n\n", max(low - 2, 0), high)
+            return found + 2 if found >= 0 else -1
+        if self.syntax is None:
+            return -1
+        found = -1
+        end = min(len(data), high + OVERLAP)
+        for match in self.syntax.finditer(data, max(low - 2, 0), end):
+            if match.end() > high:
+                break
+            if match.end() >= low:
+                found = match.end()
+        return found
+
+    def boundary(
+        self, kind: int, data: bytes, base: int, low: int, high: int
+    ) -> int:
+        """
+        Returns the latest boundary of a kind between the offsets low and
+        high, in data or in the blocks before it, or 0.
+        """
+        found = self.find(kind, data, max(low - base, 0), high - base)
+        if found >= 0:
+            return base + found
+        latest = self.latest[kind]
+        return latest if low <= latest <= high else 0
+
+    def cut(self, data: bytes, base: int):
+        """Ends the current part within data, which holds its budget."""
+        budget = self.budget(len(self.ends) + 1)
+        high = self.start + budget
+        half = self.start + max(budget // 2, 1)
+        for kind, low in [
+            (SYNTAX, half),
+            (BLANK_LINE, half),
+            (LINE, self.start + 1),
+        ]:
+            position = self.boundary(kind, data, base, low, high)
+            if position:
+                break
+        else:
+            position = high
+            while (
+                position > self.start + 1
+                and data[position - base] & 0xC0 == 0x80
+            ):
+                position -= 1
+        self.ends.append(position)
+        self.start = position
+
+    def feed(self, data: bytes, base: int):
+        """
+        Takes the next block of the file, which starts at offset base and
+        may repeat the end of the previous block.
+        """
+        end = base + len(data)
+        while end - self.start > self.budget(len(self.ends) + 1):
+            self.cut(data, base)
+        for kind in (SYNTAX, BLANK_LINE, LINE):
+            low = max(self.start + 1 - base, 0)
+            found = self.find(kind, data, low, len(data))
+            if found >= 0:
+                self.latest[kind] = base + found
+
+    def finish(self, size: int) -> List[int]:
+        """Ends the last part at the end of the file and returns the ends."""
+        if size > self.start or not self.ends:
+            self.ends.append(size)
+        return self.ends
+
+
+def find_part_ends(
+    file,
+    budget: Callable[[int], int],
+    syntax: Optional[Pattern[bytes]] = None,
+) -> List[int]:
+    """
+    Reads a file once, in CHUNK_SIZE blocks, and returns the end offset of
+    every part it is cut into.
+
+    Args:
+        file: The file, opened for binary reading at its start.
+        budget (Callable[[int], int]): Returns the max size in bytes of the
+            part with the given number, from 1; it must be positive.
+        syntax (Optional[Pattern[bytes]]): Matches the syntax boundaries of
+            the file's type, see ``SYNTAX_BOUNDARIES``.
+
+    Returns:
+        List[int]: The end of every part, the last one being the size of
+            the file as read.
+    """
+    cutter = PartCutter(budget, syntax)
+    carry, base = b"", 0
+    while True:
+        block = file.read(CHUNK_SIZE)
+        if not block:
+            break
+        data = carry + block
+        cutter.feed(data, base - len(carry))
+        base += len(block)
+        carry = data[-OVERLAP:]
+    return cutter.finish(base)
@@ -0,0 +1,157 @@
+import json
+from dataclasses import astuple, dataclass
+from typing import Any, Dict, List
+
+from repo2md import ContentClass, FilePart, Node, NodeType
+from repo2md.stats import parent_directories
+
+PLAN_VERSION = 3
+
+
+class PlanException(Exception):
+    """Raised when a plan file cannot be read."""
+
+
+@dataclass
+class Plan:
+    """
+    The chunks of a split repository, so that separate processes or hosts
+    can each render some of them and together write exactly what a single
+    run writes.
+
+    Attributes:
+        chunks (List[Node]): The output root node of every chunk.
+        sizes (List[int]): The size of every chunk, in the unit it was split
+            by, which balances the shards.
+        settings (Dict[str, Any]): Config values that change the rendered
+            output, applied before rendering.
+    """
+
+    chunks: List[Node]
+    sizes: List[int]
+    settings: Dict[str, Any]
+
+    def shard(self, index: int, count: int) -> List[int]:
+        """
+        Returns the chunks shard index of count renders, in order.
+
+        Chunks are dealt largest first to the shard with the least work so
+        far, so shards are balanced and every shard computes the same
+        partition from the plan alone.
+        """
+        loads = [0] * count
+        assigned: List[List[int]] = [[] for _ in range(count)]
+        by_size = sorted(
+            range(len(self.chunks)), key=lambda chunk: -self.sizes[chunk]
+        )
+        for chunk in by_size:
+            shard = loads.index(min(loads))
+            loads[shard] += self.sizes[chunk]
+            assigned[shard].append(chunk)
+        return sorted(assigned[index])
+
+
+def file_record(file_node: Node) -> List[Any]:
+    return [
+        file_node.path,
+        file_node.size,
+        file_node.mtime_ns,
+        file_node.inode,
+        file_node.content_class.value,
+        file_node.body_limit,
+        file_node.duplicate_of,
+        file_node.duplicate_chunk,
+        list(astuple(file_node.part)) if file_node.part else None,
+    ]
+
+
+def write_plan(
+    path: str, nodes: List[Node], sizes: List[int], settings: Dict[str, Any]
+):
+    """
+    Writes the chunks of a split to a plan file: every chunk as the list of
+    its files in rendering order, with what rendering them needs.
+
+    Args:
+        path (str): The plan file.
+        nodes (List[Node]): The output root nodes of the splitter.
+        sizes (List[int]): The chunk sizes of the splitter.
+        settings (Dict[str, Any]): Config values to apply when rendering.
+    """
+    plan = {
+        "version": PLAN_VERSION,
+        "settings": settings,
+        "sizes": sizes,
+        "chunks": [
+            [file_record(file_node) for file_node in node.iter_files()]
+            for node in nodes
+        ],
+    }
+    with open(path, "w") as file:
+        json.dump(plan, file, separators=(",", ":"))
+
+
+def chunk_node(records: List[List[Any]]) -> Node:
+    """
+    Rebuilds the output tree of a chunk from its files, adding directories
+    in order of first appearance like ``ChunkBuilder`` does.
+    """
+    root = Node(path=".", type=NodeType.DIR)
+    dirs = {root.path: root}
+    for (
+        path,
+        size,
+        mtime_ns,
+        inode,
+        content_class,
+        body_limit,
+        duplicate_of,
+        duplicate_chunk,
+        part,
+    ) in records:
+        parent = root
+        for dirpath in parent_directories(path):
+            dir_node = dirs.get(dirpath)
+            if dir_node is None:
+                dir_node = parent.add_child(
+                    Node(path=dirpath, type=NodeType.DIR)
+                )
+                dirs[dirpath] = dir_node
+            parent = dir_node
+        parent.add_child(
+            Node(
+                path=path,
+                type=NodeType.FILE,
+                size=size,
+                mtime_ns=mtime_ns,
+                inode=inode,
+                content_class=ContentClass(content_class),
+                body_limit=body_limit,
+                duplicate_of=duplicate_of,
+                duplicate_chunk=duplicate_chunk,
+                part=FilePart(*part) if part else None,
+            )
+        )
+    return root
+
+
+def read_plan(path: str) -> Plan:
+    """
+    Reads a plan file written by ``write_plan``.
+
+    Raises:
+        PlanException: If the file cannot be read or is not a plan of this
+            version.
+    """
+    try:
+        with open(path, "r") as file:
+            plan = json.load(file)
+    except (OSError, ValueError) as e:
+        raise PlanException(f"Cannot read plan {path}: {e}") from e
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+        raise PlanException(f"{path} is not a plan of version {PLAN_VERSION}")
+    return Plan(
+        [chunk_node(records) for records in plan["chunks"]],
+        plan["sizes"],
+        plan["settings"],
+    )
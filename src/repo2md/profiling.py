@@ -0,0 +1,309 @@
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+# Number of files listed by the report as the slowest.
+SLOWEST_FILES = 10
+
+# Returned instead of a timer while no profiler is active, so instrumented
+# code pays for one call and one ``with`` per file.
+NULL_TIMER = nullcontext()
+
+
+@dataclass
+class StageRecord:
+    """
+    What one stage of a run did: its wall time, how many files and bytes it
+    went through, and the memory used by the process.
+
+    Attributes:
+        name (str): The name of the stage, like ``scan`` or ``render``.
+        start (float): When the stage started, in seconds since the
+            profiler was created.
+        seconds (float): Wall time of the stage.
+        files (int): Number of files the stage went through.
+        size (int): Number of bytes the stage went through.
+        max_rss (int): Peak resident memory of the process when the stage
+            ended, in bytes. It never decreases from one stage to the next.
+        traced_peak (Optional[int]): Peak memory allocated by Python during
+            the stage, in bytes, when tracemalloc is tracing.
+        thread (int): The thread that ran the stage.
+    """
+
+    name: str
+    start: float
+    seconds: float = 0.0
+    files: int = 0
+    size: int = 0
+    max_rss: int = 0
+    traced_peak: Optional[int] = None
+    thread: int = field(default_factory=threading.get_ident)
+
+
+@dataclass
+class FileRecord:
+    """The time spent on a single file by the stage named category."""
+
+    category: str
+    path: str
+    size: int
+    start: float
+    seconds: float
+    thread: int
+
+
+Record = Union[StageRecord, FileRecord]
+Hook = Callable[[Record], None]
+
+
+def max_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class Profiler:
+    """
+    Records the stages of a run and the time spent on individual files, and
+    writes them as a Chrome trace.
+
+    Stages are timed explicitly with ``stage``. Files are timed by the
+    collector and the renderers while the profiler is active, see
+    ``activate``. Every finished record is passed to the hooks, in the
+    thread that finished it.
+
+    Attributes:
+        stages (List[StageRecord]): Finished stages, in the order they
+            ended.
+        files (List[FileRecord]): Timed files, in the order they finished.
+        totals (Dict[str, List[float]]): ``[seconds, calls]`` of the calls
+            timed with ``timed``, by name.
+        hooks (List[Hook]): Called with every finished record.
+    """
+
+    def __init__(self, hooks: Optional[List[Hook]] = None):
+        self.origin = time.perf_counter()
+        self.stages: List[StageRecord] = []
+        self.files: List[FileRecord] = []
+        self.totals: Dict[str, List[float]] = {}
+        self.hooks: List[Hook] = list(hooks or [])
+        self.open_stages: List[StageRecord] = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook: Hook):
+        self.hooks.append(hook)
+
+    def now(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def finish(self, record: Record):
+        for hook in self.hooks:
+            hook(record)
+
+    def fold_traced_peak(self):
+        """
+        Credits the traced peak since the last fold to every open stage, then
+        starts a new peak, so nested stages each get their own.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open_stages:
+            record.traced_peak = max(record.traced_peak or 0, peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str, files: int = 0, size: int = 0):
+        """
+        Times the body of the ``with`` statement as the stage name. The
+        files and size of the yielded record can be set in the body, once
+        they are known.
+        """
+        self.fold_traced_peak()
+        record = StageRecord(name, self.now(), files=files, size=size)
+        self.open_stages.append(record)
+        try:
+            yield record
+        finally:
+            record.seconds = self.now() - record.start
+            self.fold_traced_peak()
+            self.open_stages.remove(record)
+            record.max_rss = max_rss()
+            self.stages.append(record)
+            self.finish(record)
+
+    @contextmanager
+    def time_file(self, category: str, path: str, size: int):
+        start = self.now()
+        try:
+            yield
+        finally:
+            record = FileRecord(
+                category,
+                path,
+                size,
+                start,
+                self.now() - start,
+                threading.get_ident(),
+            )
+            self.files.append(record)
+            self.finish(record)
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """
+        Wraps func to add the time and number of its calls to the total of
+        name, for calls too small and too many to be recorded one by one.
+        """
+        with self.lock:
+            total = self.totals.setdefault(name, [0.0, 0])
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    total[0] += elapsed
+                    total[1] += 1
+
+        return wrapper
+
+    def slowest_files(self, count: int = SLOWEST_FILES) -> List[FileRecord]:
+        return sorted(self.files, key=lambda record: -record.seconds)[:count]
+
+    def report(self) -> str:
+        """Returns a table of the stages, totals and slowest files."""
+        lines = []
+        for record in self.stages:
+            line = (
+                f"{record.name:<8} {record.seconds:8.3f}s "
+                f"{record.files:8} files {record.size / 2**20:10.1f} MB "
+                f"{record.max_rss / 2**20:8.0f} MB max RSS"
+            )
+            if record.traced_peak is not None:
+                line += f" {record.traced_peak / 2**20:8.1f} MB traced peak"
+            lines.append(line)
+        for name, (seconds, calls) in self.totals.items():
+            lines.append(f"{name:<8} {seconds:8.3f}s {calls:8} calls")
+        slowest = self.slowest_files()
+        if slowest:
+            lines.append("Slowest files:")
+        for record in slowest:
+            lines.append(
+                f"{record.seconds:8.3f}s {record.category:<8} "
+                f"{record.size:12} bytes  {record.path}"
+            )
+        return "\n".join(lines)
+
+    def trace_events(self) -> List[dict]:
+        """
+        Returns the records as complete events of the Chrome trace event
+        format, which chrome://tracing and Perfetto load.
+        """
+        pid = os.getpid()
+        events = []
+        for record in self.stages:
+            args = {
+                "files": record.files,
+                "size": record.size,
+                "max_rss": record.max_rss,
+            }
+            if record.traced_peak is not None:
+                args["traced_peak"] = record.traced_peak
+            events.append(
+                {
+                    "name": record.name,
+                    "cat": "stage",
+                    "ph": "X",
+                    "ts": record.start * 1e6,
+                    "dur": record.seconds * 1e6,
+                    "pid": pid,
+                    "tid": record.thread,
+                    "args": args,
+                }
+            )
+        for record in self.files:
+            events.append(
+                {
+                    "name": record.path,
+                    "cat": record.category,
+                    "ph": "X",
+                    "ts": record.start * 1e6,
+                    "dur": record.seconds * 1e6,
+                    "pid": pid,
+                    "tid": record.thread,
+                    "args": {"size": record.size},
+                }
+            )
+        return events
+
+    def write_trace(self, path: str):
+        trace = {
+            "traceEvents": self.trace_events(),
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "totals": {
+                    name: {"seconds": seconds, "calls": calls}
+                    for name, (seconds, calls) in self.totals.items()
+                }
+            },
+        }
+        with open(path, "w") as file:
+            json.dump(trace, file)
+
+
+_active: Optional[Profiler] = None
+
+
+def active() -> Optional[Profiler]:
+    """Returns the active profiler, or None when profiling is disabled."""
+    return _active
+
+
+@contextmanager
+def activate(profiler: Optional[Profiler]) -> Iterator[Optional[Profiler]]:
+    """
+    Makes profiler the active profiler for the body of the ``with``
+    statement. None leaves profiling disabled.
+
+    Only the current process is profiled: files rendered by worker
+    processes are not timed one by one.
+    """
+    global _active
+    previous, _active = _active, profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+def stage(name: str, files: int = 0, size: int = 0):
+    """
+    Times a stage with the active profiler, if there is one. The record
+    yielded without one is discarded.
+    """
+    if _active is None:
+        return nullcontext(StageRecord(name, 0.0))
+    return _active.stage(name, files, size)
+
+
+def file_timer(category: str, path: str, size: int):
+    """Times a file with the active profiler, if there is one."""
+    if _active is None:
+        return NULL_TIMER
+    return _active.time_file(category, path, size)
+
+
+def timed(name: str, func: Callable) -> Callable:
+    """Returns func, wrapped to be timed if a profiler is active."""
+    if _active is None:
+        return func
+    return _active.timed(name, func)
@@ -1,98 +1,313 @@
+import io
+import logging
+import mmap
 import os
-from repo2md import SYNTAX_MAP, slugify, NodeType, logger
-
-
-def render_file_content(node):
-    """Renders the content of a file node."""
-    syntax_type = SYNTAX_MAP.get(node.extension, node.extension)
-    logger.debug(f"Rendering: {node.basename} [{syntax_type}]")
-    with open(node.path, "r") as file:
-        content = file.read()
-    return (
-        content
-        if syntax_type == "markdown"
-        else f"```{syntax_type}\n{content}\n```"
-    )
+import re
+import stat
+from repo2md import NodeType, logger, emit, profiling
+from repo2md.compress import SUFFIXES, compressed_name, open_output
+from repo2md.sources import open_source
 
+# Size of the blocks file bodies are copied in, which bounds the memory used
+# per file regardless of how large the file is.
+CHUNK_SIZE = 1024 * 1024
 
-def generate_navigation_links(index, total_files):
-    """Generate navigation links for a file section."""
-    nav_links = "[TOC](#table-of-contents) | "
-    nav_links += f"[PREV](#file-{index - 1}) | " if index > 0 else "PREV | "
-    nav_links += (
-        f"[NEXT](#file-{index + 1})\n\n"
-        if index < total_files - 1
-        else "NEXT\n\n"
-    )
-    return nav_links
+# Files at least this large are memory-mapped and written to the output
+# straight from the mapping, instead of being read into buffers.
+MMAP_SIZE = 16 * 1024 * 1024
 
+# Names of the Markdown files of chunks, with or without any compression.
+OUTPUT_NAME = re.compile(
+    r"output_\d+\.md(?:"
+    + "|".join(re.escape(suffix) for suffix in SUFFIXES.values())
+    + r")?"
+)
 
-def render_toc(node, indent=0):
+
+class RenderException(Exception):
+    """Raised when a file cannot be rendered, carrying the file's path."""
+
+    def __init__(self, path, message):
+        super().__init__(path, message)
+        self.path = path
+        self.message = message
+
+    def __str__(self):
+        return f"{self.path}: {self.message}"
+
+
+def map_file(file):
+    """
+    Memory-maps a regular file of at least MMAP_SIZE bytes for reading, or
+    returns None for smaller files and streams that have no file behind
+    them.
+    """
+    try:
+        file_stat = os.fstat(file.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    if not stat.S_ISREG(file_stat.st_mode) or file_stat.st_size < MMAP_SIZE:
+        return None
+    try:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if hasattr(mapping, "madvise"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    return mapping
+
+
+def slice_blocks(mapping, start=0, limit=None):
+    """
+    Yields memoryview slices of CHUNK_SIZE bytes of a mapping, from start
+    and for at most limit bytes, without copying them.
+    """
+    end = len(mapping) if limit is None else min(len(mapping), start + limit)
+    view = memoryview(mapping)
+    try:
+        for offset in range(start, end, CHUNK_SIZE):
+            yield view[offset : min(offset + CHUNK_SIZE, end)]
+    finally:
+        view.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # A consumer still holds a slice; the mapping is closed when it
+            # is released.
+            pass
+
+
+def read_blocks(file, limit=None):
     """
-    Renders the Table of Contents with proper indentation for nested files
-    and directories.
+    Yields the content of file in CHUNK_SIZE blocks, stopping after limit
+    bytes when a limit is given.
+
+    Large regular files are memory-mapped and yielded as memoryview slices
+    of the mapping, which skips copying them through read buffers. The
+    bytes are passed through as they are in either case.
+    """
+    mapping = map_file(file)
+    if mapping is not None:
+        yield from slice_blocks(mapping, file.tell(), limit)
+        return
+
+    while limit is None or limit > 0:
+        size = CHUNK_SIZE if limit is None else min(limit, CHUNK_SIZE)
+        block = file.read(size)
+        if not block:
+            break
+        yield block
+        if limit is not None:
+            limit -= len(block)
+
+
+def skip_to(file, offset):
+    """
+    Moves a file opened for reading to offset, reading through the bytes
+    before it when the file cannot seek.
+    """
+    if not offset:
+        return
+    if file.seekable():
+        file.seek(offset)
+        return
+    while offset > 0:
+        block = file.read(min(offset, CHUNK_SIZE))
+        if not block:
+            break
+        offset -= len(block)
+
+
+def read_limit(node):
+    """
+    Returns the number of bytes of a file's body to read, or None for all
+    of it: the body limit of a truncated file, or the size of a part.
+    """
+    if node.part is not None:
+        return node.size
+    if emit.is_truncated(node):
+        return node.body_limit
+    return None
+
+
+def iter_file_content(node, source="."):
+    """
+    Yields the content of a file node, wrapped in a code fence unless it is
+    markdown. Duplicates are rendered as a reference to the file they are
+    identical to, summarized files as a placeholder, truncated files up to
+    their body limit, and parts of split files from their offset.
+
+    The body is read in CHUNK_SIZE blocks, so it is never held in memory as
+    a whole.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Rendering: %s [%s]", node.basename, emit.syntax_type(node)
+        )
+    if node.duplicate_of:
+        yield emit.duplicate_reference(node.duplicate_of, node.duplicate_chunk)
+        return
+    if emit.is_summarized(node):
+        yield emit.summary(node)
+        return
+
+    try:
+        with open_source(source, node.path) as file:
+            yield emit.fence_open(node)
+            if node.part is not None:
+                skip_to(file, node.part.offset)
+            yield from read_blocks(file, read_limit(node))
+            if emit.is_truncated(node):
+                yield emit.truncation_note(node)
+            yield emit.fence_close(node)
+    except OSError as e:
+        raise RenderException(node.path, e.strerror or str(e)) from e
+
+
+def write_file_content(markdown_file, node, source="."):
+    """Streams the content of a file node into a binary output handle."""
+    markdown_file.writelines(iter_file_content(node, source))
+
+
+def iter_toc(node, indent=0):
+    """
+    Yields the lines of the Table of Contents with proper indentation for
+    nested files and directories.
+
+    The tree is walked with an explicit stack and the children of each
+    directory are sorted once, so the cost is linear in the number of
+    entries apart from the per-directory sorts, and deep trees do not hit
+    the recursion limit.
 
     Args:
         node (Node): The node to render in the TOC.
         indent (int): The current indentation level.
     """
-    logger.debug(f"TOC Node: {node.path} [indent={indent}]")
-    toc = ""
+    stack = [(node, indent)]
+    while stack:
+        node, indent = stack.pop()
+        if node.type == NodeType.DIR:
+            yield emit.toc_dir_entry(node, indent)
+            children = sorted(
+                node.file_children + node.dir_children, key=lambda x: x.path
+            )
+            stack.extend((child, indent + 1) for child in reversed(children))
+        else:
+            # File: Create a clickable link
+            yield emit.toc_file_entry(node, indent)
+
+
+def render_toc(node, indent=0):
+    """Renders the Table of Contents as bytes."""
+    return b"".join(iter_toc(node, indent))
+
+
+def output_file_name(index, compress=None):
+    """
+    Returns the name of the Markdown file for the chunk at index, with the
+    suffix of its compression if any.
+    """
+    return compressed_name(emit.chunk_file_name(index), compress)
 
-    if node.type == NodeType.DIR:
-        if node.basename != ".":
-            toc += f"{'    ' * indent}* {node.basename}\n"
-        for child in sorted(
-            node.file_children + node.dir_children, key=lambda x: x.path
-        ):
-            toc += render_toc(child, indent + 1)
-    else:
-        # File: Create a clickable link
-        link = slugify(node.path)
-        toc += f"{'    ' * indent}* [{node.basename}](#{link})\n"
 
-    return toc
+def remove_stale_outputs(output_directory, num_chunks, compress=None):
+    """
+    Removes the Markdown files of chunks that no longer exist, and those
+    left by runs with another compression.
+    """
+    current = {
+        output_file_name(index, compress) for index in range(num_chunks)
+    }
+    try:
+        names = os.listdir(output_directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if OUTPUT_NAME.fullmatch(name) and name not in current:
+            try:
+                os.remove(os.path.join(output_directory, name))
+            except FileNotFoundError:
+                pass
 
 
-def render_markdown(node, output_directory, index):
+def render_markdown(
+    node,
+    output_directory,
+    index,
+    source=".",
+    nav=emit.Navigation.DIRECTORY,
+    compress=None,
+):
     """
 
     :param node:
     :param output_directory:
     :param index:
+    :param source: root directory the node paths are relative to.
+    :param nav: what the PREV/NEXT links of each file point to.
+    :param compress: compression of the output file, None for plain text.
     :return:
     """
-    markdown_file_path = os.path.join(output_directory, f"output_{index}.md")
+    markdown_file_path = os.path.join(
+        output_directory, output_file_name(index, compress)
+    )
 
-    with open(markdown_file_path, "w") as markdown_file:
-        markdown_file.write(render_toc(node))
-        descend(markdown_file, node)
+    with open_output(markdown_file_path, compress) as markdown_file:
+        markdown_file.writelines(iter_markdown(node, source, nav))
 
     return markdown_file_path
 
 
-def descend(markdown_file, node):
-    # Write each file content
-    for file_node in node.file_children:
-        markdown_file.write("\n\\newpage\n\n")
-        file_header = " ".join(
-            [
-                "##",
-                file_node.basename,
-                f"{{#{slugify(file_node.path)}}}\n",
-            ]
-        )
-        markdown_file.write(file_header)
+def iter_markdown(node, source=".", nav=emit.Navigation.DIRECTORY):
+    """
+    Yields the Markdown of a chunk piece by piece: its TOC, then the section
+    of every file, with bodies in CHUNK_SIZE blocks. Blocks of memory-mapped
+    files are memoryviews of the mapping, for writing without copies.
+    """
+    yield from iter_toc(node)
+    yield from iter_sections(node, source, nav)
 
-        # Navigation links
-        nav_links = generate_navigation_links(
-            node.file_children.index(file_node), len(node.file_children)
-        )
-        markdown_file.write(nav_links)
 
-        # File content
-        content = render_file_content(file_node)
-        markdown_file.write(content)
+def iter_navigation(node, nav=emit.Navigation.DIRECTORY):
+    """
+    Yields ``(file_node, prev_anchor, next_anchor)`` for every file below
+    node in rendering order, with the neighbours found during the walk.
+    """
+    if nav == emit.Navigation.GLOBAL:
+        file_nodes = node.iter_files()
+        prev_node, file_node = None, next(file_nodes, None)
+        while file_node is not None:
+            next_node = next(file_nodes, None)
+            yield (
+                file_node,
+                emit.file_anchor(prev_node) if prev_node else None,
+                emit.file_anchor(next_node) if next_node else None,
+            )
+            prev_node, file_node = file_node, next_node
+        return
 
+    total_files = len(node.file_children)
+    for index, file_node in enumerate(node.file_children):
+        yield (
+            file_node,
+            emit.directory_anchor(index - 1) if index > 0 else None,
+            emit.directory_anchor(index + 1)
+            if index < total_files - 1
+            else None,
+        )
     for dir_node in node.dir_children:
-        descend(markdown_file, dir_node)
+        yield from iter_navigation(dir_node, nav)
+
+
+def iter_sections(node, source=".", nav=emit.Navigation.DIRECTORY):
+    """Yields the header, links and content of every file below node."""
+    for file_node, prev_anchor, next_anchor in iter_navigation(node, nav):
+        with profiling.file_timer("render", file_node.path, file_node.size):
+            yield emit.file_header(file_node)
+            yield emit.navigation_links(prev_anchor, next_anchor)
+            yield emit.part_links(file_node)
+            yield from iter_file_content(file_node, source)
+
+
+def descend(markdown_file, node, source=".", nav=emit.Navigation.DIRECTORY):
+    markdown_file.writelines(iter_sections(node, source, nav))
@@ -0,0 +1,515 @@
+import errno
+import io
+import os
+import posixpath
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+from typing import IO, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from repo2md import logger
+
+# Bytes left unread in a blob above which closing it restarts the batch
+# process instead of draining the rest of the blob from its pipe.
+DRAIN_LIMIT = 1024 * 1024
+
+# Members up to this size are copied out of a tar archive in memory, larger
+# ones through a temporary file.
+SPOOL_SIZE = 8 * 1024 * 1024
+
+# Total size of the tar members read ahead of the member being rendered,
+# and kept in memory until they are rendered in turn.
+READ_AHEAD_SIZE = 64 * 1024 * 1024
+
+
+class GitException(Exception):
+    """Raised when git fails to list the files of a repository."""
+
+
+class GitFile(NamedTuple):
+    path: str
+    size: int
+    object_id: str
+
+
+def run_git(repo_path: str, *args: str, input: bytes = None) -> bytes:
+    try:
+        result = subprocess.run(
+            ["git", *args],
+            cwd=repo_path,
+            input=input,
+            capture_output=True,
+            check=True,
+        )
+    except FileNotFoundError as e:
+        raise GitException("git is not installed") from e
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode(errors="replace").strip()
+        raise GitException(message or f"git {args[0]} failed") from e
+    return result.stdout
+
+
+class GitBlob(io.RawIOBase):
+    """
+    A read-only stream over one blob of a ``git cat-file --batch`` process.
+    Closing it hands the process back to its GitSource.
+    """
+
+    def __init__(self, process: subprocess.Popen, size: int, release):
+        super().__init__()
+        self.process = process
+        self.remaining = size
+        self.release = release
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        view = memoryview(buffer)[: self.remaining]
+        count = self.process.stdout.readinto(view)
+        if not count:
+            raise OSError(errno.EIO, "git cat-file output ended early")
+        self.remaining -= count
+        return count
+
+    def close(self):
+        if not self.closed:
+            # The blob is followed by a newline.
+            self.release(self.process, self.remaining + 1)
+        super().close()
+
+
+class GitSource:
+    """
+    Reads the files of a git repository from its object database instead of
+    the working tree: the files of the commit ``rev``, or of the index when
+    no revision is given.
+
+    Blobs are streamed from long-running ``git cat-file --batch`` processes.
+    Each open blob holds one process, so concurrent readers get a process
+    each and idle processes are reused. A source is pickled as its
+    repository and revision, and starts its own processes when unpickled.
+
+    Attributes:
+        repo_path (str): Directory in the repository; paths are relative to
+            it and only files below it are listed.
+        rev (Optional[str]): The commit or tree to read, None for the index.
+    """
+
+    def __init__(self, repo_path: str, rev: Optional[str] = None):
+        self.repo_path = repo_path
+        self.rev = rev or None
+        self.idle: List[subprocess.Popen] = []
+        self.lock = threading.Lock()
+
+    def __reduce__(self):
+        return GitSource, (self.repo_path, self.rev)
+
+    def __str__(self) -> str:
+        return f"{self.repo_path}@{self.rev or 'index'}"
+
+    def list_files(self) -> Iterator[GitFile]:
+        """
+        Lists the regular files below repo_path, with their sizes, in git's
+        path order. Symlinks and submodules are left out.
+        """
+        if self.rev is None:
+            yield from self.list_index()
+            return
+
+        output = run_git(self.repo_path, "ls-tree", "-r", "-l", "-z", self.rev)
+        for record in output.split(b"\0"):
+            if not record:
+                continue
+            info, path = record.split(b"\t", 1)
+            mode, kind, object_id, size = info.split()
+            if kind == b"blob" and mode != b"120000":
+                yield GitFile(os.fsdecode(path), int(size), object_id.decode())
+
+    def list_index(self) -> Iterator[GitFile]:
+        entries = []
+        output = run_git(self.repo_path, "ls-files", "-s", "-z")
+        for record in output.split(b"\0"):
+            if not record:
+                continue
+            info, path = record.split(b"\t", 1)
+            mode, object_id, stage = info.split()
+            if stage == b"0" and mode not in (b"120000", b"160000"):
+                entries.append((os.fsdecode(path), object_id.decode()))
+
+        object_ids = "".join(object_id + "\n" for _, object_id in entries)
+        sizes = run_git(
+            self.repo_path,
+            "cat-file",
+            "--batch-check=%(objectsize)",
+            input=object_ids.encode(),
+        ).split()
+        for (path, object_id), size in zip(entries, sizes, strict=True):
+            yield GitFile(path, int(size), object_id)
+
+    def start(self) -> subprocess.Popen:
+        logger.debug("Starting git cat-file for %s", self)
+        return subprocess.Popen(
+            ["git", "cat-file", "--batch"],
+            cwd=self.repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def open(self, path: str) -> GitBlob:
+        """
+        Opens the blob of a file, by its path relative to repo_path.
+
+        Raises:
+            FileNotFoundError: If the revision has no such file.
+            OSError: If the path is not a file, or git failed.
+        """
+        with self.lock:
+            process = self.idle.pop() if self.idle else None
+        if process is None:
+            process = self.start()
+
+        object_name = f"{self.rev or ''}:./{path.replace(os.sep, '/')}"
+        try:
+            process.stdin.write(object_name.encode() + b"\n")
+            process.stdin.flush()
+            header = process.stdout.readline().split()
+        except OSError:
+            self.release(process, DRAIN_LIMIT + 1)
+            raise
+        if header[-1:] == [b"missing"]:
+            self.release(process, 0)
+            raise FileNotFoundError(errno.ENOENT, f"Not in {self}", path)
+        if len(header) != 3:
+            self.release(process, DRAIN_LIMIT + 1)
+            raise OSError(errno.EIO, f"git cat-file failed for {path}")
+        if header[1] != b"blob":
+            self.release(process, int(header[2]) + 1)
+            raise IsADirectoryError(errno.EISDIR, "Not a file", path)
+        return GitBlob(process, int(header[2]), self.release)
+
+    def release(self, process: subprocess.Popen, unread: int):
+        """
+        Returns a process to the idle pool once the unread rest of its
+        answer is drained. A process with a large rest, or one that failed,
+        is stopped instead.
+        """
+        if process.poll() is None and unread <= DRAIN_LIMIT:
+            try:
+                process.stdout.read(unread)
+            except OSError:
+                pass
+            else:
+                with self.lock:
+                    self.idle.append(process)
+                return
+        process.kill()
+        process.wait()
+        process.stdin.close()
+        process.stdout.close()
+
+    def close(self):
+        """Stops the idle cat-file processes."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for process in idle:
+            process.stdin.close()
+            process.wait()
+            process.stdout.close()
+
+
+class ArchiveMember(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+def member_path(name: str) -> Optional[str]:
+    """
+    Normalizes the name of an archive member to a relative path, or returns
+    None for names outside the archive root.
+    """
+    path = posixpath.normpath(name.lstrip("/"))
+    if path == "." or path == ".." or path.startswith("../"):
+        return None
+    return path
+
+
+class ZipSource:
+    """
+    Reads the files of a zip archive, which stores an index of its members,
+    so every member is read lazily and independently of the others.
+
+    A source is pickled as its archive path and reopens the archive when
+    unpickled. The CRC of each member stands in for its inode.
+
+    Attributes:
+        archive_path (str): Path of the zip file.
+    """
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self.archive: Optional[zipfile.ZipFile] = None
+        self.names: Dict[str, str] = {}
+        self.lock = threading.Lock()
+
+    def __reduce__(self):
+        return ZipSource, (self.archive_path,)
+
+    def __str__(self) -> str:
+        return self.archive_path
+
+    def zip_file(self) -> zipfile.ZipFile:
+        with self.lock:
+            if self.archive is None:
+                self.archive = zipfile.ZipFile(self.archive_path)
+                for name in self.archive.namelist():
+                    path = member_path(name)
+                    if path is not None and not name.endswith("/"):
+                        self.names[path] = name
+            return self.archive
+
+    def iter_members(self) -> Iterator[Tuple[ArchiveMember, IO[bytes]]]:
+        """
+        Yields every regular file of the archive with a stream of its
+        content, which can only be read until the next member is yielded.
+        """
+        archive = self.zip_file()
+        for info in archive.infolist():
+            path = member_path(info.filename)
+            if info.is_dir() or path is None:
+                continue
+            mtime = datetime(*info.date_time).timestamp()
+            member = ArchiveMember(
+                path, info.file_size, int(mtime) * 10**9, info.CRC
+            )
+            with archive.open(info) as file:
+                yield member, file
+
+    def open(self, path: str) -> IO[bytes]:
+        archive = self.zip_file()
+        try:
+            return archive.open(self.names[path.replace(os.sep, "/")])
+        except KeyError:
+            raise FileNotFoundError(
+                errno.ENOENT, f"Not in {self}", path
+            ) from None
+
+    def close(self):
+        with self.lock:
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+
+
+class TarSource:
+    """
+    Reads the files of a tar archive, optionally compressed, in sequential
+    passes over the archive; tar has no index, and compressed tar cannot be
+    read from the middle.
+
+    Each member opened is copied out of the current pass, in memory up to
+    SPOOL_SIZE and through a temporary file above. Members passed on the
+    way that render after the member opened, according to ``order``, are
+    kept in memory up to READ_AHEAD_SIZE in total, so a directory whose
+    files come after its subdirectories in the archive costs no second pass.
+    Opening a member that was passed without being kept starts a new pass.
+
+    Attributes:
+        archive_path (str): Path of the tar file.
+        order (Dict[str, int]): Position of each file in rendering order;
+            members missing from it are never kept.
+    """
+
+    def __init__(
+        self, archive_path: str, order: Optional[Dict[str, int]] = None
+    ):
+        self.archive_path = archive_path
+        self.order = order or {}
+        self.archive: Optional[tarfile.TarFile] = None
+        self.read_ahead: Dict[str, bytes] = {}
+        self.read_ahead_size = 0
+        self.passes = 0
+        self.lock = threading.Lock()
+
+    def __reduce__(self):
+        return TarSource, (self.archive_path, self.order)
+
+    def __str__(self) -> str:
+        return self.archive_path
+
+    def iter_members(self) -> Iterator[Tuple[ArchiveMember, IO[bytes]]]:
+        """
+        Yields every regular file of the archive with a stream of its
+        content, which can only be read until the next member is yielded.
+        """
+        with tarfile.open(self.archive_path, "r|*") as archive:
+            for info in archive:
+                path = member_path(info.name)
+                if not info.isfile() or path is None:
+                    continue
+                member = ArchiveMember(
+                    path, info.size, int(info.mtime) * 10**9, 0
+                )
+                yield member, archive.extractfile(info)
+
+    def open(self, path: str) -> IO[bytes]:
+        path = path.replace(os.sep, "/")
+        with self.lock:
+            data = self.read_ahead.pop(path, None)
+            if data is not None:
+                self.read_ahead_size -= len(data)
+                return io.BytesIO(data)
+
+            started = self.archive is not None
+            file = self.read_until(path)
+            if file is None and started:
+                file = self.read_until(path)
+        if file is None:
+            raise FileNotFoundError(errno.ENOENT, f"Not in {self}", path)
+        file.seek(0)
+        return file
+
+    def read_until(self, path: str) -> Optional[IO[bytes]]:
+        """
+        Advances the current pass to the member at path and copies it out,
+        starting a pass if none is under way. Returns None, and ends the
+        pass, when the archive ends first.
+        """
+        if self.archive is None:
+            self.archive = tarfile.open(self.archive_path, "r|*")
+            self.passes += 1
+            logger.debug("Reading %s, pass %d", self, self.passes)
+
+        position = self.order.get(path, -1)
+        while (info := self.archive.next()) is not None:
+            name = member_path(info.name)
+            if not info.isfile() or name is None:
+                continue
+            if name == path:
+                file = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+                shutil.copyfileobj(self.archive.extractfile(info), file)
+                return file
+            if (
+                self.order.get(name, -1) > position
+                and name not in self.read_ahead
+                and self.read_ahead_size + info.size <= READ_AHEAD_SIZE
+            ):
+                self.read_ahead[name] = self.archive.extractfile(info).read()
+                self.read_ahead_size += info.size
+        self.end_pass()
+        return None
+
+    def end_pass(self):
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def close(self):
+        """Ends the current pass and drops the members read ahead."""
+        with self.lock:
+            self.end_pass()
+            self.read_ahead.clear()
+            self.read_ahead_size = 0
+
+
+def archive_source(path: str) -> Optional[Union[ZipSource, TarSource]]:
+    """Returns a source for a zip or tar file, or None for other paths."""
+    if not os.path.isfile(path):
+        return None
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    if tarfile.is_tarfile(path):
+        return TarSource(path)
+    return None
+
+
+class NewlineFile(io.RawIOBase):
+    """
+    Reads a file with its CRLF and CR line endings converted to LF, even
+    when a CRLF pair is split between two reads.
+    """
+
+    def __init__(self, file: IO[bytes]):
+        super().__init__()
+        self.file = file
+        self.pending = b""
+        self.carriage_return = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.pending:
+            block = self.file.read(max(len(buffer), 1))
+            if not block:
+                if not self.carriage_return:
+                    return 0
+                block = b"\n"
+            elif self.carriage_return:
+                block = b"\r" + block
+            self.carriage_return = block.endswith(b"\r")
+            if self.carriage_return:
+                block = block[:-1]
+            self.pending = block.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class NewlineSource:
+    """
+    Wraps a source so that files are read with LF line endings only. Files
+    get shorter or keep their size, so sizes computed from the original
+    files become upper bounds.
+
+    Attributes:
+        source (Source): The wrapped source.
+    """
+
+    def __init__(self, source: "Source"):
+        self.source = source
+
+    def __str__(self) -> str:
+        return str(self.source)
+
+    def open(self, path: str) -> IO[bytes]:
+        return NewlineFile(open_source(self.source, path))
+
+    def close(self):
+        close_source(self.source)
+
+
+Source = Union[str, GitSource, ZipSource, TarSource, NewlineSource]
+
+
+def open_source(source: Source, path: str):
+    """
+    Opens a file for binary reading, by its path relative to source: a
+    directory, or an object with an ``open`` method such as GitSource.
+    """
+    if isinstance(source, str):
+        return open(os.path.join(source, path), "rb")
+    return source.open(path)
+
+
+def close_source(source: Source):
+    """
+    Releases what a source holds open, such as the processes of a
+    GitSource. A directory holds nothing.
+    """
+    if not isinstance(source, str):
+        source.close()
@@ -1,8 +1,10 @@
-import os
-import dataclasses
-from typing import List, Optional
+from bisect import bisect_left, insort
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Tuple
 
-from repo2md import NodeType, Node, logger, SYNTAX_MAP, slugify
+from repo2md import CompactNode, FilePart, NodeType, Node, logger, emit
+from repo2md.parts import SYNTAX_BOUNDARIES, find_part_ends
+from repo2md.sources import Source, open_source
 
 
 class SplitterException(Exception):
@@ -21,96 +23,518 @@ def calculate_file_byte_size(node: Node, indent_level=0):
     """
     Calculate the number of bytes added by including a file in the document.
 
+    This is the exact size of the file's TOC entry and section as rendered,
+    without links to neighbouring files, which depend on where the file
+    lands and are added by the splitter.
+
     :param node: The file node to be added.
     :param indent_level: The level of indentation in the TOC.
     :return: The number of bytes added.
     """
-    byte_count = 0
-
-    # Calculate bytes for the file name in the TOC and header
-    file_name = os.path.basename(node.path)
-    byte_count += len(file_name.encode())
-
-    # Calculate bytes for the slugified path (used in links)
-    slugified_path = slugify(node.path)
-    byte_count += len(slugified_path.encode())
-
-    # Indentation bytes in the TOC
-    toc_indent = "    " * indent_level
-    byte_count += len(toc_indent.encode())
-
-    # Static elements: newpage, newlines, TOC, Next/Prev links
-    # Adding bytes for each static element
-    byte_count += len("\n\\newpage\n\n".encode())
-    byte_count += len(f"## {file_name} {{#{slugified_path}}}\n".encode())
-    byte_count += len("[TOC](#toc) ".encode())
-    byte_count += len("[PREV](#prev) ".encode())
-    byte_count += len("[NEXT](#next)\n\n".encode())
-
-    # Add bytes for content and code block syntax if not markdown
-    syntax_type = SYNTAX_MAP.get(
-        node.path.split(".")[-1], node.path.split(".")[-1]
-    )
-    if syntax_type != "markdown":
-        # Opening and closing backticks with syntax type
-        byte_count += len(f"```{syntax_type}\n".encode())
-        byte_count += len("\n```\n".encode())
+    byte_count = emit.file_section_size(node, indent_level)
+    logger.debug("Calculated byte size for '%s': %d bytes", node, byte_count)
+    return byte_count
 
-    # Add bytes of file
-    byte_count += node.size
 
-    logger.debug(f"Calculated byte size for '{node}': {byte_count} bytes")
-    return byte_count
+def input_dir_chain(root: Node, file_node: Node) -> List[Node]:
+    """Returns the directories between root and a file, outermost first."""
+    chain = []
+    dir_node = file_node.parent
+    while dir_node is not None and dir_node.path != root.path:
+        chain.append(dir_node)
+        dir_node = dir_node.parent
+    chain.reverse()
+    return chain
+
+
+class ChunkBuilder:
+    """
+    The output tree of a chunk under construction, keeping track of the
+    exact number of bytes it renders to as files are added.
+    """
+
+    def __init__(
+        self,
+        input_root_node: Node,
+        nav: emit.Navigation = emit.Navigation.DIRECTORY,
+        measure: Callable[[bytes], int] = len,
+    ):
+        self.root = Node(path=input_root_node.path, type=NodeType.DIR)
+        self.measure = measure
+        self.size = measure(emit.toc_dir_entry(self.root, 0))
+        self.dirs: Dict[str, Node] = {self.root.path: self.root}
+        self.nav = nav
+        # Files are added in rendering order, so the last one added is the
+        # previous file of the next one.
+        self.last_file: Optional[Node] = None
+
+    def cost(
+        self, file_node: Node, input_dirs: List[Node], section_size: int
+    ) -> int:
+        """
+        Returns the exact number of bytes adding a file would add.
+
+        :param file_node: The file node to be added.
+        :param input_dirs: The directories between the root and the file.
+        :param section_size: The file's calculate_file_byte_size.
+        """
+        cost = section_size + self.measure(
+            emit.TOC_INDENT * (len(input_dirs) + 1)
+        )
+        for depth, input_dir in enumerate(input_dirs, 1):
+            if input_dir.path not in self.dirs:
+                cost += self.measure(emit.toc_dir_entry(input_dir, depth))
+
+        return cost + self.link_cost(file_node, input_dirs)
+
+    def link_cost(self, file_node: Node, input_dirs: List[Node]) -> int:
+        """Returns the bytes the PREV/NEXT links grow by with a file added."""
+        if self.nav == emit.Navigation.GLOBAL:
+            if self.last_file is None:
+                return 0
+            return emit.link_growth(
+                emit.file_anchor(self.last_file),
+                emit.file_anchor(file_node),
+                self.measure,
+            )
+
+        parent_path = input_dirs[-1].path if input_dirs else self.root.path
+        parent = self.dirs.get(parent_path)
+        index = len(parent.file_children) if parent is not None else 0
+        return emit.directory_link_size(index, self.measure)
+
+    def add(self, file_node: Node, input_dirs: List[Node], cost: int):
+        output_node = self.root
+        for input_dir in input_dirs:
+            existing = self.dirs.get(input_dir.path)
+            if existing is None:
+                new_dir_node = Node(path=input_dir.path, type=NodeType.DIR)
+                existing = output_node.add_child(new_dir_node)
+                self.dirs[input_dir.path] = existing
+            output_node = existing
+        self.last_file = output_node.add_child(file_node.detach())
+        self.size += cost
 
 
 class NodeTreeSplitter:
     def __init__(
-        self, input_root_node: Node, max_file_size: int, max_num_files: int
+        self,
+        input_root_node: Node,
+        max_file_size: int,
+        max_num_files: int,
+        size_func: Callable[[Node], int] = calculate_file_byte_size,
+        nav: emit.Navigation = emit.Navigation.DIRECTORY,
+        measure: Callable[[bytes], int] = len,
+        part_source: Optional[Source] = None,
     ):
+        """
+        :param input_root_node: The root of the tree to split.
+        :param max_file_size: The limit of each chunk, in the unit of
+            measure: bytes by default, or e.g. tokens.
+        :param max_num_files: The maximum number of chunks.
+        :param size_func: Returns the size of a file's TOC entry and
+            section, in the unit of measure.
+        :param nav: What the PREV/NEXT links point to.
+        :param measure: Measures the markup the splitter adds itself.
+        :param part_source: Where the node paths are read from to split
+            files too large for a chunk into parts, over consecutive chunks.
+            Without it such files raise InputFileSizeException. Parts are
+            measured in bytes, so this needs the default measure.
+        """
         self.input_root_node = input_root_node
         self.max_file_size = max_file_size
         self.max_num_files = max_num_files
+        self.size_func = size_func
+        self.nav = nav
+        self.measure = measure
+        self.part_source = part_source
         self.output_root_nodes = []
-        self.current_size = 0
+        self.chunk_sizes = []
+        self.current_chunk: Optional[ChunkBuilder] = None
+        # The chunk of every file added, so duplicates can link to the
+        # chunk their original is in.
+        self.file_chunks: Dict[str, int] = {}
 
     def split(self) -> Optional[List[Node]]:
         try:
-            self.descend(self.input_root_node, None)
+            self.descend(self.input_root_node, [])
         except SplitterException as e:
             logger.warning(str(e))
             return None
         return self.output_root_nodes
 
-    def start_new_root(self, input_node: Node) -> Node:
-        new_output_root = Node(path=input_node.path, type=NodeType.DIR)
-        self.output_root_nodes.append(new_output_root)
-        self.current_size = 0
-        return new_output_root
-
-    def descend(self, input_node: Node, output_node: Optional[Node]):
-        if output_node is None:
-            output_node = self.start_new_root(input_node)
-            for child_node in input_node:
-                self.descend(child_node, output_node)
-
-        elif input_node.type == NodeType.FILE:
-            node_size = calculate_file_byte_size(input_node)
-            if node_size > self.max_file_size:
-                raise InputFileSizeException(input_node.path)
-
-            if self.current_size + node_size > self.max_file_size:
-                if len(self.output_root_nodes) >= self.max_num_files:
-                    raise OutputFileLimitException()
-
-                output_node = self.start_new_root(input_node)
-                self.current_size = 0
-
-            output_child_node = dataclasses.replace(input_node, parent=None)
-            output_node.add_child(output_child_node)
-            self.current_size += node_size
-
-        elif input_node.type == NodeType.DIR:
-            new_dir_node = Node(path=input_node.path, type=NodeType.DIR)
-            output_node.add_child(new_dir_node)
-            for child_node in input_node:
-                self.descend(child_node, new_dir_node)
+    def fill_ratios(self) -> List[float]:
+        """Returns how full each output chunk is, relative to max size."""
+        return [size / self.max_file_size for size in self.chunk_sizes]
+
+    def start_new_chunk(self) -> ChunkBuilder:
+        if len(self.output_root_nodes) >= self.max_num_files:
+            raise OutputFileLimitException()
+
+        self.current_chunk = ChunkBuilder(
+            self.input_root_node, self.nav, self.measure
+        )
+        self.output_root_nodes.append(self.current_chunk.root)
+        self.chunk_sizes.append(self.current_chunk.size)
+        return self.current_chunk
+
+    def descend(self, input_node: Node, input_dirs: List[Node]):
+        for file_node in input_node.file_children:
+            self.add_file(file_node, input_dirs)
+        for dir_node in input_node.dir_children:
+            self.descend(dir_node, input_dirs + [dir_node])
+
+    def output_node(self, file_node: Node, chunk_index: int) -> Node:
+        """
+        Returns the node a file is added to the chunk at chunk_index as: a
+        duplicate of a file in another chunk links to that chunk's file.
+        """
+        if not file_node.duplicate_of:
+            return file_node
+        original_chunk = self.file_chunks.get(file_node.duplicate_of)
+        if original_chunk is None or original_chunk == chunk_index:
+            return file_node
+        if isinstance(file_node, CompactNode):
+            file_node = file_node.to_node()
+        return replace(file_node, parent=None, duplicate_chunk=original_chunk)
+
+    def reference_cost(self, output_node: Node) -> int:
+        """Returns what linking to another chunk adds to a duplicate."""
+        if output_node.duplicate_chunk is None:
+            return 0
+        return emit.reference_growth(
+            output_node.duplicate_of, output_node.duplicate_chunk, self.measure
+        )
+
+    def placement(
+        self,
+        chunk: ChunkBuilder,
+        chunk_index: int,
+        file_node: Node,
+        input_dirs: List[Node],
+        section_size: int,
+    ) -> Tuple[Node, int]:
+        """
+        Returns the node a file is added to a chunk as, and what adding it
+        would cost.
+        """
+        output_node = self.output_node(file_node, chunk_index)
+        section_size += self.reference_cost(output_node)
+        return output_node, chunk.cost(output_node, input_dirs, section_size)
+
+    def add_file(self, file_node: Node, input_dirs: List[Node]):
+        section_size = self.size_func(file_node)
+        chunk = self.current_chunk
+        chunk_index = len(self.output_root_nodes) - 1
+        if chunk is not None:
+            output_node, cost = self.placement(
+                chunk, chunk_index, file_node, input_dirs, section_size
+            )
+            if chunk.size + cost > self.max_file_size:
+                chunk = None
+
+        if chunk is None:
+            chunk = ChunkBuilder(self.input_root_node, self.nav, self.measure)
+            chunk_index += 1
+            output_node, cost = self.placement(
+                chunk, chunk_index, file_node, input_dirs, section_size
+            )
+            if chunk.size + cost > self.max_file_size:
+                self.add_parts(file_node, input_dirs)
+                return
+            chunk = self.start_new_chunk()
+
+        chunk.add(output_node, input_dirs, cost)
+        self.chunk_sizes[-1] = chunk.size
+        self.file_chunks.setdefault(file_node.path, chunk_index)
+
+    def add_parts(self, file_node: Node, input_dirs: List[Node]):
+        """
+        Splits a file too large for a chunk into parts, each in a new chunk
+        that it fills as far as a good boundary allows. The chunk of the
+        last part takes the files that follow.
+
+        Part headers name the number of parts, so the file is cut again in
+        the rare case that the number of parts has more digits than the one
+        the cuts were made for.
+        """
+        if not splittable(file_node) or self.part_source is None:
+            raise InputFileSizeException(file_node.path)
+
+        first_chunk = len(self.output_root_nodes)
+        count = 1
+        while True:
+            ends = self.find_part_ends(
+                file_node, input_dirs, first_chunk, count
+            )
+            if len(str(len(ends))) <= len(str(count)):
+                break
+            count = len(ends)
+
+        self.file_chunks.setdefault(file_node.path, first_chunk)
+        offset = 0
+        for index, end in enumerate(ends, 1):
+            part = FilePart(index, len(ends), offset, first_chunk)
+            part_node = make_part_node(file_node, part, end - offset)
+            chunk = self.start_new_chunk()
+            section_size = calculate_file_byte_size(part_node)
+            cost = chunk.cost(part_node, input_dirs, section_size)
+            chunk.add(part_node, input_dirs, cost)
+            self.chunk_sizes[-1] = chunk.size
+            offset = end
+
+    def find_part_ends(
+        self,
+        file_node: Node,
+        input_dirs: List[Node],
+        first_chunk: int,
+        count: int,
+    ) -> List[int]:
+        """
+        Returns the end offsets of the parts of a file, reading it once,
+        for part headers that name count parts. Every part is given room for
+        a link to a next part, as which part is the last is only known once
+        the file is read.
+        """
+        empty_chunk = ChunkBuilder(self.input_root_node, self.nav)
+
+        def budget(index: int) -> int:
+            part = FilePart(index, max(count, index + 1), 0, first_chunk)
+            part_node = make_part_node(file_node, part, 0)
+            section_size = calculate_file_byte_size(part_node)
+            markup = empty_chunk.cost(part_node, input_dirs, section_size)
+            budget = self.max_file_size - empty_chunk.size - markup
+            if budget <= 0:
+                raise InputFileSizeException(file_node.path)
+            return budget
+
+        syntax = SYNTAX_BOUNDARIES.get(file_node.extension)
+        with open_source(self.part_source, file_node.path) as file:
+            return find_part_ends(file, budget, syntax)
+
+
+def splittable(file_node: Node) -> bool:
+    """Whether a file is rendered whole, so it can be split into parts."""
+    return (
+        file_node.part is None
+        and not file_node.duplicate_of
+        and file_node.body_limit is None
+    )
+
+
+def make_part_node(file_node: Node, part: FilePart, size: int) -> Node:
+    """Returns the node of a part of a file, its size being the part's."""
+    return Node(
+        path=file_node.path,
+        type=NodeType.FILE,
+        size=size,
+        mtime_ns=file_node.mtime_ns,
+        inode=file_node.inode,
+        content_class=file_node.content_class,
+        part=part,
+    )
+
+
+PackEntry = Tuple[int, Node, int]
+
+
+class PackingNodeTreeSplitter(NodeTreeSplitter):
+    """
+    Splits a tree by packing it into as few chunks as possible instead of
+    filling chunks greedily in traversal order.
+
+    The files of each directory form a group, so they stay together where
+    possible; groups larger than a chunk are cut into consecutive runs.
+    Groups are placed largest first into the fullest chunk they fit in
+    (best-fit decreasing). A group that fits in no chunk first tops off the
+    emptiest chunk with its longest leading run of files that fits, so
+    chunks are filled before new ones are opened and a directory is cut
+    into as few contiguous runs as possible. Within a chunk, files keep
+    their traversal order.
+
+    Placement uses an upper bound of each file's cost, which assumes the
+    widest PREV/NEXT links of its directory (or, with global navigation,
+    links to itself from both neighbours) and charges every run for the
+    TOC lines of its directories, so chunks built from it never exceed the
+    limit. The reported chunk sizes are exact. Files too large for a chunk
+    are not split into parts.
+
+    Sorting the groups dominates, so splitting is O(n log n) in the number
+    of files.
+    """
+
+    def split(self) -> Optional[List[Node]]:
+        try:
+            self.pack()
+        except SplitterException as e:
+            logger.warning(str(e))
+            return None
+        return self.output_root_nodes
+
+    def chunk_capacity(self) -> int:
+        """Space left for files in an empty chunk."""
+        return (
+            self.max_file_size
+            - ChunkBuilder(self.input_root_node, self.nav, self.measure).size
+        )
+
+    def collect_groups(self) -> List[Tuple[int, int, List[PackEntry]]]:
+        """
+        Returns the ``(group_size, dirs_size, entries)`` groups to pack,
+        where dirs_size is the size of the TOC lines of the group's
+        directories and each entry is an ``(order, file_node, size)`` tuple,
+        order being the position of the file in traversal order.
+        """
+        empty_chunk = ChunkBuilder(
+            self.input_root_node, self.nav, self.measure
+        )
+        capacity = self.chunk_capacity()
+        groups = []
+        order = 0
+        stack = [(self.input_root_node, [])]
+        while stack:
+            dir_node, input_dirs = stack.pop()
+            indent = self.measure(emit.TOC_INDENT * (len(input_dirs) + 1))
+            dirs_size = sum(
+                self.measure(emit.toc_dir_entry(input_dir, depth))
+                for depth, input_dir in enumerate(input_dirs, 1)
+            )
+            file_nodes = dir_node.file_children
+            links_size = emit.directory_link_size(
+                max(len(file_nodes) - 1, 0), self.measure
+            )
+            global_nav = self.nav == emit.Navigation.GLOBAL
+
+            group, group_size = [], dirs_size
+            for file_node in file_nodes:
+                section_size = self.size_func(file_node)
+                alone = empty_chunk.cost(file_node, input_dirs, section_size)
+                if alone > capacity:
+                    raise InputFileSizeException(file_node.path)
+
+                if global_nav:
+                    # Charges both links to each file: as the NEXT of the
+                    # file before it and as the PREV of the file after it.
+                    anchor = emit.file_anchor(file_node)
+                    links_size = emit.link_growth(anchor, anchor, self.measure)
+                bound = section_size + indent + links_size
+                if file_node.duplicate_of:
+                    # The original may land in any chunk.
+                    bound += emit.reference_growth(
+                        file_node.duplicate_of,
+                        self.max_num_files - 1,
+                        self.measure,
+                    )
+                bound = min(bound, capacity - dirs_size)
+                if group and group_size + bound > capacity:
+                    groups.append((group_size, dirs_size, group))
+                    group, group_size = [], dirs_size
+                group.append((order, file_node, bound))
+                group_size += bound
+                order += 1
+            if group:
+                groups.append((group_size, dirs_size, group))
+
+            stack.extend(
+                (child, input_dirs + [child])
+                for child in reversed(dir_node.dir_children)
+            )
+        return groups
+
+    def allocate(self, free: List[Tuple[int, int]], position: int, size):
+        """
+        Takes size bytes from the chunk at ``position`` in ``free``, or from
+        a new chunk when position is past the end.
+        """
+        if position < len(free):
+            chunk_free, chunk_index = free.pop(position)
+        else:
+            chunk_free = self.chunk_capacity()
+            chunk_index = len(self.chunk_sizes)
+            self.chunk_sizes.append(0)
+        insort(free, (chunk_free - size, chunk_index))
+        return chunk_index
+
+    def place_run(
+        self,
+        free: List[Tuple[int, int]],
+        entries: List[PackEntry],
+        group_size: int,
+        dirs_size: int,
+    ) -> Tuple[int, List[PackEntry]]:
+        """
+        Chooses where the next run of a group goes, returning the position
+        of the chunk in ``free`` (past the end for a new chunk) and the
+        leading entries that go there.
+        """
+        # Best fit: the fullest chunk the whole run still fits in.
+        position = bisect_left(free, (group_size, -1))
+        if position < len(free):
+            return position, entries
+
+        if free:
+            # Nothing fits: top off the emptiest chunk with the longest
+            # leading run of files that fits in it.
+            position = len(free) - 1
+            run_size = dirs_size
+            for count, (_, _, size) in enumerate(entries):
+                if run_size + size > free[position][0]:
+                    if count:
+                        return position, entries[:count]
+                    break
+                run_size += size
+
+        if len(self.chunk_sizes) >= self.max_num_files:
+            raise OutputFileLimitException()
+        return len(free), entries
+
+    def pack(self):
+        groups = self.collect_groups()
+        groups.sort(key=lambda group: -group[0])
+
+        # (free_space, chunk_index) pairs, kept sorted for best-fit lookups
+        free: List[Tuple[int, int]] = []
+        members: List[List[Tuple[int, Node]]] = []
+
+        for group_size, dirs_size, entries in groups:
+            while entries:
+                position, run = self.place_run(
+                    free, entries, group_size, dirs_size
+                )
+                run_size = dirs_size + sum(size for _, _, size in run)
+                chunk_index = self.allocate(free, position, run_size)
+                while len(members) <= chunk_index:
+                    members.append([])
+                members[chunk_index].extend(
+                    (order, file_node) for order, file_node, _ in run
+                )
+                entries = entries[len(run) :]
+                group_size -= run_size - dirs_size
+
+        for chunk_index, chunk_members in enumerate(members):
+            for _, file_node in chunk_members:
+                self.file_chunks[file_node.path] = chunk_index
+        for chunk_index, chunk_members in enumerate(members):
+            chunk_members.sort(key=lambda member: member[0])
+            chunk = self.build_chunk(
+                [file_node for _, file_node in chunk_members], chunk_index
+            )
+            self.chunk_sizes[chunk_index] = chunk.size
+
+    def build_chunk(
+        self, file_nodes: List[Node], chunk_index: int
+    ) -> ChunkBuilder:
+        """
+        Builds the output tree of the chunk at chunk_index, recreating the
+        directories of its files in traversal order.
+        """
+        chunk = ChunkBuilder(self.input_root_node, self.nav, self.measure)
+        self.output_root_nodes.append(chunk.root)
+        for file_node in file_nodes:
+            input_dirs = input_dir_chain(self.input_root_node, file_node)
+            section_size = self.size_func(file_node)
+            output_node, cost = self.placement(
+                chunk, chunk_index, file_node, input_dirs, section_size
+            )
+            chunk.add(output_node, input_dirs, cost)
+        return chunk
@@ -0,0 +1,239 @@
+import heapq
+import os
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from repo2md import Collector, Node, NodeType, calculate_file_byte_size, emit
+
+# Upper bounds of the buckets of the file size histogram; the last bucket
+# holds every larger file.
+SIZE_BUCKETS = [4**exponent * 1024 for exponent in range(9)]
+
+
+class RepoStats:
+    """
+    Statistics of a repository gathered in a single pass over its files, in
+    rendering order, without building the node tree: totals, the largest
+    files, the number of files and bytes by extension and by top-level
+    directory, a histogram of file sizes and the number of chunks a split
+    by size would produce.
+
+    Memory does not grow with the number of files: the largest files are
+    kept in a bounded heap, and the projection only follows the last file
+    added to the chunk being filled.
+
+    Attributes:
+        files (int): Number of files.
+        size (int): Total size of the files, in bytes.
+        directories (int): Number of directories below the root with files
+            in them, like in the node tree.
+        extensions (Dict[str, List[int]]): ``[files, bytes]`` by extension.
+        top_directories (Dict[str, List[int]]): ``[files, bytes]`` by
+            top-level directory, with ``.`` for files in the root.
+        histogram (List[int]): Number of files in each size bucket.
+        chunks (int): Projected number of chunks, when a max size is given.
+        oversized (int): Files that do not fit in a chunk on their own.
+    """
+
+    def __init__(
+        self,
+        largest: int = 0,
+        max_size: int = 0,
+        nav: emit.Navigation = emit.Navigation.DIRECTORY,
+        size_func: Callable[[Node], int] = calculate_file_byte_size,
+    ):
+        """
+        Args:
+            largest (int): Number of largest files to keep.
+            max_size (int): Max size of a chunk in bytes, or 0 not to
+                project the number of chunks.
+            nav (emit.Navigation): What the PREV/NEXT links point to, which
+                sets their size.
+            size_func (Callable[[Node], int]): Computes the size of a file's
+                section, like the splitter's.
+        """
+        self.largest = largest
+        self.max_size = max_size
+        self.nav = nav
+        self.size_func = size_func
+        self.files = 0
+        self.size = 0
+        self.directories = 0
+        self.extensions: Dict[str, List[int]] = {}
+        self.top_directories: Dict[str, List[int]] = {}
+        self.histogram = [0] * (len(SIZE_BUCKETS) + 1)
+        self.largest_heap: List[Tuple[int, str]] = []
+        self.chunks = 0
+        self.oversized = 0
+        self.chunk_size = 0
+        self.dir_files = 0
+        self.last_anchor: Optional[str] = None
+        self.last_dirs: List[str] = []
+        # Originals of duplicates, and the projected chunk of those added,
+        # as references to another chunk link to its file.
+        self.originals: Set[str] = set()
+        self.original_chunks: Dict[str, int] = {}
+
+    def add_file(self, file_node: Node):
+        """Adds a file; files must be added in rendering order."""
+        dirs = parent_directories(file_node.path)
+        # Rendering order visits the files below a directory together, so
+        # directories not shared with the previous file are new.
+        known = common_prefix(dirs, self.last_dirs)
+        self.directories += len(dirs) - known
+        self.files += 1
+        self.size += file_node.size
+        for totals, key in [
+            (self.extensions, file_node.extension),
+            (self.top_directories, top_directory(file_node.path)),
+        ]:
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += 1
+            entry[1] += file_node.size
+        self.histogram[bisect_right(SIZE_BUCKETS, file_node.size)] += 1
+
+        item = (file_node.size, file_node.path)
+        if len(self.largest_heap) < self.largest:
+            heapq.heappush(self.largest_heap, item)
+        elif self.largest and item > self.largest_heap[0]:
+            heapq.heapreplace(self.largest_heap, item)
+
+        if self.max_size:
+            self.project(file_node, dirs, known)
+        self.last_dirs = dirs
+
+    def project(self, file_node: Node, dirs: List[str], known: int):
+        """
+        Adds a file to the projected chunks, filled greedily in rendering
+        order with the same costs as ``NodeTreeSplitter``, so the projection
+        matches a split by size with the same navigation.
+        """
+        # The files of a directory are rendered one after the other, so the
+        # files of the chunk in this file's directory are those just added.
+        index = self.dir_files if dirs == self.last_dirs else 0
+        cost = self.file_cost(file_node, dirs, known)
+        cost += self.link_cost(file_node, index)
+        cost += self.reference_cost(file_node, self.chunks - 1)
+        if not self.chunks or self.chunk_size + cost > self.max_size:
+            self.chunks += 1
+            self.chunk_size = 0
+            self.last_anchor = None
+            index = 0
+            cost = self.file_cost(file_node, dirs, 0)
+            cost += self.reference_cost(file_node, self.chunks - 1)
+            if cost > self.max_size:
+                self.oversized += 1
+        self.chunk_size += cost
+        self.dir_files = index + 1
+        self.last_anchor = emit.file_anchor(file_node)
+        if file_node.path in self.originals:
+            self.original_chunks.setdefault(file_node.path, self.chunks - 1)
+
+    def reference_cost(self, file_node: Node, chunk_index: int) -> int:
+        """
+        Returns what a duplicate's reference gains by linking to the chunk
+        of its original, when that is not the chunk at chunk_index.
+        """
+        if not file_node.duplicate_of:
+            return 0
+        original_chunk = self.original_chunks.get(file_node.duplicate_of)
+        if original_chunk is None or original_chunk == chunk_index:
+            return 0
+        return emit.reference_growth(file_node.duplicate_of, original_chunk)
+
+    def link_cost(self, file_node: Node, index: int) -> int:
+        """Returns the bytes the PREV/NEXT links grow by with a file added."""
+        if self.nav == emit.Navigation.GLOBAL:
+            if self.last_anchor is None:
+                return 0
+            return emit.link_growth(
+                self.last_anchor, emit.file_anchor(file_node)
+            )
+        return emit.directory_link_size(index)
+
+    def file_cost(self, file_node: Node, dirs: List[str], known: int) -> int:
+        """
+        Returns the bytes a file adds to a chunk that already has the TOC
+        entries of its first known directories.
+        """
+        cost = self.size_func(file_node) + len(emit.TOC_INDENT) * (
+            len(dirs) + 1
+        )
+        for depth in range(known, len(dirs)):
+            dir_node = Node(path=dirs[depth], type=NodeType.DIR)
+            cost += len(emit.toc_dir_entry(dir_node, depth + 1))
+        return cost
+
+    def largest_files(self) -> List[Tuple[int, str]]:
+        """Returns ``(size, path)`` of the largest files, largest first."""
+        return sorted(self.largest_heap, reverse=True)
+
+    def add_tree(self, root_node: Node):
+        """Adds the files of a tree that is already built."""
+        self.originals.update(
+            file_node.duplicate_of
+            for file_node in root_node.iter_files()
+            if file_node.duplicate_of
+        )
+        for file_node in root_node.iter_files():
+            self.add_file(file_node)
+
+
+def top_directory(path: str) -> str:
+    head, separator, _ = path.partition(os.sep)
+    return head if separator else "."
+
+
+def common_prefix(left: List[str], right: List[str]) -> int:
+    length = 0
+    while (
+        length < min(len(left), len(right)) and left[length] == right[length]
+    ):
+        length += 1
+    return length
+
+
+def parent_directories(path: str) -> List[str]:
+    """Returns the directories leading to a path, outermost first."""
+    dirs = []
+    dirpath = os.path.dirname(path)
+    while dirpath:
+        dirs.append(dirpath)
+        dirpath = os.path.dirname(dirpath)
+    dirs.reverse()
+    return dirs
+
+
+def gather_stats(
+    collector: Collector,
+    largest: int = 0,
+    max_size: int = 0,
+    nav: emit.Navigation = emit.Navigation.DIRECTORY,
+) -> RepoStats:
+    """
+    Scans a repository with a collector and returns its statistics, without
+    building the node tree.
+
+    Listings are consumed as the collector walks the repository, so memory
+    holds the statistics and the directories still to visit. Collectors that
+    list the whole repository up front, such as ``GitCollector``,
+    ``ArchiveCollector`` and ``AsyncCollector``, hold every listing until
+    the walk is done.
+
+    Args:
+        collector (Collector): Scans the repository.
+        largest (int): Number of largest files to keep.
+        max_size (int): Max size of a chunk in bytes, or 0 not to project
+            the number of chunks.
+        nav (emit.Navigation): What the PREV/NEXT links point to.
+
+    Returns:
+        RepoStats: The statistics of the collected files.
+    """
+    stats = RepoStats(largest, max_size, nav)
+    for listing in collector.iter_listings():
+        for file_entry in listing.files:
+            file_node = collector.file_node(file_entry, None)
+            if file_node is not None:
+                stats.add_file(file_node)
+    return stats
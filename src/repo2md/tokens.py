@@ -0,0 +1,178 @@
+import codecs
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
+
+from repo2md import Node, emit, logger
+from repo2md.render import CHUNK_SIZE
+from repo2md.sources import Source, open_source
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - optional dependency
+    tiktoken = None
+
+
+class TokenEstimator:
+    """
+    Counts the tokens of Markdown output offline.
+
+    Attributes:
+        name (str): Identifies the estimator, e.g. in cache settings.
+        reads_content (bool): Whether counting a file requires reading its
+            body; estimators that do not read work from sizes alone.
+    """
+
+    name = "estimator"
+    reads_content = False
+
+    def count(self, data: bytes) -> int:
+        raise NotImplementedError
+
+    def count_size(self, size: int) -> int:
+        """Estimates the tokens of size bytes of content that is not read."""
+        raise NotImplementedError
+
+
+class ByteEstimator(TokenEstimator):
+    """
+    Estimates tokens as one per bytes_per_token bytes, rounded up, which is
+    close for source code with BPE tokenizers and never reads a file.
+    """
+
+    reads_content = False
+
+    def __init__(self, bytes_per_token: float = 4.0):
+        self.bytes_per_token = bytes_per_token
+        self.name = f"bytes/{bytes_per_token:g}"
+
+    def count(self, data: bytes) -> int:
+        return self.count_size(len(data))
+
+    def count_size(self, size: int) -> int:
+        return math.ceil(size / self.bytes_per_token)
+
+
+class TiktokenEstimator(TokenEstimator):
+    """Counts tokens exactly with a tiktoken encoding."""
+
+    reads_content = True
+
+    def __init__(self, encoding_name: str = "cl100k_base"):
+        if tiktoken is None:
+            raise ValueError("The tiktoken tokenizer is not installed.")
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken/{encoding_name}"
+
+    def count(self, data: bytes) -> int:
+        text = data.decode("utf-8", "replace")
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_size(self, size: int) -> int:
+        raise ValueError("tiktoken needs the content to count tokens.")
+
+
+ESTIMATORS = {
+    "bytes": ByteEstimator,
+    "tiktoken": TiktokenEstimator,
+}
+
+
+def get_estimator(name: str) -> TokenEstimator:
+    """Returns the estimator registered under name."""
+    try:
+        return ESTIMATORS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown tokenizer: {name}") from None
+
+
+class TokenCounter:
+    """
+    Counts the tokens of each file's section in the Markdown output, for
+    use as the splitter's size_func with ``estimator.count`` as its
+    measure.
+
+    Counts are memoized by path, and ``count_files`` fills the memo for
+    many files at once using a pool of threads. Bodies are read in
+    CHUNK_SIZE blocks, and each block is counted separately, so a token
+    spanning two blocks may be counted twice.
+
+    Attributes:
+        estimator (TokenEstimator): The estimator used for counting.
+        source (Source): What the node paths are relative to.
+        counts (Dict[str, int]): Token counts computed so far, by path.
+    """
+
+    def __init__(self, estimator: TokenEstimator, source: Source = "."):
+        self.estimator = estimator
+        self.source = source
+        self.counts: Dict[str, int] = {}
+
+    def markup_tokens(self, node: Node) -> int:
+        return self.estimator.count(
+            emit.toc_file_entry(node, 0)
+            + emit.file_header(node)
+            + emit.navigation_links(None, None)
+            + emit.part_links(node)
+            + emit.fence_open(node)
+            + emit.fence_close(node)
+        )
+
+    def body_tokens(self, node: Node) -> int:
+        if node.duplicate_of:
+            return self.estimator.count(
+                emit.duplicate_reference(
+                    node.duplicate_of, node.duplicate_chunk
+                )
+            )
+        if emit.is_summarized(node):
+            return self.estimator.count(emit.summary(node))
+
+        tokens = 0
+        limit = node.size
+        if emit.is_truncated(node):
+            limit = node.body_limit
+            tokens += self.estimator.count(emit.truncation_note(node))
+        if not self.estimator.reads_content:
+            return tokens + self.estimator.count_size(limit)
+
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        try:
+            with open_source(self.source, node.path) as file:
+                while limit > 0:
+                    block = file.read(min(limit, CHUNK_SIZE))
+                    if not block:
+                        break
+                    limit -= len(block)
+                    text = decoder.decode(block, final=limit <= 0)
+                    tokens += self.estimator.count(text.encode())
+        except OSError as e:
+            logger.warning(f"Estimating tokens of {node.path}: {e}")
+            tokens += ByteEstimator().count_size(limit)
+        return tokens
+
+    def section_tokens(self, node: Node, indent_level: int = 0) -> int:
+        """Returns the tokens of a file's TOC entry and section."""
+        tokens = self.counts.get(node.path)
+        if tokens is None:
+            tokens = self.markup_tokens(node) + self.body_tokens(node)
+            self.counts[node.path] = tokens
+        if indent_level:
+            tokens += self.estimator.count(emit.TOC_INDENT * indent_level)
+        return tokens
+
+    def count_files(self, file_nodes: Iterable[Node], workers: int = 0):
+        """
+        Counts the tokens of many files ahead of splitting. Files are only
+        read when the estimator needs their content, and then by a pool of
+        workers threads.
+        """
+        file_nodes = list(file_nodes)
+        if not self.estimator.reads_content or workers <= 1:
+            for file_node in file_nodes:
+                self.section_tokens(file_node)
+            return
+
+        logger.debug("Counting tokens of %d files", len(file_nodes))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(self.section_tokens, file_nodes))
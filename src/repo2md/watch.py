@@ -0,0 +1,453 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+from repo2md import Collector, Node, logger
+from repo2md.collect import DirListing
+
+# Seconds between polls, and how long the tree must stay quiet after a
+# change before the changes are applied.
+DEFAULT_INTERVAL = 0.5
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def count_files(node: Optional[Node]) -> int:
+    return sum(1 for _ in node.iter_files()) if node is not None else 0
+
+
+def file_signature(node: Node) -> Tuple:
+    return node.size, node.mtime_ns, node.inode, node.content_class
+
+
+class Inotify:
+    """
+    The Linux inotify API, called through ctypes, reporting which watched
+    directories had entries created, deleted, moved or written to.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths: Dict[int, str] = {}
+        self.descriptors: Dict[str, int] = {}
+
+    @classmethod
+    def create(cls) -> Optional["Inotify"]:
+        """Returns an Inotify, or None where inotify is not available."""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            return cls()
+        except (AttributeError, OSError) as e:
+            logger.debug("inotify is not available: %s", e)
+            return None
+
+    def add(self, dirpath: str):
+        """
+        Watches a directory.
+
+        Raises:
+            OSError: If the directory cannot be watched, for example because
+                the limit of watches per user is reached.
+        """
+        descriptor = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(dirpath), WATCH_MASK
+        )
+        if descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), dirpath)
+        self.paths[descriptor] = dirpath
+        self.descriptors[dirpath] = descriptor
+
+    def remove(self, dirpath: str):
+        descriptor = self.descriptors.pop(dirpath, None)
+        if descriptor is not None:
+            self.paths.pop(descriptor, None)
+            self.libc.inotify_rm_watch(self.fd, descriptor)
+
+    def read(self, timeout: float) -> Set[str]:
+        """
+        Waits up to timeout seconds for events, and returns the directories
+        they happened in. A queue overflow returns every watched directory.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, _, length = EVENT_HEADER.unpack_from(
+                    data, offset
+                )
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(self.descriptors)
+                dirpath = self.paths.get(descriptor)
+                if dirpath is None:
+                    continue
+                changed.add(dirpath)
+                if mask & IN_IGNORED:
+                    self.paths.pop(descriptor)
+                    self.descriptors.pop(dirpath, None)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class TreeWatcher:
+    """
+    Builds the node tree of a Collector once and keeps it up to date with
+    the directory it was built from, for ``--watch``.
+
+    Changes are noticed with inotify where it is available, and otherwise
+    by polling the stat values of every collected file and directory; a
+    directory's mtime changes when entries are added, removed or renamed,
+    a file's when it is written to. Only the directories that changed are
+    scanned again. Their nodes are updated in place, unchanged file nodes
+    are kept, and the rolled-up sizes of their ancestors are adjusted by
+    the difference.
+
+    Ignore files are read once, when their directory is first scanned.
+
+    Attributes:
+        collector (Collector): Scans directories and creates file nodes.
+        interval (float): Seconds between polls, and how long the tree must
+            stay quiet before changes are applied.
+        root (Optional[Node]): The root of the tree, or None while no files
+            are collected.
+        listings (Dict[str, DirListing]): The last listing of every
+            non-ignored directory, including those without files.
+        signatures (Dict[str, Tuple[int, ...]]): The stat values polled,
+            by path: ``(mtime_ns,)`` for directories and ``(size, mtime_ns,
+            inode)`` for files.
+        nodes (Dict[str, Node]): The directory nodes of the tree, by path.
+    """
+
+    def __init__(
+        self,
+        collector: Collector,
+        interval: float = DEFAULT_INTERVAL,
+        use_inotify: bool = True,
+    ):
+        self.collector = collector
+        self.interval = interval
+        self.inotify = Inotify.create() if use_inotify else None
+        self.listings: Dict[str, DirListing] = {}
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+        self.nodes: Dict[str, Node] = {}
+        self.scan(collector.root_path)
+        self.root = collector.process_directory(
+            collector.root_path, self.listings
+        )
+        self.register(self.root)
+
+    def scan(self, dirpath: str):
+        """Scans a directory and every directory below it into listings."""
+        stack = [dirpath]
+        while stack:
+            path = stack.pop()
+            self.watch_directory(path)
+            listing = self.collector.scan_directory(path)
+            self.listings[path] = listing
+            self.record_signatures(listing)
+            stack.extend(listing.subdirs)
+
+    def watch_directory(self, dirpath: str):
+        """
+        Watches a directory for changes, and takes its stat values for
+        polling. Both happen before it is listed, so that no change made
+        while it is listed is missed.
+        """
+        if self.inotify is not None:
+            try:
+                self.inotify.add(dirpath)
+            except OSError as e:
+                logger.warning(f"Polling instead of using inotify: {e}")
+                self.inotify.close()
+                self.inotify = None
+        try:
+            self.signatures[dirpath] = (os.stat(dirpath).st_mtime_ns,)
+        except OSError:
+            self.signatures.pop(dirpath, None)
+
+    def record_signatures(self, listing: DirListing):
+        for file_entry in listing.files:
+            self.signatures[file_entry.path] = (
+                file_entry.size,
+                file_entry.mtime_ns,
+                file_entry.inode,
+            )
+
+    def forget(self, dirpath: str):
+        """Drops a directory that is gone or ignored, and those below it."""
+        stack = [dirpath]
+        while stack:
+            path = stack.pop()
+            self.signatures.pop(path, None)
+            if self.inotify is not None:
+                self.inotify.remove(path)
+            listing = self.listings.pop(path, None)
+            if listing is None:
+                continue
+            for file_entry in listing.files:
+                self.signatures.pop(file_entry.path, None)
+            stack.extend(listing.subdirs)
+
+    def register(self, node: Optional[Node]):
+        """Indexes the directory nodes of a subtree by path."""
+        stack = [node] if node is not None else []
+        while stack:
+            dir_node = stack.pop()
+            self.nodes[dir_node.path] = dir_node
+            stack.extend(dir_node.dir_children)
+
+    def unregister(self, node: Node):
+        stack = [node]
+        while stack:
+            dir_node = stack.pop()
+            if self.nodes.get(dir_node.path) is dir_node:
+                del self.nodes[dir_node.path]
+            stack.extend(dir_node.dir_children)
+
+    def poll(self) -> Set[str]:
+        """
+        Returns the directories whose stat values, or those of one of their
+        files, changed since the last poll.
+        """
+        changed = set()
+        for path, signature in list(self.signatures.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                current = None
+            else:
+                current = (
+                    (stat.st_mtime_ns,)
+                    if len(signature) == 1
+                    else (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                )
+            if current == signature:
+                continue
+            if current is None:
+                del self.signatures[path]
+            else:
+                self.signatures[path] = current
+            changed.add(path if len(signature) == 1 else os.path.dirname(path))
+        return changed
+
+    def changes(self, timeout: float) -> Set[str]:
+        """Waits up to timeout seconds for changed directories."""
+        if self.inotify is not None:
+            return self.inotify.read(timeout)
+        time.sleep(timeout)
+        return self.poll()
+
+    def wait(self) -> Set[str]:
+        """
+        Waits for changes, then until the tree stays quiet for an interval,
+        so a burst of edits is applied at once. Returns the directories
+        that changed.
+        """
+        changed = set()
+        while not changed:
+            changed = self.changes(self.interval)
+        while True:
+            more = self.changes(self.interval)
+            if not more:
+                return changed
+            changed |= more
+
+    def apply(self, changed: Set[str]) -> int:
+        """
+        Scans the changed directories again and updates the tree.
+
+        Args:
+            changed (Set[str]): Paths of directories that changed.
+
+        Returns:
+            int: The number of files added, removed or changed.
+        """
+        rescanned = []
+        for dirpath in sorted(changed, key=len):
+            if dirpath not in self.listings:
+                # Below a directory that was dropped, or never collected.
+                continue
+            if not os.path.isdir(dirpath):
+                # Its parent changed too, and drops it.
+                continue
+            self.watch_directory(dirpath)
+            listing = self.collector.scan_directory(dirpath)
+            previous = self.listings[dirpath]
+            self.listings[dirpath] = listing
+            for subdir_path in set(previous.subdirs) - set(listing.subdirs):
+                self.forget(subdir_path)
+            for subdir_path in set(listing.subdirs) - set(previous.subdirs):
+                self.scan(subdir_path)
+            self.record_signatures(listing)
+            rescanned.append(dirpath)
+
+        updated = 0
+        for dirpath in sorted(rescanned, key=len, reverse=True):
+            if dirpath in self.listings:
+                updated += self.refresh(dirpath)
+        return updated
+
+    def refresh(self, dirpath: str) -> int:
+        """
+        Updates the node of a directory from its listing and adjusts the
+        sizes of its ancestors. A directory without a node is given one by
+        refreshing its parent.
+
+        Returns:
+            int: The number of files added, removed or changed.
+        """
+        node = self.nodes.get(self.collector.relpath(dirpath))
+        if node is None:
+            if dirpath != self.collector.root_path:
+                return self.refresh(os.path.dirname(dirpath))
+            self.root = self.collector.process_directory(
+                dirpath, self.listings
+            )
+            self.register(self.root)
+            return count_files(self.root)
+
+        listing = self.listings[dirpath]
+        updated = self.refresh_files(node, listing)
+        updated += self.refresh_dirs(node, listing)
+        size = sum(child.size for child in node)
+        self.add_size(node, size - node.size)
+        self.prune(node)
+        return updated
+
+    def refresh_files(self, node: Node, listing: DirListing) -> int:
+        """
+        Replaces the file children of a node, keeping the nodes of files
+        whose stat values and content class did not change.
+        """
+        previous = {
+            file_node.path: file_node for file_node in node.file_children
+        }
+        file_children = []
+        updated = 0
+        for file_entry in listing.files:
+            file_node = previous.pop(
+                self.collector.relpath(file_entry.path), None
+            )
+            if file_node is None or file_signature(file_node) != (
+                file_entry.size,
+                file_entry.mtime_ns,
+                file_entry.inode,
+                file_entry.content_class,
+            ):
+                file_node = self.collector.file_node(file_entry, node)
+                updated += 1
+            if file_node is not None:
+                file_children.append(file_node)
+        node.file_children = file_children
+        node.file_count = len(file_children)
+        return updated + len(previous)
+
+    def refresh_dirs(self, node: Node, listing: DirListing) -> int:
+        """
+        Replaces the directory children of a node, building the subtrees of
+        new subdirectories from their listings.
+        """
+        previous = {dir_node.path: dir_node for dir_node in node.dir_children}
+        dir_children = []
+        updated = 0
+        for subdir_path in listing.subdirs:
+            subdir_node = previous.pop(
+                self.collector.relpath(subdir_path), None
+            )
+            if subdir_node is None:
+                subdir_node = self.collector.process_directory(
+                    subdir_path, self.listings
+                )
+                self.register(subdir_node)
+                updated += count_files(subdir_node)
+            if subdir_node is not None:
+                subdir_node.parent = node
+                dir_children.append(subdir_node)
+        for subdir_node in previous.values():
+            updated += count_files(subdir_node)
+            self.unregister(subdir_node)
+        node.dir_children = dir_children
+        node.dir_count = len(dir_children)
+        return updated
+
+    def add_size(self, node: Node, delta: int):
+        """Adds delta to the size of a node and of all its ancestors."""
+        while node is not None:
+            node.size += delta
+            node = node.parent
+
+    def prune(self, node: Node):
+        """Removes a directory left without files, and emptied ancestors."""
+        while (
+            node.parent is not None
+            and node.file_count == 0
+            and node.dir_count == 0
+        ):
+            parent = node.parent
+            parent.dir_children.remove(node)
+            parent.dir_count -= 1
+            self.unregister(node)
+            node = parent
+
+    def updates(self) -> Iterator[int]:
+        """
+        Waits for changes and applies them to the tree, forever, yielding
+        the number of files that changed after every update of the tree.
+        """
+        while True:
+            updated = self.apply(self.wait())
+            if updated:
+                logger.debug("%d files changed", updated)
+                yield updated
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
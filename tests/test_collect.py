@@ -1,8 +1,26 @@
 import os
+import shutil
+import subprocess
 
-import pathspec
+import pytest
 
-from repo2md import Collector
+from repo2md import (
+    ArchiveCollector,
+    AsyncCollector,
+    Collector,
+    ContentClass,
+    ContentPolicy,
+    GitCollector,
+    NodeTreeSplitter,
+    RepoStats,
+    TreeWatcher,
+    dedup,
+    deduplicate,
+    emit,
+    gather_stats,
+    render_markdown,
+)
+from repo2md.ignore import IgnoreMatcher, IgnoreRules
 
 TEST_PATH = os.path.dirname(__file__)
 REPO_ROOT_PATH = os.path.dirname(TEST_PATH)
@@ -12,8 +30,8 @@ IGNORE_FILE_PATH = os.path.join(REPO_ROOT_PATH, ".repo2md_ignore")
 
 def test_read_ignore_file_exists():
     builder = Collector(REPO_ROOT_PATH)
-    patterns = builder.read_ignore_file()
-    assert isinstance(patterns, pathspec.PathSpec)
+    assert builder.matches_ignore_pattern("dist/", True)
+    assert builder.matches_ignore_pattern("src/repo2md/module.pyc")
 
 
 def test_read_ignore_file_not_exists():
@@ -51,7 +69,7 @@ def test_plan_valid_root():
     assert node is not None
     assert node.path == "."
     assert node.parent is None
-    assert node.dir_count == 2
+    assert node.dir_count == 3
     assert node.file_count == 7
 
     for child in node:
@@ -62,3 +80,460 @@ def test_plan_invalid_root():
     builder = Collector("/non_existing_path")
     node = builder.build_node_tree()
     assert node is None  # Invalid path should return None
+
+
+def assert_same_tree(left, right):
+    assert left.path == right.path
+    assert left.size == right.size
+    assert left.file_count == right.file_count
+    assert left.dir_count == right.dir_count
+    assert [f.path for f in left.file_children] == [
+        f.path for f in right.file_children
+    ]
+    assert [f.size for f in left.file_children] == [
+        f.size for f in right.file_children
+    ]
+    assert len(left.dir_children) == len(right.dir_children)
+    for left_child, right_child in zip(
+        left.dir_children, right.dir_children, strict=True
+    ):
+        assert right_child.parent == right
+        assert_same_tree(left_child, right_child)
+
+
+def test_build_node_tree_scan_workers():
+    serial = Collector(REPO_ROOT_PATH).build_node_tree()
+    parallel = Collector(REPO_ROOT_PATH, scan_workers=4).build_node_tree()
+    assert parallel.parent is None
+    assert_same_tree(serial, parallel)
+
+
+def test_build_node_tree_scan_workers_empty():
+    collector = Collector(EMPTY_DIR_PATH, scan_workers=4)
+    assert collector.build_node_tree() is None
+
+
+def test_build_node_tree_async_io():
+    serial = Collector(REPO_ROOT_PATH).build_node_tree()
+    collector = AsyncCollector(REPO_ROOT_PATH, concurrency=3)
+    assert_same_tree(serial, collector.build_node_tree())
+    assert_same_tree(serial, collector.build_compact_tree())
+    assert AsyncCollector(EMPTY_DIR_PATH).build_node_tree() is None
+
+
+@pytest.fixture
+def matcher():
+    matcher = IgnoreMatcher()
+    matcher.add_patterns(
+        "",
+        [
+            ".git/\n",
+            "# comment\n",
+            "*.log\n",
+            "!keep.log\n",
+            "node_modules/\n",
+            "Cargo.lock\n",
+            "/build\n",
+            "docs/*.tmp\n",
+        ],
+    )
+    return matcher
+
+
+def test_rules_buckets():
+    rules = IgnoreRules(["*.log", "target/", "Cargo.lock", "a/**/b", ""])
+    assert rules.extensions == {".log": 0}
+    assert rules.dir_names == {"target": 1}
+    assert rules.names == {"Cargo.lock": 2}
+    assert len(rules.regexes) == 1
+    assert len(rules) == 4
+
+
+@pytest.mark.parametrize(
+    "path, is_dir, expected",
+    [
+        ("debug.log", False, True),
+        ("src/deep/debug.log", False, True),
+        ("keep.log", False, False),
+        ("node_modules", True, True),
+        ("node_modules", False, False),
+        ("web/node_modules", True, True),
+        ("Cargo.lock", False, True),
+        ("build", True, True),
+        ("src/build", True, False),
+        ("docs/a.tmp", False, True),
+        ("docs/sub/a.tmp", False, False),
+        ("src/main.py", False, False),
+        (".git", True, True),
+    ],
+)
+def test_match_entry(matcher, path, is_dir, expected):
+    assert matcher.match_entry(path, is_dir) is expected
+
+
+def test_match_checks_parents(matcher):
+    assert matcher.match("node_modules/pkg/index.js")
+    assert not matcher.match_entry("node_modules/pkg/index.js")
+
+
+def file_paths(node):
+    for child in node:
+        if child.is_file:
+            yield child.path
+        else:
+            yield from file_paths(child)
+
+
+def test_nested_ignore_files(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\n")
+    sub = tmp_path / "sub"
+    (sub / "deeper").mkdir(parents=True)
+    (sub / ".gitignore").write_text("!keep.log\n*.dat\n")
+    for path in [
+        "a.log",
+        "a.dat",
+        "sub/a.log",
+        "sub/keep.log",
+        "sub/a.dat",
+        "sub/deeper/b.dat",
+        "sub/deeper/keep.log",
+        "sub/deeper/main.py",
+    ]:
+        (tmp_path / path).write_text("x")
+
+    node = Collector(str(tmp_path)).build_node_tree()
+    assert sorted(file_paths(node)) == sorted(
+        [
+            ".gitignore",
+            "a.dat",
+            os.path.join("sub", ".gitignore"),
+            os.path.join("sub", "keep.log"),
+            os.path.join("sub", "deeper", "keep.log"),
+            os.path.join("sub", "deeper", "main.py"),
+        ]
+    )
+
+
+def test_ignored_directories_are_not_descended(tmp_path, monkeypatch):
+    (tmp_path / ".gitignore").write_text("node_modules/\n")
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    (tmp_path / "node_modules" / "pkg" / "index.js").write_text("x")
+    (tmp_path / "main.py").write_text("x")
+
+    collector = Collector(str(tmp_path))
+    scanned = []
+    scan_directory = collector.scan_directory
+
+    def recording_scan(dirpath):
+        scanned.append(os.path.relpath(dirpath, tmp_path))
+        return scan_directory(dirpath)
+
+    monkeypatch.setattr(collector, "scan_directory", recording_scan)
+    node = collector.build_node_tree()
+    assert scanned == ["."]
+    assert node.dir_count == 0
+    assert node.file_count == 2
+
+
+@pytest.mark.parametrize("use_inotify", [False, True])
+def test_tree_watcher_applies_changes(tmp_path, use_inotify):
+    (tmp_path / "keep" / "deep").mkdir(parents=True)
+    (tmp_path / "gone").mkdir()
+    (tmp_path / "empty").mkdir()
+    (tmp_path / "main.py").write_text("main")
+    (tmp_path / "keep" / "a.py").write_text("a")
+    (tmp_path / "keep" / "deep" / "b.py").write_text("b")
+    (tmp_path / "gone" / "c.py").write_text("c")
+
+    watcher = TreeWatcher(Collector(str(tmp_path)), 0.05, use_inotify)
+    kept = watcher.nodes[os.path.join("keep", "deep")].file_children[0]
+    try:
+        (tmp_path / "main.py").write_text("main, edited")
+        shutil.rmtree(tmp_path / "gone")
+        (tmp_path / "empty" / "new").mkdir()
+        (tmp_path / "empty" / "new" / "d.py").write_text("d")
+        (tmp_path / "keep" / "a.py").unlink()
+        assert watcher.apply(watcher.wait()) == 4
+    finally:
+        watcher.close()
+
+    assert_same_tree(Collector(str(tmp_path)).build_node_tree(), watcher.root)
+    assert watcher.nodes[os.path.join("keep", "deep")].file_children[0] is kept
+    assert "gone" not in watcher.nodes
+
+
+def test_gather_stats_matches_tree(tmp_path):
+    for index in range(40):
+        directory = tmp_path / f"d{index % 3}" / f"e{index % 2}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{index}.py").write_text("x = 1\n" * (index + 1))
+    (tmp_path / "root.md").write_text("# root\n")
+    (tmp_path / "empty").mkdir()
+
+    stats = gather_stats(Collector(str(tmp_path)), largest=3, max_size=1000)
+    node = Collector(str(tmp_path)).build_node_tree()
+    from_tree = RepoStats(3, 1000)
+    from_tree.add_tree(node)
+
+    files = list(node.iter_files())
+    assert stats.files == from_tree.files == len(files) == 41
+    assert stats.size == node.size
+    assert stats.directories == from_tree.directories == 9
+    assert stats.largest_files() == [
+        (file_node.size, file_node.path)
+        for file_node in sorted(files, key=lambda n: -n.size)[:3]
+    ]
+    assert stats.extensions == {".py": [40, node.size - 7], ".md": [1, 7]}
+    assert stats.top_directories["."] == [1, 7]
+    assert sum(stats.histogram) == 41
+    assert stats.oversized == 0
+    parallel = gather_stats(
+        Collector(str(tmp_path), scan_workers=2), largest=3, max_size=1000
+    )
+    assert parallel.largest_files() == stats.largest_files()
+    assert parallel.chunks == stats.chunks
+    serial = Collector(str(tmp_path)).iter_listings()
+    ahead = Collector(str(tmp_path), scan_workers=2).iter_listings()
+    assert list(ahead) == list(serial)
+    for nav in emit.Navigation:
+        for max_size in [400, 1000, 5000]:
+            projected = RepoStats(max_size=max_size, nav=nav)
+            projected.add_tree(node)
+            splitter = NodeTreeSplitter(node, max_size, 100, nav=nav)
+            assert projected.chunks == len(splitter.split())
+
+
+def test_build_compact_tree():
+    node = Collector(REPO_ROOT_PATH).build_node_tree()
+    compact = Collector(REPO_ROOT_PATH).build_compact_tree()
+    assert compact.parent is None
+    assert compact.is_dir
+    assert_same_tree(node, compact)
+    assert [f.path for f in compact.iter_files()] == [
+        f.path for f in node.iter_files()
+    ]
+
+    file_node = compact.file_children[0]
+    assert file_node.is_file
+    assert file_node.parent == compact
+    assert file_node.basename == node.file_children[0].basename
+    assert file_node.extension == node.file_children[0].extension
+    assert compact.to_node().size == node.size
+
+
+def test_build_compact_tree_empty():
+    assert Collector(EMPTY_DIR_PATH).build_compact_tree() is None
+    assert Collector("/non_existing_path").build_compact_tree() is None
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_deduplicate_hashes_only_size_collisions(
+    tmp_path, monkeypatch, compact
+):
+    license_text = "Permission is hereby granted, free of charge. " * 20
+    for name in ["a", "b", "c"]:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "LICENSE").write_text(license_text)
+    (tmp_path / "b" / "other.txt").write_text(license_text.upper())
+    (tmp_path / "c" / "unique.txt").write_text("only one of this size")
+
+    hashed = []
+    file_digest = dedup.file_digest
+
+    def recording_digest(path, source):
+        hashed.append(path)
+        return file_digest(path, source)
+
+    monkeypatch.setattr(dedup, "file_digest", recording_digest)
+    collector = Collector(str(tmp_path))
+    root = (
+        collector.build_compact_tree()
+        if compact
+        else collector.build_node_tree()
+    )
+    duplicates = deduplicate(root, str(tmp_path))
+
+    assert os.path.join("c", "unique.txt") not in hashed
+    assert len(hashed) == 4
+    licenses = [
+        node.path for node in root.iter_files() if node.basename == "LICENSE"
+    ]
+    assert [node.path for node in duplicates] == licenses[1:]
+    by_path = {node.path: node for node in root.iter_files()}
+    assert by_path[licenses[0]].duplicate_of is None
+    assert by_path[licenses[2]].duplicate_of == licenses[0]
+    assert by_path[os.path.join("b", "other.txt")].duplicate_of is None
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_collector_classifies_content(tmp_path, compact):
+    (tmp_path / "main.py").write_text("print('ok')\n")
+    (tmp_path / "café.txt").write_text("é" * 5000)
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")
+    (tmp_path / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+    (tmp_path / "data.json").write_text("[" + "1, " * 1000 + "1]\n")
+    (tmp_path / "huge.txt").write_text("x" * 20000)
+
+    collector = Collector(
+        str(tmp_path),
+        content_policies={
+            ContentClass.BINARY: ContentPolicy.SKIP,
+            ContentClass.HUGE: ContentPolicy.TRUNCATE,
+        },
+        huge_file_size=12000,
+    )
+    root = (
+        collector.build_compact_tree()
+        if compact
+        else collector.build_node_tree()
+    )
+
+    assert collector.class_counts == {
+        ContentClass.TEXT: 3,
+        ContentClass.BINARY: 2,
+        ContentClass.HUGE: 1,
+    }
+    by_path = {node.path: node for node in root.iter_files()}
+    assert sorted(by_path) == [
+        "café.txt",
+        "data.json",
+        "huge.txt",
+        "main.py",
+    ]
+    assert by_path["café.txt"].body_limit is None
+    assert by_path["huge.txt"].content_class == ContentClass.HUGE
+    assert by_path["huge.txt"].body_limit == 12000
+    assert emit.body_size(by_path["huge.txt"]) < 12100
+
+
+def test_collector_summarizes_binary_files(tmp_path):
+    (tmp_path / "blob.bin").write_bytes(b"\0" * 100)
+    collector = Collector(
+        str(tmp_path),
+        content_policies={ContentClass.BINARY: ContentPolicy.SUMMARIZE},
+    )
+    (blob,) = collector.build_node_tree().iter_files()
+    assert blob.content_class == ContentClass.BINARY
+    assert emit.summary(blob) == b"_binary file of 100 bytes, not rendered_"
+    assert emit.fence_open(blob) == b""
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_truncation_keeps_valid_utf8_and_summarizes_binary(tmp_path, compact):
+    (tmp_path / "accents.txt").write_text("é" * 50000)
+    (tmp_path / "blob.bin").write_bytes(bytes(range(256)) * 40)
+    collector = Collector(
+        str(tmp_path),
+        content_policies={
+            ContentClass.BINARY: ContentPolicy.TRUNCATE,
+            ContentClass.HUGE: ContentPolicy.TRUNCATE,
+        },
+        huge_file_size=30001,
+    )
+    root = (
+        collector.build_compact_tree()
+        if compact
+        else collector.build_node_tree()
+    )
+    by_path = {node.path: node for node in root.iter_files()}
+
+    accents = by_path["accents.txt"]
+    assert accents.content_class == ContentClass.HUGE
+    assert accents.body_limit == 30000
+    blob = by_path["blob.bin"]
+    assert blob.content_class == ContentClass.BINARY
+    assert emit.is_summarized(blob)
+
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    (chunk,) = NodeTreeSplitter(root, 100000, 1).split()
+    path = render_markdown(chunk, str(output_dir), 0, str(tmp_path))
+    content = open(path, "rb").read()
+    content.decode("utf-8")
+    assert "é" * 15000 + "\n[... 70000 more bytes" in content.decode()
+    assert b"_binary file of 10240 bytes, not rendered_" in content
+
+
+def git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_git_collector_reads_tracked_files(tmp_path):
+    (tmp_path / "src" / "deep").mkdir(parents=True)
+    (tmp_path / "src" / "a.py").write_text("a = 1\n")
+    (tmp_path / "src" / "deep" / "b.py").write_text("b = 2\n")
+    (tmp_path / "blob.bin").write_bytes(b"\0" * 100)
+    (tmp_path / "README.md").write_text("# Readme\n")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "first")
+    (tmp_path / "README.md").write_text("# Readme, staged\n")
+    git(tmp_path, "add", "README.md")
+    (tmp_path / "src" / "a.py").write_text("a = 'not staged'\n")
+    (tmp_path / "untracked.py").write_text("u = 3\n")
+
+    def sizes(collector):
+        root = collector.build_node_tree()
+        assert root.size == sum(node.size for node in root.iter_files())
+        return {node.path: node.size for node in root.iter_files()}
+
+    policies = {ContentClass.BINARY: ContentPolicy.SKIP}
+    committed = {
+        "README.md": 9,
+        os.path.join("src", "a.py"): 6,
+        os.path.join("src", "deep", "b.py"): 6,
+    }
+    head = GitCollector(str(tmp_path), "HEAD", policies)
+    assert sizes(head) == committed
+    assert head.class_counts[ContentClass.BINARY] == 1
+    index = GitCollector(str(tmp_path), None, policies)
+    assert sizes(index) == {**committed, "README.md": 17}
+    assert sizes(GitCollector(str(tmp_path / "src"), "HEAD")) == {
+        "a.py": 6,
+        os.path.join("deep", "b.py"): 6,
+    }
+
+
+@pytest.mark.parametrize("archive_format", ["zip", "gztar"])
+def test_archive_collector_matches_directory(tmp_path, archive_format):
+    repo = tmp_path / "repo"
+    (repo / "sub" / "deeper").mkdir(parents=True)
+    (repo / "node_modules" / "pkg").mkdir(parents=True)
+    (repo / ".gitignore").write_text("*.log\nnode_modules/\n")
+    (repo / "sub" / ".gitignore").write_text("*.py\n")
+    (repo / "sub" / ".repo2md_ignore").write_text("!keep.log\n*.dat\n")
+    for path in [
+        "a.log",
+        "a.dat",
+        "node_modules/pkg/index.js",
+        "sub/a.log",
+        "sub/keep.log",
+        "sub/a.dat",
+        "sub/deeper/b.dat",
+        "sub/deeper/main.py",
+    ]:
+        (repo / path).write_text(path * 3)
+    (repo / "blob.bin").write_bytes(b"\0" * 100)
+    archive = shutil.make_archive(
+        str(tmp_path / "repo"), archive_format, str(repo)
+    )
+
+    def files(collector):
+        root = collector.build_node_tree()
+        assert root.path == "."
+        assert root.size == sum(node.size for node in root.iter_files())
+        return sorted(
+            (node.path, node.size, node.content_class)
+            for node in root.iter_files()
+        )
+
+    policies = {ContentClass.BINARY: ContentPolicy.SUMMARIZE}
+    expected = files(Collector(str(repo), content_policies=policies))
+    assert (os.path.join("sub", "keep.log"), 36, ContentClass.TEXT) in expected
+    assert ("blob.bin", 100, ContentClass.BINARY) in expected
+    assert files(ArchiveCollector(archive, policies)) == expected
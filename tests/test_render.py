@@ -1,10 +1,41 @@
+import asyncio
+import gzip
+import json
+import lzma
 import tempfile
 import os
+import re
+import shutil
+import subprocess
+import sys
+import tarfile
+import zipfile
+
+import pytest
 
 from repo2md import (
+    ArchiveCollector,
+    BuildCache,
     Collector,
+    Node,
+    NodeTreeSplitter,
+    NodeType,
+    Profiler,
+    RenderException,
+    iter_chunks,
+    read_plan,
+    ContentClass,
+    ContentPolicy,
+    GitCollector,
+    deduplicate,
+    render_chunks,
+    render_chunks_async,
     render_markdown,
 )
+from repo2md import profiling
+from repo2md.emit import Navigation
+from repo2md.sources import NewlineSource
+from repo2md.render import render_toc
 
 REPO_ROOT_PATH = os.path.dirname(os.path.dirname(__file__))
 
@@ -23,3 +54,611 @@ def test_build_assign_and_render():
         assert os.path.isfile(md_path)
 
         md_output = open(md_path, "r").read()
+
+
+def test_render_streams_from_source(tmp_path, monkeypatch):
+    from repo2md import render
+
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    body = "".join(f"line {i}\n" for i in range(1000))
+    (repo / "big.py").write_text(body)
+    (repo / "notes.md").write_text("# Notes\n")
+
+    monkeypatch.setattr(render, "CHUNK_SIZE", 7)
+    monkeypatch.chdir(tmp_path)
+    node = Collector(str(repo)).build_node_tree()
+    md_path = render_markdown(node, str(tmp_path), 0, str(repo))
+
+    md_output = open(md_path, "r").read()
+    assert f"```python\n{body}\n```" in md_output
+    assert "# Notes\n" in md_output
+    assert "```markdown" not in md_output
+
+
+def build_chunks(repo, output_dir, cache):
+    node = Collector(str(repo)).build_node_tree()
+    nodes = NodeTreeSplitter(node, 150, 10, cache.byte_size).split()
+    for index, chunk in enumerate(nodes):
+        reused = cache.chunk_is_fresh(index, chunk)
+        if not reused:
+            render_markdown(chunk, str(output_dir), index, str(repo))
+        cache.record_chunk(index, chunk, reused)
+    cache.remove_stale_outputs(len(nodes))
+    cache.save()
+    return nodes
+
+
+def test_build_cache_reuses_unchanged_chunks(tmp_path):
+    repo = tmp_path / "repo"
+    output_dir = tmp_path / "out"
+    for name in ["a", "b", "c"]:
+        (repo / name).mkdir(parents=True)
+        (repo / name / "main.py").write_text(f"print('{name}')\n")
+    output_dir.mkdir()
+
+    cache = BuildCache(str(output_dir))
+    nodes = build_chunks(repo, output_dir, cache)
+    assert len(nodes) == 3
+    assert (cache.file_hits, cache.file_misses) == (0, 3)
+    assert (cache.chunk_hits, cache.chunk_misses) == (0, 3)
+
+    outputs = {
+        name: (output_dir / name).read_bytes()
+        for name in os.listdir(output_dir)
+        if name.endswith(".md")
+    }
+    (repo / "b" / "main.py").write_text("print('B')\n")
+
+    cache = BuildCache(str(output_dir))
+    build_chunks(repo, output_dir, cache)
+    assert (cache.file_hits, cache.file_misses) == (2, 1)
+    assert (cache.chunk_hits, cache.chunk_misses) == (2, 1)
+    unchanged = [
+        name
+        for name, content in outputs.items()
+        if (output_dir / name).read_bytes() == content
+    ]
+    assert len(unchanged) == 2
+
+    (repo / "c" / "main.py").unlink()
+    cache = BuildCache(str(output_dir))
+    assert len(build_chunks(repo, output_dir, cache)) == 2
+    assert sorted(os.listdir(output_dir)) == [
+        ".cache",
+        "output_0.md",
+        "output_1.md",
+    ]
+
+
+def make_chunk_repo(repo):
+    for name in ["a", "b", "c", "d"]:
+        (repo / name).mkdir(parents=True)
+        for index in range(3):
+            (repo / name / f"f{index}.py").write_text(f"{name} = {index}\n")
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_render_chunks_in_processes_matches_serial(tmp_path, compact):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    collector = Collector(str(repo))
+    node = (
+        collector.build_compact_tree()
+        if compact
+        else collector.build_node_tree()
+    )
+    nodes = NodeTreeSplitter(node, 400, 10).split()
+    assert len(nodes) > 2
+
+    outputs = {}
+    for jobs in [1, 3]:
+        output_dir = tmp_path / f"out-{jobs}"
+        output_dir.mkdir()
+        paths = render_chunks(
+            enumerate(nodes), str(output_dir), str(repo), jobs
+        )
+        assert [os.path.basename(path) for path in paths] == [
+            f"output_{index}.md" for index in range(len(nodes))
+        ]
+        outputs[jobs] = [open(path, "rb").read() for path in paths]
+    assert outputs[1] == outputs[3]
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_render_chunks_reports_failing_path(tmp_path, jobs):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    nodes = NodeTreeSplitter(
+        Collector(str(repo)).build_node_tree(), 400, 10
+    ).split()
+    (repo / "c" / "f1.py").unlink()
+
+    with pytest.raises(RenderException) as excinfo:
+        render_chunks(enumerate(nodes), str(tmp_path), str(repo), jobs)
+    assert excinfo.value.path == os.path.join("c", "f1.py")
+
+
+def test_render_toc_sorts_entries_and_handles_deep_trees():
+    root = Node(path=".")
+    src = root.add_child(Node(path="src"))
+    src.add_child(Node(path=os.path.join("src", "b.py"), type=NodeType.FILE))
+    src.add_child(Node(path=os.path.join("src", "a"), type=NodeType.DIR))
+    root.add_child(Node(path="README.md", type=NodeType.FILE))
+    assert render_toc(root) == (
+        b"    * [README.md](#README-md)\n"
+        b"    * src\n"
+        b"        * a\n"
+        b"        * [b.py](#src-b-py)\n"
+    )
+
+    node = root
+    for _ in range(1500):
+        node = node.add_child(Node(path=os.path.join(node.path, "d")))
+    toc = render_toc(root)
+    assert toc.count(b"* d\n") == 1500
+
+
+def test_global_navigation_links_resolve(tmp_path):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    node = Collector(str(repo)).build_node_tree()
+    md_path = render_markdown(
+        node, str(tmp_path), 0, str(repo), Navigation.GLOBAL
+    )
+    md_output = open(md_path, "r").read()
+
+    anchors = re.findall(r"^## .* \{#(.*)\}$", md_output, re.MULTILINE)
+    assert len(anchors) == 12
+    prev_links = re.findall(r"\[PREV\]\(#(.*?)\)", md_output)
+    next_links = re.findall(r"\[NEXT\]\(#(.*?)\)", md_output)
+    assert prev_links == anchors[:-1]
+    assert next_links == anchors[1:]
+
+
+def test_iter_chunks_streams_without_writing(tmp_path, monkeypatch):
+    from repo2md import render
+
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    (repo / "a" / "notes.md").write_text("# Notes\n\ncafé\n" * 50)
+    monkeypatch.setattr(render, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(render, "MMAP_SIZE", 100)
+
+    chunks = list(iter_chunks(str(repo), 1500, 10, nav=Navigation.GLOBAL))
+    assert len(chunks) > 1
+    assert sorted(os.listdir(repo)) == ["a", "b", "c", "d"]
+
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    for chunk in chunks:
+        blocks = list(chunk.iter_bytes())
+        assert all(type(block) is bytes for block in blocks)
+        assert max(len(block) for block in blocks) <= 100
+        content = b"".join(blocks)
+        assert len(content) == chunk.size
+        assert "".join(chunk.iter_text()) == content.decode()
+        path = render_markdown(
+            chunk.node, str(output_dir), chunk.index, str(repo), chunk.nav
+        )
+        assert os.path.basename(path) == chunk.name
+        assert open(path, "rb").read() == content
+    assert sum(len(chunk.files) for chunk in chunks) == 13
+
+
+def test_render_chunks_async_matches_serial(tmp_path, monkeypatch):
+    from repo2md import aio, render
+
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    (repo / "a" / "notes.md").write_text("# Notes\n\ncafé\n" * 50)
+    (repo / "b" / "copy.md").write_text("# Notes\n\ncafé\n" * 50)
+    (repo / "c" / "blob.bin").write_bytes(bytes(range(256)) * 4)
+    (repo / "d" / "big.txt").write_text("line\n" * 200)
+    monkeypatch.setattr(render, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(aio, "CHUNK_SIZE", 16)
+    node = Collector(
+        str(repo),
+        content_policies={
+            ContentClass.BINARY: ContentPolicy.SUMMARIZE,
+            ContentClass.HUGE: ContentPolicy.TRUNCATE,
+        },
+        huge_file_size=500,
+    ).build_node_tree()
+    assert deduplicate(node, str(repo))
+    nodes = NodeTreeSplitter(node, 1500, 10, nav=Navigation.GLOBAL).split()
+    assert len(nodes) > 2
+
+    expected_dir = tmp_path / "sync"
+    expected_dir.mkdir()
+    expected = render_chunks(
+        enumerate(nodes), str(expected_dir), str(repo), nav=Navigation.GLOBAL
+    )
+    for concurrency in [1, 4]:
+        output_dir = tmp_path / f"async-{concurrency}"
+        output_dir.mkdir()
+        paths = asyncio.run(
+            render_chunks_async(
+                enumerate(nodes),
+                str(output_dir),
+                str(repo),
+                Navigation.GLOBAL,
+                concurrency,
+            )
+        )
+        assert [os.path.basename(path) for path in paths] == [
+            os.path.basename(path) for path in expected
+        ]
+        for path, expected_path in zip(paths, expected, strict=True):
+            assert open(path, "rb").read() == open(expected_path, "rb").read()
+
+
+def test_render_chunks_async_matches_serial_with_short_reads(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    # NewlineFile returns short reads once CRLF pairs are converted, and the
+    # files span several CHUNK_SIZE blocks.
+    (repo / "crlf.txt").write_bytes(
+        b"".join(b"line %d\r\n" % index for index in range(150000))
+    )
+    (repo / "mixed.txt").write_bytes(b"a\rb\r\nc\n" * 200000)
+    (repo / "small.txt").write_bytes(b"one\r\ntwo\r\n")
+    source = NewlineSource(str(repo))
+    node = Collector(str(repo)).build_node_tree()
+    nodes = NodeTreeSplitter(node, 8 * 1024 * 1024, 10).split()
+
+    expected_dir = tmp_path / "sync"
+    expected_dir.mkdir()
+    expected = render_chunks(enumerate(nodes), str(expected_dir), source)
+    output_dir = tmp_path / "async"
+    output_dir.mkdir()
+    paths = asyncio.run(
+        render_chunks_async(enumerate(nodes), str(output_dir), source)
+    )
+    for path, expected_path in zip(paths, expected, strict=True):
+        content = open(path, "rb").read()
+        assert content == open(expected_path, "rb").read()
+        assert b"\r" not in content
+        assert b"line 88307\n" in content
+
+
+def test_render_chunks_async_reports_failing_path(tmp_path):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    nodes = NodeTreeSplitter(
+        Collector(str(repo)).build_node_tree(), 400, 10
+    ).split()
+    (repo / "c" / "f1.py").unlink()
+
+    with pytest.raises(RenderException) as excinfo:
+        asyncio.run(
+            render_chunks_async(enumerate(nodes), str(tmp_path), str(repo))
+        )
+    assert excinfo.value.path == os.path.join("c", "f1.py")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_render_chunks_from_git_revision(tmp_path, jobs):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    (repo / "a" / "big.txt").write_text("line\n" * 100_000)
+    subprocess.run(
+        "git init -q && git add . && "
+        "git -c user.name=t -c user.email=t@t commit -q -m first",
+        shell=True,
+        cwd=repo,
+        check=True,
+    )
+    collector = GitCollector(str(repo), "HEAD")
+    nodes = NodeTreeSplitter(collector.build_node_tree(), 600_000, 10).split()
+    expected = [
+        open(path, "rb").read()
+        for path in render_chunks(enumerate(nodes), str(tmp_path), str(repo))
+    ]
+    for name in ["a", "b", "c", "d"]:
+        (repo / name / "f0.py").write_text("changed = True\n")
+    (repo / "b" / "f1.py").unlink()
+
+    output_dir = tmp_path / "git"
+    output_dir.mkdir()
+    paths = render_chunks(
+        enumerate(nodes), str(output_dir), collector.source, jobs
+    )
+    assert [open(path, "rb").read() for path in paths] == expected
+
+    next(nodes[0].iter_files()).path = "missing.py"
+    with pytest.raises(RenderException) as excinfo:
+        render_chunks(enumerate(nodes), str(output_dir), collector.source)
+    assert excinfo.value.path == "missing.py"
+    collector.source.close()
+
+
+def test_git_sources_are_closed(tmp_path):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    subprocess.run(
+        "git init -q && git add . && "
+        "git -c user.name=t -c user.email=t@t commit -q -m first",
+        shell=True,
+        cwd=repo,
+        check=True,
+    )
+    chunks = []
+    for chunk in iter_chunks(str(repo), 1500, 10, from_git="HEAD"):
+        b"".join(chunk.iter_bytes())
+        chunks.append(chunk)
+    assert chunks and chunks[0].source.idle == []
+
+    plan = str(tmp_path / "plan.json")
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO_ROOT_PATH, "src"))
+    for args in [
+        ["--from-git", "HEAD", "--write-plan", plan],
+        ["--from-git", "HEAD", "--no-cache"],
+        ["--plan", plan],
+    ]:
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-W",
+                "always::ResourceWarning",
+                "-c",
+                "from repo2md import cli; cli()",
+                str(repo),
+                *args,
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        assert "ResourceWarning" not in process.stderr
+
+
+@pytest.mark.parametrize("suffix", [".zip", ".tar.gz"])
+def test_render_chunks_from_archive(tmp_path, suffix):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    (repo / "README.md").write_text("# Readme\n" * 5)
+    # Root files after the subdirectories and subdirectories in reverse
+    # make the rendering order differ from the archive order.
+    names = sorted(
+        os.path.relpath(os.path.join(dirpath, name), repo)
+        for dirpath, _, filenames in os.walk(repo)
+        for name in filenames
+    )
+    names = names[1:][::-1] + names[:1]
+    archive = str(tmp_path / f"repo{suffix}")
+    if suffix == ".zip":
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            for name in names:
+                zip_file.write(repo / name, name)
+    else:
+        with tarfile.open(archive, "w:gz") as tar_file:
+            for name in names:
+                tar_file.add(repo / name, f"./{name}")
+
+    collector = ArchiveCollector(archive)
+    nodes = NodeTreeSplitter(collector.build_node_tree(), 400, 10).split()
+    assert len(nodes) > 2
+    expected_dir = tmp_path / "expected"
+    expected_dir.mkdir()
+    expected = render_chunks(enumerate(nodes), str(expected_dir), str(repo))
+    output_dir = tmp_path / "archive"
+    output_dir.mkdir()
+    paths = render_chunks(enumerate(nodes), str(output_dir), collector.source)
+    for path, expected_path in zip(paths, expected, strict=True):
+        assert open(path, "rb").read() == open(expected_path, "rb").read()
+    if suffix == ".tar.gz":
+        assert collector.source.passes == 1
+        assert not collector.source.read_ahead
+
+
+@pytest.mark.parametrize("method", ["gzip", "xz", "zstd"])
+def test_render_chunks_compressed(tmp_path, monkeypatch, method):
+    from repo2md import compress
+
+    if method == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        decompress = zstandard.ZstdDecompressor().decompressobj().decompress
+    else:
+        decompress = {"gzip": gzip.decompress, "xz": lzma.decompress}[method]
+    monkeypatch.setattr(compress, "BLOCK_SIZE", 64)
+
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    nodes = NodeTreeSplitter(
+        Collector(str(repo)).build_node_tree(), 400, 10
+    ).split()
+    expected = render_chunks(enumerate(nodes), str(tmp_path), str(repo))
+
+    outputs = []
+    for jobs in [1, 2]:
+        output_dir = tmp_path / f"{method}-{jobs}"
+        output_dir.mkdir()
+        paths = render_chunks(
+            enumerate(nodes), str(output_dir), str(repo), jobs, compress=method
+        )
+        outputs.append([open(path, "rb").read() for path in paths])
+        for path, expected_path in zip(paths, expected, strict=True):
+            assert path.endswith(".md" + compress.SUFFIXES[method])
+            content = open(expected_path, "rb").read()
+            assert decompress(open(path, "rb").read()) == content
+    assert outputs[0] == outputs[1]
+
+
+def test_parallel_gzip_writer_output_is_independent_of_threads(
+    tmp_path, monkeypatch
+):
+    from repo2md import compress
+
+    monkeypatch.setattr(compress, "BLOCK_SIZE", 1000)
+    data = os.urandom(20_000).hex().encode()
+    outputs = []
+    for threads in [1, 4]:
+        path = tmp_path / f"out-{threads}.gz"
+        with compress.open_output(str(path), "gzip", threads) as file:
+            for start in range(0, len(data), 777):
+                file.write(data[start : start + 777])
+        outputs.append(path.read_bytes())
+    assert outputs[0] == outputs[1]
+    assert gzip.decompress(outputs[0]) == data
+    assert outputs[0].count(b"\x1f\x8b\x08") >= 40
+
+    path = tmp_path / "empty.gz"
+    compress.open_output(str(path), "gzip").close()
+    assert gzip.decompress(path.read_bytes()) == b""
+
+
+def test_large_files_are_rendered_from_a_memory_map(tmp_path, monkeypatch):
+    from repo2md import render
+
+    monkeypatch.setattr(render, "MMAP_SIZE", 1000)
+    monkeypatch.setattr(render, "CHUNK_SIZE", 300)
+    (tmp_path / "big.txt").write_bytes(b"line\r\n" * 400)
+    (tmp_path / "small.txt").write_bytes(b"tiny\n")
+    root = Collector(
+        str(tmp_path),
+        content_policies={ContentClass.HUGE: ContentPolicy.TRUNCATE},
+        huge_file_size=1500,
+    ).build_node_tree()
+    by_name = {node.basename: node for node in root.iter_files()}
+
+    blocks = list(render.iter_file_content(by_name["big.txt"], str(tmp_path)))
+    body = blocks[1:-2]
+    assert all(isinstance(block, memoryview) for block in body)
+    assert [len(block) for block in body] == [300] * 5
+    assert b"".join(body) == (b"line\r\n" * 400)[:1500]
+    small = list(render.iter_file_content(by_name["small.txt"], str(tmp_path)))
+    assert small[1] == b"tiny\n"
+
+    mapped = render_markdown(root, str(tmp_path), 0, str(tmp_path))
+    mapped_output = open(mapped, "rb").read()
+    monkeypatch.setattr(render, "MMAP_SIZE", 10**9)
+    read = render_markdown(root, str(tmp_path), 1, str(tmp_path))
+    assert open(read, "rb").read() == mapped_output
+
+
+def test_newline_source_normalizes_split_line_endings(tmp_path, monkeypatch):
+    from repo2md import render
+
+    monkeypatch.setattr(render, "CHUNK_SIZE", 1)
+    content = b"a\r\nb\rc\r\n\r\n\rd\r"
+    (tmp_path / "crlf.txt").write_bytes(content)
+    (file_node,) = Collector(str(tmp_path)).build_node_tree().iter_files()
+    source = NewlineSource(str(tmp_path))
+    blocks = list(render.iter_file_content(file_node, source))
+    assert b"".join(blocks[1:-1]) == b"a\nb\nc\n\n\nd\n"
+    assert blocks[1:-1] and max(len(block) for block in blocks[1:-1]) == 1
+
+
+@pytest.mark.parametrize("async_io", [False, True])
+def test_profiler_times_stages_and_files(tmp_path, async_io):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    records = []
+    profiler = Profiler(hooks=[records.append])
+
+    with profiling.activate(profiler):
+        collector = Collector(str(repo), content_policies={}, huge_file_size=0)
+        with profiler.stage("scan") as stage:
+            node = collector.build_node_tree()
+            stage.size = node.size
+        nodes = NodeTreeSplitter(node, 400, 10).split()
+        with profiler.stage("render"):
+            if async_io:
+                asyncio.run(
+                    render_chunks_async(
+                        enumerate(nodes), str(output_dir), str(repo)
+                    )
+                )
+            else:
+                render_chunks(enumerate(nodes), str(output_dir), str(repo))
+    assert profiling.active() is None
+
+    paths = sorted(file_node.path for file_node in node.iter_files())
+    assert [record.name for record in profiler.stages] == ["scan", "render"]
+    assert profiler.stages[0].size == node.size
+    for category in ["classify", "render"]:
+        timed = [r.path for r in profiler.files if r.category == category]
+        assert sorted(timed) == paths
+    assert profiler.totals["ignore"][1] > 0
+    assert len(records) == len(profiler.stages) + len(profiler.files)
+
+    trace_path = tmp_path / "trace.json"
+    profiler.write_trace(str(trace_path))
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert {event["ph"] for event in events} == {"X"}
+    assert len(events) == len(records)
+    assert "Slowest files:" in profiler.report()
+
+
+def run_cli(*args):
+    env = dict(os.environ, PYTHONPATH=os.path.join(REPO_ROOT_PATH, "src"))
+    return subprocess.Popen(
+        [sys.executable, "-c", "from repo2md import cli; cli()", *args],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def read_outputs(output_dir):
+    return {
+        name: (output_dir / name).read_bytes()
+        for name in os.listdir(output_dir)
+        if name.startswith("output_")
+    }
+
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_plan_shards_combine_into_single_run(tmp_path, shards):
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    (repo / "a" / "f0.py").write_bytes(b"a = 0\r\n" * 40)
+    options = ["--max-size", "600", "--nav", "global", "--normalize-newlines"]
+    assert run_cli(str(repo), "--no-cache", *options).wait() == 0
+    output_dir = repo / "repo2md_output"
+    expected = read_outputs(output_dir)
+    assert len(expected) > shards
+    shutil.rmtree(output_dir)
+
+    plan_path = str(tmp_path / "plan.json")
+    assert run_cli(str(repo), "--write-plan", plan_path, *options).wait() == 0
+    assert not output_dir.exists()
+    plan = read_plan(plan_path)
+    partition = [plan.shard(index, shards) for index in range(shards)]
+    assert sorted(sum(partition, [])) == list(range(len(expected)))
+
+    workers = [
+        run_cli(str(repo), "--plan", plan_path, "--shard", f"{index}/{shards}")
+        for index in range(1, shards + 1)
+    ]
+    assert [worker.wait() for worker in workers] == [0] * shards
+    assert read_outputs(output_dir) == expected
+
+
+def test_switching_compression_removes_stale_outputs(tmp_path, monkeypatch):
+    from repo2md import compress
+
+    repo = tmp_path / "repo"
+    make_chunk_repo(repo)
+    output_dir = repo / "repo2md_output"
+    options = ["--max-size", "600"]
+    for cache in ["--cache", "--no-cache"]:
+        assert (
+            run_cli(str(repo), cache, "--compress", "gzip", *options).wait()
+            == 0
+        )
+        gzipped = sorted(read_outputs(output_dir))
+        assert len(gzipped) > 1
+        assert all(name.endswith(".md.gz") for name in gzipped)
+        assert run_cli(str(repo), cache, *options).wait() == 0
+        assert sorted(read_outputs(output_dir)) == [
+            name[: -len(".gz")] for name in gzipped
+        ]
+
+    monkeypatch.setattr(compress, "zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        compress.check_method("zstd")
+    compress.check_method("xz")
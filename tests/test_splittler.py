@@ -1,14 +1,25 @@
 import os
+import random
 
 import pytest
 
 from repo2md import (
+    ByteEstimator,
+    ContentClass,
+    ContentPolicy,
     Collector,
     Node,
     calculate_file_byte_size,
     NodeType,
     NodeTreeSplitter,
+    PackingNodeTreeSplitter,
+    TokenCounter,
+    TokenEstimator,
+    deduplicate,
+    render_markdown,
+    slugify,
 )
+from repo2md.emit import Navigation
 
 REPO_ROOT_PATH = os.path.dirname(os.path.dirname(__file__))
 
@@ -21,13 +32,13 @@ def mock_node():
 def test_calculate_byte_size_markdown(mock_node):
     mock_node.path = "/path/to/test.md"
     byte_size = calculate_file_byte_size(mock_node)
-    assert byte_size == 100 + 117
+    assert byte_size == 100 + 114
 
 
 def test_calculate_byte_size_non_markdown(mock_node):
     mock_node.path = "/path/to/test.py"
     byte_size = calculate_file_byte_size(mock_node)
-    assert byte_size == 100 + 117
+    assert byte_size == 100 + 128
 
 
 def test_calculate_byte_size_with_indentation(mock_node):
@@ -98,3 +109,312 @@ def test_build_assign_repo():
         child.file_children[0].path
         == node.dir_children[0].file_children[0].path
     )
+
+
+def test_split_compact_tree(tmp_path):
+    (tmp_path / "README.md").write_text("# Readme\n" * 20)
+    for index in range(12):
+        directory = tmp_path / f"d{index % 3}" / f"e{index % 2}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"f{index}.py").write_text("x = 1\n" * (index * 20 + 1))
+    node = Collector(str(tmp_path)).build_node_tree()
+    compact = Collector(str(tmp_path)).build_compact_tree()
+
+    expected = NodeTreeSplitter(node, 1500, 100).split()
+    output_nodes = NodeTreeSplitter(compact, 1500, 100).split()
+    assert len(expected) > 2
+    assert [
+        [f.path for f in output_node.iter_files()]
+        for output_node in output_nodes
+    ] == [
+        [f.path for f in output_node.iter_files()] for output_node in expected
+    ]
+    assert output_nodes[0].file_children[0].parent is output_nodes[0]
+
+
+def make_tree(layout):
+    root = Node(path=".")
+    for dir_name, sizes in layout:
+        dir_node = root.add_child(Node(path=dir_name))
+        for index, size in enumerate(sizes):
+            dir_node.add_child(
+                Node(
+                    path=f"{dir_name}/f{index}.txt",
+                    type=NodeType.FILE,
+                    size=size,
+                )
+            )
+    return root
+
+
+def chunk_paths(output_nodes):
+    return [
+        [file_node.path for file_node in output_node.iter_files()]
+        for output_node in output_nodes
+    ]
+
+
+def test_packing_uses_fewer_chunks():
+    tree = make_tree([("a", [200]), ("b", [350, 250]), ("c", [600])])
+    assert NodeTreeSplitter(tree, 1050, 2).split() is None
+
+    splitter = PackingNodeTreeSplitter(tree, 1050, 2)
+    output_nodes = splitter.split()
+    assert chunk_paths(output_nodes) == [
+        ["b/f0.txt", "b/f1.txt"],
+        ["a/f0.txt", "c/f0.txt"],
+    ]
+    assert [d.path for d in output_nodes[1].dir_children] == ["a", "c"]
+    assert output_nodes[1].dir_children[1].file_children[0].parent.path == "c"
+    assert splitter.chunk_sizes == [862, 1048]
+    assert splitter.fill_ratios() == [862 / 1050, 1048 / 1050]
+
+
+def test_packing_tops_off_chunks_with_runs():
+    tree = make_tree([("a", [150, 150]), ("b", [350, 250]), ("c", [600])])
+    splitter = PackingNodeTreeSplitter(tree, 1200, 2)
+    output_nodes = splitter.split()
+    assert chunk_paths(output_nodes) == [
+        ["a/f1.txt", "b/f0.txt", "b/f1.txt"],
+        ["a/f0.txt", "c/f0.txt"],
+    ]
+    assert splitter.chunk_sizes == [1136, 998]
+
+    assert PackingNodeTreeSplitter(tree, 1000, 2).split() is None
+    assert PackingNodeTreeSplitter(tree, 500, 10).split() is None
+
+
+def make_random_repo(path, seed):
+    rng = random.Random(seed)
+    names = ["main", "util", "README", "data", "café", "x"]
+    extensions = [".py", ".md", ".txt", "", ".rs"]
+    for dir_index in range(rng.randint(1, 6)):
+        parts = [f"d{dir_index}"] + [
+            rng.choice(["src", "lib", "ünï"]) for _ in range(rng.randint(0, 2))
+        ]
+        dir_path = path.joinpath(*parts)
+        dir_path.mkdir(parents=True, exist_ok=True)
+        for file_index in range(rng.choice([1, 2, 3, 12])):
+            name = f"{rng.choice(names)}{file_index}{rng.choice(extensions)}"
+            body = "".join(
+                rng.choice("abc\n é") for _ in range(rng.randint(0, 400))
+            )
+            (dir_path / name).write_text(body)
+    (path / "top.py").write_text("print('top')\n")
+    for index, copied in enumerate(rng.sample(sorted(path.rglob("*.*")), 2)):
+        (path / f"copy{index}{copied.suffix}").write_bytes(copied.read_bytes())
+    (path / "blob.bin").write_bytes(
+        bytes(rng.randrange(256) for _ in range(300))
+    )
+
+
+@pytest.mark.parametrize("seed", range(12))
+@pytest.mark.parametrize("dedup", [False, True])
+@pytest.mark.parametrize("nav", list(Navigation))
+@pytest.mark.parametrize(
+    "splitter_class", [NodeTreeSplitter, PackingNodeTreeSplitter]
+)
+def test_predicted_size_matches_rendered_size(
+    tmp_path, seed, dedup, nav, splitter_class
+):
+    repo = tmp_path / "repo"
+    output_dir = tmp_path / "out"
+    repo.mkdir()
+    output_dir.mkdir()
+    make_random_repo(repo, seed)
+
+    rng = random.Random(seed)
+    policies = {
+        ContentClass.BINARY: rng.choice(list(ContentPolicy)),
+        ContentClass.HUGE: rng.choice(list(ContentPolicy)),
+    }
+    node = Collector(str(repo), 0, policies, 300).build_node_tree()
+    if dedup:
+        deduplicate(node, str(repo))
+    max_size = rng.randint(1500, 6000)
+    splitter = splitter_class(
+        node, max_size, 1000, calculate_file_byte_size, nav
+    )
+    output_nodes = splitter.split()
+    assert output_nodes is not None
+
+    for index, output_node in enumerate(output_nodes):
+        path = render_markdown(
+            output_node, str(output_dir), index, str(repo), nav
+        )
+        assert os.path.getsize(path) == splitter.chunk_sizes[index]
+        assert splitter.chunk_sizes[index] <= max_size
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize(
+    "splitter_class", [NodeTreeSplitter, PackingNodeTreeSplitter]
+)
+def test_duplicates_link_to_original_in_other_chunk(
+    tmp_path, compact, splitter_class
+):
+    repo = tmp_path / "repo"
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    license_text = "Permission is hereby granted, free of charge. " * 10
+    for name in ["a", "b", "c"]:
+        (repo / name).mkdir(parents=True)
+        (repo / name / "LICENSE").write_text(license_text)
+        (repo / name / "filler.txt").write_text(name * 900)
+
+    collector = Collector(str(repo))
+    root = (
+        collector.build_compact_tree()
+        if compact
+        else collector.build_node_tree()
+    )
+    assert len(deduplicate(root, str(repo))) == 2
+    splitter = splitter_class(root, 1500, 10)
+    output_nodes = splitter.split()
+    assert output_nodes is not None
+
+    rendered = []
+    for index, output_node in enumerate(output_nodes):
+        path = render_markdown(output_node, str(output_dir), index, str(repo))
+        assert os.path.getsize(path) == splitter.chunk_sizes[index]
+        rendered.append(open(path, "rb").read())
+
+    references = 0
+    for index, output_node in enumerate(output_nodes):
+        for file_node in output_node.iter_files():
+            if not file_node.duplicate_of:
+                continue
+            anchor = slugify(file_node.duplicate_of)
+            chunk = file_node.duplicate_chunk
+            if chunk is None:
+                assert f"](#{anchor})".encode() in rendered[index]
+                assert f"{{#{anchor}}}".encode() in rendered[index]
+            else:
+                references += 1
+                assert chunk != index
+                link = f"](output_{chunk}.md#{anchor})".encode()
+                assert link in rendered[index]
+                assert f"{{#{anchor}}}".encode() in rendered[chunk]
+    assert references
+
+
+def make_large_files(path, seed):
+    rng = random.Random(seed)
+    (path / "pkg").mkdir()
+    (path / "pkg" / "small.txt").write_text("small\n")
+    (path / "pkg" / "module.py").write_text(
+        "".join(
+            f"@decorator\ndef function_{index}(value):\n"
+            + "    value += 1\n" * rng.randint(1, 40)
+            + "    return value\n\n"
+            for index in range(150)
+        )
+    )
+    (path / "notes.txt").write_text(
+        "".join(
+            "é" * rng.randint(0, 200) + "\n" * rng.randint(1, 2)
+            for _ in range(300)
+        )
+    )
+    (path / "minified.json").write_text("é" * 20000)
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("nav", list(Navigation))
+def test_large_files_split_into_parts(tmp_path, seed, nav):
+    repo = tmp_path / "repo"
+    output_dir = tmp_path / "out"
+    repo.mkdir()
+    output_dir.mkdir()
+    make_large_files(repo, seed)
+
+    node = Collector(str(repo)).build_node_tree()
+    max_size = random.Random(seed).randint(1500, 6000)
+    assert NodeTreeSplitter(node, max_size, 1000).split() is None
+    splitter = NodeTreeSplitter(
+        node,
+        max_size,
+        1000,
+        calculate_file_byte_size,
+        nav,
+        part_source=str(repo),
+    )
+    output_nodes = splitter.split()
+    assert output_nodes is not None
+
+    parts = {}
+    for index, output_node in enumerate(output_nodes):
+        path = render_markdown(
+            output_node, str(output_dir), index, str(repo), nav
+        )
+        assert os.path.getsize(path) == splitter.chunk_sizes[index]
+        assert splitter.chunk_sizes[index] <= max_size
+        for file_node in output_node.iter_files():
+            if file_node.part is not None:
+                assert file_node.part.first_chunk + file_node.part.index == (
+                    index + 1
+                )
+                parts.setdefault(file_node.path, []).append(file_node)
+
+    assert set(parts) == {"notes.txt", "minified.json", "pkg/module.py"}
+    for path, part_nodes in parts.items():
+        content = (repo / path).read_bytes()
+        bodies = [
+            content[part_node.part.offset :][: part_node.size]
+            for part_node in part_nodes
+        ]
+        assert b"".join(bodies) == content
+        assert len(bodies) == part_nodes[0].part.count
+        for body in bodies:
+            body.decode()
+            if path == "pkg/module.py":
+                assert body.startswith(b"@decorator\ndef function_")
+
+
+class WordEstimator(TokenEstimator):
+    """Counts whitespace separated words, reading every file."""
+
+    name = "words"
+    reads_content = True
+
+    def count(self, data):
+        return len(data.split())
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize(
+    "estimator", [ByteEstimator(), ByteEstimator(2.5), WordEstimator()]
+)
+@pytest.mark.parametrize(
+    "splitter_class", [NodeTreeSplitter, PackingNodeTreeSplitter]
+)
+def test_token_budget_bounds_rendered_tokens(
+    tmp_path, seed, estimator, splitter_class
+):
+    repo = tmp_path / "repo"
+    output_dir = tmp_path / "out"
+    repo.mkdir()
+    output_dir.mkdir()
+    make_random_repo(repo, seed)
+
+    node = Collector(str(repo)).build_node_tree()
+    counter = TokenCounter(estimator, str(repo))
+    counter.count_files(node.iter_files(), workers=4)
+    assert len(counter.counts) == len(list(node.iter_files()))
+
+    max_tokens = 600
+    splitter = splitter_class(
+        node,
+        max_tokens,
+        1000,
+        counter.section_tokens,
+        Navigation.DIRECTORY,
+        estimator.count,
+    )
+    output_nodes = splitter.split()
+    assert output_nodes is not None
+    for index, output_node in enumerate(output_nodes):
+        path = render_markdown(output_node, str(output_dir), index, str(repo))
+        with open(path, "rb") as file:
+            rendered_tokens = estimator.count(file.read())
+        assert rendered_tokens <= splitter.chunk_sizes[index] <= max_tokens